@@ -43,6 +43,9 @@ echo -n "Code quality (hdfs-cleaner) : "
 cd ${BASE}/hdfs-cleaner/src/main/resources
 check_pylint
 
+nosetests tests/*.py
+[[ $? -ne 0 ]] && exit -1
+
 cd ${BASE}
 
 mkdir -p pnda-build
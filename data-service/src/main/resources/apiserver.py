@@ -27,7 +27,10 @@ from tornado_json.routes import get_routes
 
 import config
 import dataservice
+from dataservice import DatasetRefresher
 from dataservice import HDBDataStore
+from dataservice.backends import LocalBackend
+from dataservice.api.dataservice import configure_executors
 from endpoint import Platform
 
 options.logging = None
@@ -78,15 +81,41 @@ def main():
     if err_msg:
         logging.error(err_msg)
 
-    platform = Platform.factory(options.hadoop_distro)
-    endpoints = platform.discover(options)
-    if not endpoints:
-        logging.error("Failed to discover API endpoints of cluster")
-
-    db_store = HDBDataStore(endpoints['HDFS'].geturl(), endpoints['HBASE'].geturl(),
+    if options.storage_backend == 'local':
+        backend = LocalBackend(options.data_repo, options.datasets_table,
+                               db_path=options.local_catalog_path,
+                               datasets=options.local_datasets,
+                               days=options.local_partition_days,
+                               hours=options.local_partition_hours,
+                               files=options.local_files_per_partition,
+                               latency=options.local_listing_latency)
+        hdfs_host, hbase_host = 'localhost', 'localhost'
+    else:
+        platform = Platform.factory(options.hadoop_distro)
+        endpoints = platform.discover(options)
+        if not endpoints:
+            logging.error("Failed to discover API endpoints of cluster")
+        backend = None
+        hdfs_host, hbase_host = endpoints['HDFS'].geturl(), endpoints['HBASE'].geturl()
+
+    db_store = HDBDataStore(hdfs_host, hbase_host,
                             options.thrift_port,
                             options.datasets_table,
-                            options.data_repo)
+                            options.data_repo,
+                            partition_ttl=options.partition_cache_ttl,
+                            partition_rebuild_period=options.partition_rebuild_period,
+                            hdfs_walk_workers=options.hdfs_walk_workers,
+                            hdfs_walk_max_requests=options.hdfs_walk_max_requests,
+                            hbase_scan_batch_size=options.hbase_scan_batch_size,
+                            hbase_change_detection=options.hbase_change_detection,
+                            hbase_rescan_period=options.hbase_rescan_period,
+                            hbase_pool_size=options.hbase_pool_size,
+                            hbase_write_batch_size=options.hbase_write_batch_size,
+                            backend=backend)
+    db_store.ensure_table()
+    # a handler thread waiting for a pooled HBase connection would only add queueing
+    configure_executors(hdfs_workers=options.hdfs_executor_workers,
+                        hbase_workers=min(options.hbase_executor_workers, options.hbase_pool_size))
     routes = get_routes(dataservice)
     logging.info("Service Routes %s", routes)
     settings = dict()
@@ -106,9 +135,8 @@ def main():
 
     signal.signal(signal.SIGTERM, sig_handler)
     signal.signal(signal.SIGINT, sig_handler)
-    # keep collecting dataset
-    tornado.ioloop.PeriodicCallback(db_store.collect, options.sync_period).start()
-    # db_conn2.collect()
+    # keep collecting dataset in background, off the IOLoop
+    DatasetRefresher(db_store, options.sync_period).start()
     tornado.ioloop.IOLoop.instance().start()
 
 
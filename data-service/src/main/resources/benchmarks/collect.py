@@ -0,0 +1,96 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Benchmark of HDBDataStore.collect and of its reconciliation step. merge times
+   merge_datasets over prebuilt lists, collect times a whole collection from a local backend,
+   table scan, repo listing, merge and catalog swap included.
+
+   Usage: python -m benchmarks.collect [size ...]
+"""
+
+from __future__ import print_function
+
+import logging
+import sys
+import timeit
+
+from dataservice import HDBDataStore
+from dataservice.backends import LocalBackend
+from dataservice.dbenum import DATASET
+from dataservice.dbenum import POLICY
+from dataservice.hdb import merge_datasets
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+REPEAT = 5
+
+
+def hdfs_datasets(size):
+    """
+    Datasets as discovered on HDFS, ids 0..size-1
+    """
+    return [{DATASET.ID: 'source%d' % i, DATASET.POLICY: POLICY.SIZE,
+             DATASET.PATH: '/user/PNDA/datasets/source=source%d' % i, DATASET.MODE: 'keep'}
+            for i in range(size)]
+
+
+def hbase_datasets(size):
+    """
+    Datasets tracked in HBase, overlapping with HDFS on three quarters of the ids and
+    carrying a quarter of untracked ids
+    """
+    return [{DATASET.ID: 'source%d' % i, DATASET.POLICY: POLICY.AGE, DATASET.MAX_AGE: 30,
+             DATASET.PATH: '/user/PNDA/datasets/source=source%d' % i, DATASET.MODE: 'archive'}
+            for i in range(size // 4, size + size // 4)]
+
+
+def bench_merge(size):
+    """
+    Time merge of hbase and hdfs dataset lists of given size
+    :return: best time in seconds
+    """
+    hdfs = hdfs_datasets(size)
+    hbase = hbase_datasets(size)
+    timer = timeit.Timer(lambda: merge_datasets(list(hbase), list(hdfs)))
+    return min(timer.repeat(repeat=REPEAT, number=1))
+
+
+def bench_collect(size):
+    """
+    Time collect of a local backend holding size datasets, all of them tracked in the table
+    :return: best time in seconds
+    """
+    backend = LocalBackend('/user/PNDA/datasets', 'platform_datasets', datasets=size,
+                           days=1, hours=1)
+    # bypass the singleton so the store is built with the local backend
+    store = type.__call__(HDBDataStore, 'localhost', 'localhost', 9090, 'platform_datasets',
+                          '/user/PNDA/datasets', backend=backend)
+    store.ensure_table()
+    timer = timeit.Timer(store.collect)
+    return min(timer.repeat(repeat=REPEAT, number=1))
+
+
+def main(argv):
+    """
+    Run benchmark for every requested catalog size
+    """
+    sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+    # untracked dataset warnings would dominate the timing
+    logging.disable(logging.WARNING)
+    print("%10s %12s %12s" % ("datasets", "merge(ms)", "collect(ms)"))
+    for size in sizes:
+        print("%10d %12.2f %12.2f" % (size, bench_merge(size) * 1000,
+                                      bench_collect(size) * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,234 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Load benchmark of the data service API on the local backend
+
+   Serves the API over a synthetic dataset tree, drives it with concurrent clients while the
+   datasets are collected in the background, and reports throughput and latency percentiles
+   per endpoint and of collect.
+
+   Usage: python -m benchmarks.endpoints [--datasets N] [--clients N] [--duration SECONDS]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+
+import requests
+import tornado.httpserver
+import tornado.ioloop
+from tornado.testing import bind_unused_port
+from tornado_json.application import Application
+from tornado_json.routes import get_routes
+
+import dataservice
+from dataservice import HDBDataStore
+from dataservice.api.dataservice import configure_executors
+from dataservice.backends import LocalBackend
+
+REPO = '/user/PNDA/datasets'
+TABLE = 'platform_datasets'
+PERCENTILES = (50, 95, 99)
+# relative frequency of every endpoint in the request mix
+MIX = (('list', 2), ('get', 10), ('partitions', 2), ('put', 1))
+
+
+def percentile(ordered, rank):
+    """
+    Nearest rank percentile
+    :param ordered: sorted samples
+    :param rank: percentile, 0-100
+    :return: sample, None without samples
+    """
+    if not ordered:
+        return None
+    return ordered[max(0, int(round(rank / 100.0 * len(ordered))) - 1)]
+
+
+class Recorder(object):
+    """
+    Latencies and failures by operation, shared by the client threads
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = dict()
+        self.errors = dict()
+
+    def record(self, operation, seconds, failed=False):
+        """
+        Record one call of operation
+        """
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(seconds)
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def report(self, elapsed):
+        """
+        Print calls, throughput, errors and latency percentiles per operation
+        :param elapsed: seconds the load ran for
+        """
+        print("%-12s %8s %10s %7s %s" % ("operation", "calls", "calls/s", "errors", " ".join(
+            "%9s" % ("p%d(ms)" % rank) for rank in PERCENTILES)))
+        for operation in sorted(self.latencies):
+            ordered = sorted(self.latencies[operation])
+            print("%-12s %8d %10.1f %7d %s" % (
+                operation, len(ordered), len(ordered) / elapsed, self.errors.get(operation, 0),
+                " ".join("%9.2f" % (percentile(ordered, rank) * 1000) for rank in PERCENTILES)))
+
+
+def create_store(args):
+    """
+    Data store over a local backend sized by the arguments, collected once
+    """
+    backend = LocalBackend(REPO, TABLE, datasets=args.datasets, days=args.days,
+                           hours=args.hours, latency=args.listing_latency)
+    # bypass the singleton so the store is built with the local backend
+    store = type.__call__(HDBDataStore, 'localhost', 'localhost', 9090, TABLE, REPO,
+                          hbase_change_detection=args.change_detection, backend=backend)
+    store.ensure_table()
+    store.collect()
+    return store
+
+
+def serve(store):
+    """
+    Serve the API on an unused port from a background IOLoop
+    :return: tuple of base url and IOLoop
+    """
+    io_loop = tornado.ioloop.IOLoop()
+    sock, port = bind_unused_port()
+
+    def start():
+        """
+        Start server on the IOLoop thread
+        """
+        server = tornado.httpserver.HTTPServer(
+            Application(routes=get_routes(dataservice), settings=dict(), db_conn=store))
+        server.add_sockets([sock])
+
+    io_loop.add_callback(start)
+    thread = threading.Thread(target=io_loop.start, name='ioloop')
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:%d/api/v1' % port, io_loop
+
+
+def client(base_url, args, recorder, deadline, seed):
+    """
+    Issue requests drawn from MIX until deadline
+    """
+    rand = random.Random(seed)
+    session = requests.Session()
+    population = [operation for operation, weight in MIX for _ in range(weight)]
+    while time.time() < deadline:
+        operation = rand.choice(population)
+        # partitions are read from a few datasets, so their indexes are mostly warm
+        dataset_id = 'ds%d' % rand.randrange(args.datasets if operation != 'partitions'
+                                             else min(args.datasets, args.hot_datasets))
+        started = time.time()
+        try:
+            if operation == 'list':
+                response = session.get(base_url + '/datasets')
+            elif operation == 'get':
+                response = session.get(base_url + '/datasets/' + dataset_id)
+            elif operation == 'partitions':
+                response = session.get(base_url + '/datasets/' + dataset_id + '/partitions')
+            else:
+                response = session.put(base_url + '/datasets/' + dataset_id, data=json.dumps(
+                    {'policy': 'age', 'max_age_days': rand.randint(1, 365)}))
+            failed = response.status_code != 200
+        except requests.RequestException:
+            failed = True
+        recorder.record(operation, time.time() - started, failed)
+
+
+def collector(store, recorder, deadline, period):
+    """
+    Collect datasets every period seconds until deadline
+    """
+    while time.time() < deadline:
+        started = time.time()
+        try:
+            store.collect()
+            failed = False
+        except Exception:  # pylint: disable=broad-except
+            failed = True
+        recorder.record('collect', time.time() - started, failed)
+        time.sleep(max(0, period - (time.time() - started)))
+
+
+def parse_args(argv):
+    """
+    Parse command line
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.endpoints',
+                                     description='Load benchmark of the data service API')
+    parser.add_argument('--datasets', type=int, default=1000, help='datasets in the tree')
+    parser.add_argument('--days', type=int, default=28, help='days partitioned per month')
+    parser.add_argument('--hours', type=int, default=24, help='hours partitioned per day')
+    parser.add_argument('--hot-datasets', type=int, default=10,
+                        help='datasets whose partitions are read')
+    parser.add_argument('--listing-latency', type=float, default=0.0,
+                        help='seconds every directory listing takes')
+    parser.add_argument('--change-detection', action='store_true',
+                        help='only scan the datasets table once it changed')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--collect-period', type=float, default=5,
+                        help='seconds between collections, no collection when 0')
+    parser.add_argument('--hdfs-workers', type=int, default=8, help='hdfs executor threads')
+    parser.add_argument('--hbase-workers', type=int, default=8, help='hbase executor threads')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Run the load and print the report
+    """
+    args = parse_args(argv)
+    # untracked dataset and access logging would dominate the timing
+    logging.disable(logging.WARNING)
+    started = time.time()
+    store = create_store(args)
+    print("%d datasets, %d partitions, collected in %.2fs" % (
+        args.datasets, store.backend.hdfs.partitions(), time.time() - started))
+    configure_executors(hdfs_workers=args.hdfs_workers, hbase_workers=args.hbase_workers)
+    base_url, io_loop = serve(store)
+    recorder = Recorder()
+    started = time.time()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=client, args=(base_url, args, recorder, deadline, i))
+               for i in range(args.clients)]
+    if args.collect_period > 0:
+        threads.append(threading.Thread(target=collector,
+                                        args=(store, recorder, deadline, args.collect_period)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    io_loop.add_callback(io_loop.stop)
+    print("%d clients for %.1fs" % (args.clients, elapsed))
+    recorder.report(elapsed)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
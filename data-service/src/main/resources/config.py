@@ -37,6 +37,45 @@ def define_options():
     define("data_repo", default="/user/PNDA/datasets",
            help="The HDFS location in which all HDFS files are stored",
            type=str)
+    define("partition_cache_ttl", default=60,
+           help="Seconds for which partitions of a dataset are served from memory", type=int)
+    define("partition_rebuild_period", default=3600,
+           help="Seconds after which partition index of a dataset is rebuilt from scratch",
+           type=int)
+    define("hdfs_walk_workers", default=8,
+           help="Number of threads listing HDFS directories concurrently", type=int)
+    define("hdfs_walk_max_requests", default=8,
+           help="Maximum number of concurrent WebHDFS listing requests", type=int)
+    define("hbase_scan_batch_size", default=1000,
+           help="Number of rows fetched from HBase per scan round trip", type=int)
+    define("hbase_write_batch_size", default=500,
+           help="Number of mutations sent to HBase per round trip by bulk updates", type=int)
+    define("hbase_change_detection", default=False,
+           help="Only scan the datasets table again once its version row changed", type=bool)
+    define("hbase_rescan_period", default=300,
+           help="Seconds after which the datasets table is scanned even if unchanged", type=int)
+    define("hbase_pool_size", default=8,
+           help="Number of pooled connections to the HBase Thrift gateway", type=int)
+    define("hdfs_executor_workers", default=8,
+           help="Number of threads serving partition reads from HDFS", type=int)
+    define("hbase_executor_workers", default=8,
+           help="Number of threads serving dataset reads and writes, at most hbase_pool_size",
+           type=int)
+    define("storage_backend", default='hbase',
+           help="Where datasets are read from, the cluster or a local synthetic tree (hbase|local)",
+           type=str)
+    define("local_catalog_path", default=':memory:',
+           help="SQLite file holding the datasets table of the local backend", type=str)
+    define("local_datasets", default=1000,
+           help="Number of datasets in the tree of the local backend", type=int)
+    define("local_partition_days", default=28,
+           help="Days per month partitioned in the tree of the local backend", type=int)
+    define("local_partition_hours", default=24,
+           help="Hours per day partitioned in the tree of the local backend", type=int)
+    define("local_files_per_partition", default=2,
+           help="Files in every hour partition of the local backend", type=int)
+    define("local_listing_latency", default=0.0,
+           help="Seconds every directory listing of the local backend takes", type=float)
     define("thrift_port", default=9090, help="The port number of HBASE Thrift gateway", type=int)
     define("hadoop_distro", default='CDH', help="The hadoop distribution (CDH|HDP)", type=str)
     define("cm_host", default='localhost', help="The cluster manager interface", type=str)
@@ -1,6 +1,8 @@
+from dataservice.catalog import DatasetCatalog
 from dataservice.hdb import HDBDataStore
+from dataservice.refresher import DatasetRefresher
 from dataservice.dbenum import DATASET
 from dataservice.dbenum import DBSCHEMA
 
 __version__ = '0.0.1'
-__all__ = ["HDBDataStore", 'DATASET', 'DBSCHEMA']
+__all__ = ["DatasetCatalog", "HDBDataStore", "DatasetRefresher", 'DATASET', 'DBSCHEMA']
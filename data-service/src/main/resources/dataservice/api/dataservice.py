@@ -34,11 +34,19 @@ from tornado_json.requesthandlers import APIHandler
 
 from ..dbenum import DATASET
 from ..dbenum import POLICY
+from ..metrics import EXECUTORS
+from ..metrics import REQUEST_SECONDS
+from ..metrics import REQUESTS
 
 API_VERSION = "v1"
 
 MODE_ENUM_LIST = ["keep", "archive", "delete", DATASET.INTEGRITY_ERROR]
 POLICY_ENUM_LIST = [POLICY.AGE, POLICY.SIZE]
+MAX_PAGE_SIZE = 1000
+MAX_BULK_UPDATE = 1000
+HDFS_EXECUTOR_WORKERS = 8
+HBASE_EXECUTOR_WORKERS = 8
+LIST_QUERY_ARGS = ["limit", "cursor", DATASET.POLICY, DATASET.MODE, "prefix", "fields"]
 
 DATASET_SCHEMA = {
     "type": "object",
@@ -53,6 +61,23 @@ DATASET_SCHEMA = {
     "required": ["id", "path", "policy", "mode"]
 }
 
+# changes of a dataset, only the fields present are validated
+CHANGES_SCHEMA = {
+    "type": "object",
+    "properties": dict((key, DATASET_SCHEMA["properties"][key]) for key in (
+        "policy", "mode", "max_age_days", "max_size_gigabytes"))
+}
+
+
+def project_fields(datasets, fields):
+    """
+    Keep only selected fields of each dataset
+    :param datasets: list of datasets
+    :param fields: field names to keep
+    :return: list of projected datasets
+    """
+    return [dict((key, dataset[key]) for key in fields if key in dataset) for dataset in datasets]
+
 
 def remove_keys_from_dict(dict_object, keys):
     """
@@ -67,32 +92,92 @@ def remove_keys_from_dict(dict_object, keys):
     return dict_object
 
 
+def update_policy(dataset, request_data):
+    """
+    Apply policy change of a request to a dataset
+    :return: retention to persist
+    """
+    policy = request_data[DATASET.POLICY]
+    if policy == POLICY.AGE and DATASET.MAX_AGE in request_data:
+        dataset[DATASET.POLICY] = policy
+        remove_keys_from_dict(dataset, [DATASET.MAX_SIZE])
+        retention = str(request_data[DATASET.MAX_AGE])
+        dataset[DATASET.MAX_AGE] = request_data[DATASET.MAX_AGE]
+    elif policy == POLICY.SIZE and DATASET.MAX_SIZE in request_data:
+        dataset[DATASET.POLICY] = policy
+        retention = str(request_data[DATASET.MAX_SIZE])
+        remove_keys_from_dict(dataset, [DATASET.MAX_AGE])
+        dataset[DATASET.MAX_SIZE] = request_data[DATASET.MAX_SIZE]
+    else:
+        raise APIError(400, log_message="Not a valid request")
+    return retention
+
+
+def update_dataset(dataset, request_data):
+    """
+    Apply policy and mode changes of a request to a dataset
+    :return: retention to persist, empty when policy is unchanged
+    """
+    retention = ""
+    if DATASET.POLICY in request_data:
+        retention = update_policy(dataset, request_data)
+    if DATASET.MODE in request_data:
+        if request_data[DATASET.MODE] in MODE_ENUM_LIST:
+            dataset[DATASET.MODE] = request_data[DATASET.MODE]
+        else:
+            raise APIError(400, log_message="Not a valid request with invalid mode")
+    return retention
+
+
+def with_retention(dataset, retention):
+    """
+    Copy of a dataset to persist, with its retention when set
+    """
+    entry = copy.deepcopy(dataset)
+    if retention:
+        entry[DATASET.RETENTION] = retention
+    return entry
+
+
 class DataHandler(APIHandler):
     """
     Abstract data handler class
     """
     __url_names__ = [""]
     io_loop = IOLoop.current()
-    executor = ThreadPoolExecutor(max_workers=4)
+    # HDFS walks and HBase calls run in separate lanes, a burst of writes never queues
+    # behind slow partition walks
+    hdfs_executor = ThreadPoolExecutor(max_workers=HDFS_EXECUTOR_WORKERS)
+    hbase_executor = ThreadPoolExecutor(max_workers=HBASE_EXECUTOR_WORKERS)
 
     def data_received(self, chunk):
         pass
 
-    @run_on_executor
+    def on_finish(self):
+        route = self.__class__.__name__
+        REQUEST_SECONDS.observe(self.request.request_time(), route=route,
+                                method=self.request.method)
+        REQUESTS.inc(route=route, method=self.request.method, code=self.get_status())
+
+    @run_on_executor(executor='hbase_executor')
     def __read_data__(self):
         hdb_datasets = self.db_conn.read_datasets()
         logging.info("Following datasets were received from table %s", hdb_datasets)
         raise Return(hdb_datasets)
 
-    @run_on_executor
+    @run_on_executor(executor='hdfs_executor')
     def __read_parts__(self, path):
         logging.info("Reading partition information for dataset: %s", path)
         parts = self.db_conn.read_partitions(path)
         raise Return(parts)
 
-    @run_on_executor
+    @run_on_executor(executor='hbase_executor')
     def __write_data__(self, data):
-        self.db_conn.write_dataset(data)
+        return self.db_conn.write_dataset(data)
+
+    @run_on_executor(executor='hbase_executor')
+    def __write_batch__(self, datasets):
+        return self.db_conn.write_datasets(datasets)
 
     @coroutine
     def __get_datasets__(self):
@@ -109,6 +194,27 @@ class DataHandler(APIHandler):
             raise Return(value_return.value)
 
 
+def configure_executors(hdfs_workers=HDFS_EXECUTOR_WORKERS, hbase_workers=HBASE_EXECUTOR_WORKERS):
+    """
+    Size the executor lanes of the handlers, called at startup before requests are served
+    :param hdfs_workers: threads reading partitions from HDFS
+    :param hbase_workers: threads reading and writing datasets, should not exceed the
+     HBase connection pool size
+    :return: None
+    """
+    for name, workers in (('hdfs', hdfs_workers), ('hbase', hbase_workers)):
+        attr = name + '_executor'
+        previous = getattr(DataHandler, attr)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        setattr(DataHandler, attr, executor)
+        EXECUTORS[name] = executor
+        previous.shutdown(wait=False)
+
+
+EXECUTORS['hdfs'] = DataHandler.hdfs_executor
+EXECUTORS['hbase'] = DataHandler.hbase_executor
+
+
 class ListDatasets(DataHandler):
     """
     List available pnda datasets
@@ -116,6 +222,31 @@ class ListDatasets(DataHandler):
 
     __urls__ = [r'/api/' + API_VERSION + '/datasets']
 
+    def __list_query(self):
+        """
+        Parse pagination, filter and projection query arguments
+        :return: tuple of page query and projected fields
+        """
+        query = dict(policy=self.get_query_argument(DATASET.POLICY, None),
+                     mode=self.get_query_argument(DATASET.MODE, None),
+                     prefix=self.get_query_argument("prefix", None),
+                     cursor=self.get_query_argument("cursor", None),
+                     limit=None)
+        limit = self.get_query_argument("limit", None)
+        if limit is not None:
+            try:
+                query["limit"] = min(int(limit), MAX_PAGE_SIZE)
+            except ValueError:
+                raise APIError(400, log_message="limit must be an integer")
+            if query["limit"] < 1:
+                raise APIError(400, log_message="limit must be positive")
+        fields = self.get_query_argument("fields", None)
+        if fields is not None:
+            fields = [field for field in fields.split(",") if field]
+            if not fields or not set(fields).issubset(DATASET_SCHEMA["properties"]):
+                raise APIError(400, log_message="Not a valid fields selection")
+        return query, fields
+
     @schema.validate(
         output_schema={
             "type": "array",
@@ -124,18 +255,88 @@ class ListDatasets(DataHandler):
     @coroutine
     def get(self, *args, **kwargs):
         # pylint: disable=unused-argument
+        """
+        List datasets. When any of limit, cursor, policy, mode, prefix or fields query
+        arguments is given, datasets are served in id order from the catalog indexes and
+        the cursor for the next page is returned in the X-Next-Cursor header.
+        :return: datasets
+        """
         try:
-            result = yield self.__get_datasets__()
-            if result is None:
-                raise APIError(503, log_message="Server internal error")
-            # reformat response depending on policy
+            if not any(self.get_query_argument(arg, None) is not None for arg in LIST_QUERY_ARGS):
+                result = yield self.__get_datasets__()
+                if result is None:
+                    raise APIError(503, log_message="Server internal error")
+                raise Return(result)
+            query, fields = self.__list_query()
+            result, next_cursor = self.db_conn.page_datasets(**query)
+            if next_cursor is not None:
+                self.set_header("X-Next-Cursor", next_cursor)
+            if fields:
+                result = project_fields(result, fields)
             raise Return(result)
         except Return as return_value:
             raise return_value
+        except APIError as api_error:
+            raise api_error
         except Exception as exception:
             logging.warn("Exception thrown in /list API %s", str(exception))
             raise APIError(500, log_message="Server Internal error")
 
+    @schema.validate(
+        output_schema={
+            "type": "array",
+        },
+    )
+    @coroutine
+    def patch(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        """
+        Update policy and/or mode of many datasets at once. The body maps dataset ids to
+        changes as accepted by PUT /datasets/<id>. Nothing is written unless every change is
+        valid, datasets are then written in HBase batches and published together. As for PUT,
+        only the changed fields are validated, so that e.g. the mode of a dataset with an
+        integrity error can be repaired.
+        :return: updated datasets in id order
+        """
+        try:
+            try:
+                changes = escape.json_decode(self.request.body)
+            except ValueError:
+                raise APIError(400, log_message="Malformed request")
+            if not isinstance(changes, dict) or not changes:
+                raise APIError(400, log_message="Expected a map of dataset id to changes")
+            if len(changes) > MAX_BULK_UPDATE:
+                raise APIError(400, log_message="At most %d datasets can be updated at once"
+                               % MAX_BULK_UPDATE)
+            updated = list()
+            entries = list()
+            for dataset_id in sorted(changes):
+                dataset = self.db_conn.read_dataset(dataset_id)
+                if dataset is None:
+                    raise APIError(404, log_message="Dataset %s not found" % dataset_id)
+                try:
+                    jsonschema.validate(changes[dataset_id], CHANGES_SCHEMA)
+                except jsonschema.ValidationError as ex:
+                    logging.error("Failed to validate input schema {msg:%s}", str(ex))
+                    raise APIError(400, log_message="Malformed request")
+                # entries belong to the shared snapshot, never modify them in place
+                dataset = copy.deepcopy(dataset)
+                retention = update_dataset(dataset, changes[dataset_id])
+                updated.append(dataset)
+                entries.append(with_retention(dataset, retention))
+            logging.info('Bulk update of %d datasets', len(entries))
+            written = yield self.__write_batch__(entries)
+            if not written:
+                raise APIError(503, log_message="Failed to persist datasets")
+            raise Return(updated)
+        except Return as return_value:
+            raise return_value
+        except APIError as api_error:
+            raise api_error
+        except Exception as exception:
+            logging.warn("Exception thrown in bulk update API %s", str(exception))
+            raise APIError(500, log_message="Server Internal error")
+
 
 class GetPartitions(DataHandler):
     """
@@ -156,15 +357,15 @@ class GetPartitions(DataHandler):
         :return: partitons pertaining to dataset
         """
         try:
-            result = yield self.__get_datasets__()
-            if result is None:
-                raise APIError(503, log_message="Server internal error")
-            dataset_found = [i for i in result if i['id'] == dataset_id]
-            for dataset in dataset_found:
+            dataset = self.db_conn.read_dataset(dataset_id)
+            if dataset is not None:
                 logging.info(u'Partition request for dataset:{%s} received', dataset_id)
                 result = yield self.__get_parts__(dataset["path"])
                 if result is None:
                     raise APIError(503, log_message="Not able to retrieve partitons")
+                age = self.db_conn.partitions_age(dataset["path"])
+                if age is not None:
+                    self.set_header("X-Partitions-Age", "%.3f" % age)
                 raise Return(result)
             raise APIError(404, log_message="Dataset by that name not found")
         except Return as return_value:
@@ -180,45 +381,24 @@ class UpdateDatasets(DataHandler):
     """
     __urls__ = [r'/api/' + API_VERSION + '/datasets/(?P<dataset_id>[a-zA-Z0-9_\\-]+)/?$']
 
+    @coroutine
     def __persist_dataset(self, dataset, retention):
-        entry = copy.deepcopy(dataset)
+        """
+        Write dataset and wait until it is in HBase and in the catalog, so that reads
+        following the response see it
+        """
+        entry = with_retention(dataset, retention)
         logging.info('Update dataset for following values %s', entry)
         logging.debug("Retention set %s", retention)
-        if retention:
-            entry[DATASET.RETENTION] = retention
-        self.__write_data__(entry)
-
-    @staticmethod
-    def __update_policy(dataset, request_data):
-        policy = request_data[DATASET.POLICY]
-        if policy == POLICY.AGE and DATASET.MAX_AGE in request_data:
-            dataset[DATASET.POLICY] = policy
-            remove_keys_from_dict(dataset, [DATASET.MAX_SIZE])
-            retention = str(request_data[DATASET.MAX_AGE])
-            dataset[DATASET.MAX_AGE] = request_data[DATASET.MAX_AGE]
-        elif policy == POLICY.SIZE and DATASET.MAX_SIZE in request_data:
-            dataset[DATASET.POLICY] = policy
-            retention = str(request_data[DATASET.MAX_SIZE])
-            remove_keys_from_dict(dataset, [DATASET.MAX_AGE])
-            dataset[DATASET.MAX_SIZE] = request_data[DATASET.MAX_SIZE]
-        else:
-            raise APIError(400, log_message="Not a valid request")
-        return retention
+        written = yield self.__write_data__(entry)
+        if not written:
+            raise APIError(503, log_message="Failed to persist dataset")
 
+    @coroutine
     def __update_dataset(self, dataset, request_data):
         logging.info(u'Update request for api:{%s} received', dataset)
-        retention = ""
-        # Handle policy change
-        # When time permits, refactor this one.Violates DRY
-        if DATASET.POLICY in request_data:
-            retention = self.__update_policy(dataset, request_data)
-        # Handle mode change
-        if DATASET.MODE in request_data:
-            if request_data[DATASET.MODE] in MODE_ENUM_LIST:
-                dataset[DATASET.MODE] = request_data[DATASET.MODE]
-            else:
-                raise APIError(400, log_message="Not a valid request with invalid mode")
-        self.__persist_dataset(dataset, retention)
+        retention = update_dataset(dataset, request_data)
+        yield self.__persist_dataset(dataset, retention)
         raise Return(dataset)
 
     @schema.validate(
@@ -232,14 +412,11 @@ class UpdateDatasets(DataHandler):
         :return:
         """
         try:
-            result = yield self.__get_datasets__()
-            if result is None:
-                raise APIError(500, log_message="Server internal error")
-            dataset_found = [i for i in result if i['id'] == dataset_id]
-            if len(dataset_found) == 0:
+            dataset = self.db_conn.read_dataset(dataset_id)
+            if dataset is None:
                 raise APIError(404, log_message="Dataset by that name not found.")
-            logging.info("dataset found %s", dataset_found)
-            raise Return(dataset_found.pop())
+            logging.info("dataset found %s", dataset)
+            raise Return(dataset)
         except Return as return_value:
             raise return_value
         except Exception as exception:
@@ -259,21 +436,19 @@ class UpdateDatasets(DataHandler):
         :return:
         """
         try:
-            result = yield self.__get_datasets__()
-            if result is None:
-                raise APIError(500, log_message="Server internal error")
-
-            dataset_found = [item for item in result if item[DATASET.ID] == dataset_id]
-            if dataset_found:
+            dataset = self.db_conn.read_dataset(dataset_id)
+            if dataset is not None:
                 request_data = escape.json_decode(self.request.body)
-                self.__update_dataset(dataset_found[0], request_data)
+                # entries belong to the shared snapshot, never modify them in place
+                dataset = yield self.__update_dataset(copy.deepcopy(dataset), request_data)
+                raise Return(dataset)
             else:
                 item = escape.json_decode(self.request.body)
                 item["id"] = dataset_id
                 try:
                     jsonschema.validate(item, DATASET_SCHEMA)
-                    retention = self.__update_policy(item, item)
-                    self.__persist_dataset(item, retention)
+                    retention = update_policy(item, item)
+                    yield self.__persist_dataset(item, retention)
                     raise Return(item)
                 except jsonschema.ValidationError as ex:
                     logging.error("Failed to validate input schema {msg:%s}", str(ex))
@@ -0,0 +1,497 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Storage backends of HDBDataStore, the datasets table and the filesystem listing.
+
+   A backend provides connection_pool(), used like a happybase.ConnectionPool, and
+   filesystem(pool_size), used like a PooledHdfsClient. HBaseBackend connects to the cluster,
+   LocalBackend keeps the datasets table in SQLite and generates a synthetic dataset tree,
+   for tests and benchmarks without a cluster.
+"""
+
+import logging
+import posixpath
+import re
+import sqlite3
+import threading
+import time
+from calendar import timegm
+from contextlib import contextmanager
+
+import happybase
+from pyhdfs import FileStatus
+from pyhdfs import HdfsClient
+from pyhdfs import HdfsFileNotFoundException
+
+from .dbenum import DBSCHEMA
+from .dbenum import POLICY
+from .webhdfs import PooledHdfsClient
+from .webhdfs import RequestMetrics
+
+DB_CONNECTION_POOL_SIZE = 8
+DB_CONNECTION_TIME_OUT = 5000
+LOCAL_DATASETS = 1000
+LOCAL_START_YEAR = 2016
+LOCAL_YEARS = 1
+LOCAL_DAYS = 28
+LOCAL_HOURS = 24
+LOCAL_FILES = 2
+LOCAL_FILE_SIZE = 64 * 1024 * 1024
+# partition levels of the synthetic tree below a dataset, with the number of values per level
+PARTITION_LEVELS = ('year', 'month', 'day', 'hour')
+DATASET_NAME = re.compile(r'^source=ds(0|[1-9][0-9]*)$')
+
+
+class HBaseBackend(object):
+    """
+    Datasets table in HBase through the Thrift gateway, datasets on HDFS through WebHDFS
+    """
+
+    def __init__(self, hdfs_host, hbase_host, hbase_port_no, pool_size=DB_CONNECTION_POOL_SIZE):
+        self.hdfs_host = hdfs_host
+        self.hbase_host = hbase_host
+        self.hbase_port_no = hbase_port_no
+        self.pool_size = pool_size
+
+    def connection_pool(self):
+        """
+        :return: happybase.ConnectionPool
+        """
+        logging.info('Open connection pool for hbase host:%s port:%d', self.hbase_host,
+                     self.hbase_port_no)
+        return happybase.ConnectionPool(self.pool_size, host=self.hbase_host,
+                                        port=self.hbase_port_no, timeout=DB_CONNECTION_TIME_OUT)
+
+    def filesystem(self, pool_size):
+        """
+        :param pool_size: connections kept alive, should cover concurrent listings
+        :return: PooledHdfsClient
+        """
+        return PooledHdfsClient(hosts=self.hdfs_host, user_name='hdfs', pool_size=pool_size)
+
+
+class SQLiteTable(object):
+    """
+    Wide column table kept as (row, column, value) cells, with the subset of the happybase
+    Table API used by the data service
+    """
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    def scan(self, columns=None, batch_size=1000, limit=None):
+        """
+        Yield (row, {column: value}) in row order, fetching batch_size rows per query.
+        With columns only rows holding one of them are returned.
+        """
+        last = ''
+        returned = 0
+        while limit is None or returned < limit:
+            count = batch_size if limit is None else min(batch_size, limit - returned)
+            cells = self.database.select_rows(self.name, last, count, columns)
+            if not cells:
+                return
+            rows = list()
+            for row, column, value in cells:
+                if not rows or rows[-1][0] != row:
+                    rows.append((row, dict()))
+                rows[-1][1][column] = value
+            for row in rows:
+                yield row
+            returned += len(rows)
+            last = rows[-1][0]
+
+    def put(self, row, data):
+        """
+        Write columns of a row
+        """
+        self.database.put(self.name, [(row, data)])
+
+    def delete(self, row):
+        """
+        Delete a row
+        """
+        self.database.delete(self.name, row)
+
+    @contextmanager
+    def batch(self, batch_size=None):
+        """
+        Collect puts and write them in transactions of batch_size rows
+        """
+        batch = SQLiteBatch(self, batch_size)
+        yield batch
+        batch.send()
+
+    def counter_get(self, row, column):
+        """
+        :return: value of a counter, 0 if never incremented
+        """
+        value = self.database.select_cell(self.name, row, column)
+        return int(value) if value is not None else 0
+
+    def counter_inc(self, row, column, value=1):
+        """
+        Increment a counter
+        :return: new value
+        """
+        return self.database.increment(self.name, row, column, value)
+
+
+class SQLiteBatch(object):
+    """
+    Puts of a batch, written every batch_size rows
+    """
+
+    def __init__(self, table, batch_size):
+        self.table = table
+        self.batch_size = batch_size
+        self.rows = list()
+
+    def put(self, row, data):
+        """
+        Queue a put
+        """
+        self.rows.append((row, data))
+        if self.batch_size and len(self.rows) >= self.batch_size:
+            self.send()
+
+    def send(self):
+        """
+        Write queued puts in one transaction
+        """
+        if self.rows:
+            self.table.database.put(self.table.name, self.rows)
+            self.rows = list()
+
+
+class SQLiteDatabase(object):
+    """
+    SQLite file, or memory database, holding the tables. A single connection is shared by
+    all threads and every statement runs under a lock.
+    """
+
+    def __init__(self, db_path=':memory:'):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.text_factory = bytes
+        with self.lock, self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS tables (name TEXT PRIMARY KEY)')
+
+    @staticmethod
+    def cells(name):
+        """
+        SQLite table of a table
+        """
+        return '"cells_%s"' % name.replace('"', '')
+
+    def tables(self):
+        """
+        :return: list of table names
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT name FROM tables')]
+
+    def create_table(self, name):
+        """
+        Create a table
+        """
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO tables (name) VALUES (?)', (name,))
+            self.connection.execute('CREATE TABLE %s (row TEXT, col TEXT, value TEXT, '
+                                    'PRIMARY KEY (row, col))' % self.cells(name))
+
+    def select_rows(self, name, after, count, columns=None):
+        """
+        Cells of the count rows following row after
+        :return: list of (row, column, value) in row order
+        """
+        column_filter = ''
+        params = [after]
+        if columns:
+            column_filter = ' AND col IN (%s)' % ','.join('?' * len(columns))
+            params.extend(columns)
+        query = ('SELECT row, col, value FROM {cells} WHERE row IN (SELECT DISTINCT row FROM '
+                 '{cells} WHERE row > ?{filter} ORDER BY row LIMIT ?){filter} ORDER BY row'
+                 .format(cells=self.cells(name), filter=column_filter))
+        params.append(count)
+        params.extend(columns or [])
+        with self.lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def select_cell(self, name, row, column):
+        """
+        :return: value of a cell, None if not set
+        """
+        with self.lock:
+            cell = self.connection.execute('SELECT value FROM %s WHERE row = ? AND col = ?'
+                                           % self.cells(name), (row, column)).fetchone()
+        return cell[0] if cell else None
+
+    def put(self, name, rows):
+        """
+        Write (row, {column: value}) pairs in one transaction
+        """
+        cells = [(row, column, value) for row, data in rows for column, value in data.items()]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO %s (row, col, value) '
+                                        'VALUES (?, ?, ?)' % self.cells(name), cells)
+
+    def delete(self, name, row):
+        """
+        Delete all cells of a row
+        """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM %s WHERE row = ?' % self.cells(name), (row,))
+
+    def increment(self, name, row, column, value):
+        """
+        Increment a counter cell
+        :return: new value
+        """
+        with self.lock, self.connection:
+            current = self.connection.execute('SELECT value FROM %s WHERE row = ? AND col = ?'
+                                              % self.cells(name), (row, column)).fetchone()
+            total = (int(current[0]) if current else 0) + value
+            self.connection.execute('INSERT OR REPLACE INTO %s (row, col, value) '
+                                    'VALUES (?, ?, ?)' % self.cells(name),
+                                    (row, column, str(total)))
+            return total
+
+
+class SQLiteConnection(object):
+    """
+    Connection with the subset of the happybase Connection API used by the data service
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def tables(self):
+        """
+        :return: list of table names
+        """
+        return self.database.tables()
+
+    def create_table(self, name, families):
+        # pylint: disable=unused-argument
+        """
+        Create a table, column families are implicit
+        """
+        self.database.create_table(name)
+
+    def table(self, name):
+        """
+        :return: SQLiteTable
+        """
+        return SQLiteTable(self.database, name)
+
+
+class SQLiteConnectionPool(object):
+    """
+    Stands in for happybase.ConnectionPool over a SQLiteDatabase
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    @contextmanager
+    def connection(self, timeout=None):
+        # pylint: disable=unused-argument
+        """
+        :return: SQLiteConnection
+        """
+        yield SQLiteConnection(self.database)
+
+
+def partition_values(level, years, days, hours):
+    """
+    Values of a partition level, every month has the same days
+    :param level: index in PARTITION_LEVELS
+    :return: list of values
+    """
+    if level == 0:
+        return range(LOCAL_START_YEAR, LOCAL_START_YEAR + years)
+    if level == 1:
+        return range(1, 13)
+    if level == 2:
+        return range(1, days + 1)
+    return range(hours)
+
+
+def not_found(path):
+    """
+    Exception raised by WebHDFS for a missing path
+    """
+    return HdfsFileNotFoundException('File does not exist: %s' % path,
+                                     exception='FileNotFoundException', status_code=404,
+                                     javaClassName='java.io.FileNotFoundException')
+
+
+class SyntheticHdfs(HdfsClient):
+    """
+    Read only dataset tree generated from its path, nothing is kept in memory so a tree can
+    hold millions of partitions. The repo holds datasets source=ds<n>, each partitioned by
+    year, month, day and hour with files in every hour partition.
+    """
+
+    def __init__(self, repo_path, datasets=LOCAL_DATASETS, years=LOCAL_YEARS, days=LOCAL_DAYS,
+                 hours=LOCAL_HOURS, files=LOCAL_FILES, file_size=LOCAL_FILE_SIZE, latency=0.0):
+        """
+        :param repo_path: repo the datasets are found in
+        :param datasets: number of datasets
+        :param years: years of partitions per dataset
+        :param days: days per month
+        :param hours: hours per day
+        :param files: files per hour partition
+        :param file_size: length of every file
+        :param latency: seconds every listing takes, to mimic NameNode round trips
+        """
+        super(SyntheticHdfs, self).__init__(hosts='localhost')
+        self.repo_path = repo_path.rstrip('/')
+        self.datasets = datasets
+        self.years = years
+        self.days = days
+        self.hours = hours
+        self.files = files
+        self.file_size = file_size
+        self.latency = latency
+        self.metrics = RequestMetrics()
+
+    def partitions(self):
+        """
+        :return: number of partitions holding files in the tree
+        """
+        return self.datasets * self.years * 12 * self.days * self.hours
+
+    def dataset_names(self):
+        """
+        :return: list of dataset directory names
+        """
+        return ['source=ds%d' % i for i in range(self.datasets)]
+
+    def parse(self, path):
+        """
+        Resolve a path to its dataset and partition values
+        :return: tuple of dataset name and list of partition values, None if path is the repo
+        """
+        path = path.rstrip('/')
+        if path == self.repo_path:
+            return None
+        if not path.startswith(self.repo_path + '/'):
+            raise not_found(path)
+        parts = path[len(self.repo_path) + 1:].split('/')
+        match = DATASET_NAME.match(parts[0])
+        if match is None or int(match.group(1)) >= self.datasets or \
+                len(parts) > len(PARTITION_LEVELS) + 1:
+            raise not_found(path)
+        values = list()
+        for level, part in enumerate(parts[1:]):
+            key, _, value = part.partition('=')
+            allowed = partition_values(level, self.years, self.days, self.hours)
+            if key != PARTITION_LEVELS[level] or not value.isdigit() or int(value) not in allowed:
+                raise not_found(path)
+            values.append(int(value))
+        return parts[0], values
+
+    def mtime(self, values):
+        """
+        Modification time in milliseconds of a partition, the end of its last hour
+        :param values: partition values, the whole dataset when empty
+        """
+        last = [LOCAL_START_YEAR + self.years - 1, 12, self.days, self.hours - 1]
+        year, month, day, hour = list(values) + last[len(values):]
+        return (timegm((year, month, day, hour, 0, 0)) + 3600) * 1000
+
+    def list_status(self, path, **kwargs):
+        # pylint: disable=unused-argument
+        started = time.time()
+        if self.latency:
+            time.sleep(self.latency)
+        failed = True
+        try:
+            statuses = self.statuses(path)
+            failed = False
+            return statuses
+        finally:
+            self.metrics.observe('LISTSTATUS', time.time() - started, failed)
+
+    def statuses(self, path):
+        """
+        FileStatus of the children of a directory
+        """
+        parsed = self.parse(path)
+        if parsed is None:
+            return [FileStatus(pathSuffix=name, type='DIRECTORY', length=0,
+                               modificationTime=self.mtime([]))
+                    for name in self.dataset_names()]
+        _, values = parsed
+        level = len(values)
+        if level == len(PARTITION_LEVELS):
+            return [FileStatus(pathSuffix='part-%05d' % i, type='FILE', length=self.file_size,
+                               modificationTime=self.mtime(values))
+                    for i in range(self.files)]
+        statuses = list()
+        for value in partition_values(level, self.years, self.days, self.hours):
+            name = '%s=%02d' % (PARTITION_LEVELS[level], value)
+            statuses.append(FileStatus(pathSuffix=name, type='DIRECTORY', length=0,
+                                       modificationTime=self.mtime(values + [value])))
+        return statuses
+
+
+class LocalBackend(object):
+    """
+    Datasets table in SQLite and a synthetic dataset tree. Datasets found in the tree are
+    tracked in the table, alternating age and size policies, when it is first created.
+    """
+
+    def __init__(self, repo_path, table_name, db_path=':memory:', **tree):
+        """
+        :param repo_path: repo the datasets are found in
+        :param table_name: datasets table
+        :param db_path: SQLite file, a memory database by default
+        :param tree: sizing of the tree, see SyntheticHdfs
+        """
+        self.hdfs = SyntheticHdfs(repo_path, **tree)
+        self.db_path = db_path
+        self.database = SQLiteDatabase(db_path)
+        if table_name not in self.database.tables():
+            self.database.create_table(table_name)
+            self.seed(table_name)
+
+    def seed(self, table_name):
+        """
+        Track every dataset of the tree in the table
+        """
+        rows = list()
+        for i, name in enumerate(self.hdfs.dataset_names()):
+            policy = POLICY.AGE if i % 2 else POLICY.SIZE
+            rows.append((name.split('=', 1)[1], {
+                DBSCHEMA.PATH: posixpath.join(self.hdfs.repo_path, name),
+                DBSCHEMA.POLICY: policy, DBSCHEMA.MODE: 'archive',
+                DBSCHEMA.RETENTION: '30' if policy == POLICY.AGE else '100'}))
+        self.database.put(table_name, rows)
+
+    def connection_pool(self):
+        """
+        :return: SQLiteConnectionPool
+        """
+        logging.info('Open local datasets table in %s', self.db_path)
+        return SQLiteConnectionPool(self.database)
+
+    def filesystem(self, pool_size):
+        # pylint: disable=unused-argument
+        """
+        :return: SyntheticHdfs
+        """
+        return self.hdfs
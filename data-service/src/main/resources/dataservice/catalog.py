@@ -0,0 +1,140 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Indexed in-memory catalog of datasets
+"""
+
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import OrderedDict
+
+from .dbenum import DATASET
+
+
+def by_id(datasets):
+    """
+    Sort datasets by id
+    :return: tuple of sorted ids and datasets
+    """
+    ordered = sorted(datasets, key=lambda dataset: dataset[DATASET.ID])
+    return [dataset[DATASET.ID] for dataset in ordered], ordered
+
+
+class DatasetCatalog(object):
+    """
+    Indexed view over a snapshot of datasets.
+    A catalog is never modified once built, a refresh builds a new catalog and swaps it in.
+    Secondary indexes by policy, by mode and by policy and mode together are kept in id
+    order to serve paginated listings.
+    The version tells which of two catalogs was published last.
+    """
+
+    def __init__(self, datasets=None, version=0):
+        self.datasets = list(datasets or [])
+        self.version = version
+        self.by_id = dict()
+        by_policy = dict()
+        by_mode = dict()
+        by_policy_mode = dict()
+        for dataset in self.datasets:
+            self.by_id[dataset[DATASET.ID]] = dataset
+            policy, mode = dataset.get(DATASET.POLICY), dataset.get(DATASET.MODE)
+            by_policy.setdefault(policy, []).append(dataset)
+            by_mode.setdefault(mode, []).append(dataset)
+            by_policy_mode.setdefault((policy, mode), []).append(dataset)
+        self.ids, self.ordered = by_id(self.by_id.values())
+        self.by_policy = dict((key, by_id(value)) for key, value in by_policy.items())
+        self.by_mode = dict((key, by_id(value)) for key, value in by_mode.items())
+        self.by_policy_mode = dict((key, by_id(value)) for key, value in by_policy_mode.items())
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def __contains__(self, dataset_id):
+        return dataset_id in self.by_id
+
+    def replace(self, datasets, version=None):
+        """
+        Build a new catalog with datasets added, or replacing the datasets of the same id
+        :param datasets: datasets to add or replace
+        :param version: version of the new catalog, this catalog's version when None
+        :return: DatasetCatalog
+        """
+        updates = OrderedDict((dataset[DATASET.ID], dataset) for dataset in datasets)
+        merged = [updates.pop(dataset[DATASET.ID], dataset) for dataset in self.datasets]
+        return DatasetCatalog(merged + list(updates.values()),
+                              self.version if version is None else version)
+
+    def get(self, dataset_id):
+        """
+        Lookup dataset by id
+        :param dataset_id: dataset identifier
+        :return: dataset or None
+        """
+        return self.by_id.get(dataset_id)
+
+    def select(self, policy=None, mode=None):
+        """
+        Return ids and datasets matching policy and/or mode, in id order
+        :param policy: policy to match, any policy when None
+        :param mode: mode to match, any mode when None
+        :return: tuple of sorted ids and datasets
+        """
+        if policy is None and mode is None:
+            return self.ids, self.ordered
+        if policy is None:
+            return self.by_mode.get(mode, ([], []))
+        if mode is None:
+            return self.by_policy.get(policy, ([], []))
+        return self.by_policy_mode.get((policy, mode), ([], []))
+
+    def find(self, policy=None, mode=None):
+        """
+        Return datasets matching policy and/or mode, in catalog order when unfiltered and
+        in id order otherwise
+        :param policy: policy to match, any policy when None
+        :param mode: mode to match, any mode when None
+        :return: list of datasets
+        """
+        if policy is None and mode is None:
+            return self.datasets
+        return self.select(policy=policy, mode=mode)[1]
+
+    def page(self, policy=None, mode=None, prefix=None, cursor=None, limit=None):
+        """
+        Return a page of datasets in id order.
+        Cost is proportional to the page size, not to the catalog size.
+        :param policy: policy filter
+        :param mode: mode filter
+        :param prefix: only return datasets whose id starts with prefix
+        :param cursor: id of the last dataset of the previous page
+        :param limit: maximum number of datasets in page, no limit when None
+        :return: tuple of datasets and cursor for next page (None on last page)
+        """
+        ids, datasets = self.select(policy=policy, mode=mode)
+        start = 0
+        if prefix:
+            start = bisect_left(ids, prefix)
+        if cursor is not None:
+            start = max(start, bisect_right(ids, cursor))
+        end = len(ids) if limit is None else min(start + limit, len(ids))
+        if prefix:
+            # ids sharing the prefix are contiguous, stop at the first one that doesn't
+            stop = start
+            while stop < end and ids[stop].startswith(prefix):
+                stop += 1
+            end = stop
+        next_cursor = None
+        if start < end < len(ids) and (not prefix or ids[end].startswith(prefix)):
+            next_cursor = ids[end - 1]
+        return datasets[start:end], next_cursor
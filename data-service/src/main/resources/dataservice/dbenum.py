@@ -54,6 +54,7 @@ class DBSCHEMA(EnumDict):
     POLICY = b'cf:policy'
     RETENTION = b'cf:retention'
     MODE = b'cf:mode'
+    VERSION = b'cf:version'
 
 
 class POLICY(EnumDict):
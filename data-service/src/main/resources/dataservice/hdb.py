@@ -18,18 +18,40 @@
 import logging
 import os
 import re
+import threading
+import time
 
 
-import happybase
-from pyhdfs import HdfsClient, HdfsException
+from pyhdfs import HdfsException
 #from thriftpy.transport import TException
 
+from .backends import DB_CONNECTION_POOL_SIZE
+from .backends import DB_CONNECTION_TIME_OUT
+from .backends import HBaseBackend
+from .catalog import DatasetCatalog
 from .dbenum import DATASET
 from .dbenum import DBSCHEMA
 from .dbenum import POLICY
+from .hdfswalk import ParallelWalker
+from .metrics import Gauge
+from .metrics import HBASE_CALLS
+from .metrics import HBASE_ERRORS
+from .metrics import REGISTRY
+from .metrics import RequestMetricsCollector
+from .metrics import STAGE_SECONDS
+from .partitions import PartitionIndex
+from .webhdfs import POOL_SIZE
 
-DB_CONNECTION_POOL_SIZE = 8
-DB_CONNECTION_TIME_OUT = 5000
+PARTITION_CACHE_TTL = 60
+PARTITION_REBUILD_PERIOD = 3600
+HDFS_WALK_WORKERS = 8
+HDFS_WALK_MAX_REQUESTS = 8
+HBASE_SCAN_BATCH_SIZE = 1000
+HBASE_WRITE_BATCH_SIZE = 500
+HBASE_RESCAN_PERIOD = 300
+HBASE_COLUMNS = [DBSCHEMA.PATH, DBSCHEMA.POLICY, DBSCHEMA.RETENTION, DBSCHEMA.MODE]
+# counter bumped on every write, its column is outside of HBASE_COLUMNS so scans skip it
+VERSION_ROW = b'~version'
 KITE_COMMAND = 'kite-api'
 
 
@@ -42,29 +64,56 @@ def onerror(msg):
 
 def tag_for_integrity(data_list):
     """
-    Tag datasets for integrity error
+    Tag datasets for integrity error. Tagged copies are returned, the datasets read from
+    HBase may be reused by the next collection.
     :param data_list:
     :return:
     """
-    if len(data_list) > 0:
-        for i in data_list:
-            i['policy'] = DATASET.INTEGRITY_ERROR
-    return data_list
+    return [dict(i, policy=DATASET.INTEGRITY_ERROR) for i in data_list]
 
 
-def dirwalk(client, dir_path):
+def merge_datasets(hbase_list, hdfs_list):
     """
-    Function to walk hdfs DIRECTORY
+    Reconcile datasets found in HBase with datasets found on HDFS, keyed by dataset id.
+    HBase copy wins for datasets present in both, HDFS only datasets are kept as found and
+    HBase only datasets are tagged for integrity error.
+    :param hbase_list: datasets read from HBase
+    :param hdfs_list: datasets discovered on HDFS
+    :return: merged list of datasets
+    """
+    hdfs_ids = set(entry[DATASET.ID] for entry in hdfs_list)
+    hbase_ids = set(entry[DATASET.ID] for entry in hbase_list)
+    inter_list = [entry for entry in hbase_list if entry[DATASET.ID] in hdfs_ids]
+    hdfs_only = [entry for entry in hdfs_list if entry[DATASET.ID] not in hbase_ids]
+    hbase_only = [entry for entry in hbase_list if entry[DATASET.ID] not in hdfs_ids]
+    # yes intersection
+    if len(inter_list) > 0:
+        logging.debug("The intersection list:%s is", inter_list)
+        if len(hbase_only) != 0:
+            logging.warn(" Warning Untracked datasets of size %d", len(hbase_only))
+        return inter_list + hdfs_only + tag_for_integrity(hbase_only)
+    # god knows whats happening
+    return tag_for_integrity(hbase_only) + hdfs_only
+
 
+def dataset_row(data):
+    """
+    HBase columns of a dataset, retention is only written when set
+    :param data: dataset with retention
+    :return: dict of column to value
+    """
+    row = {DBSCHEMA.PATH: data[DATASET.PATH], DBSCHEMA.POLICY: data[DATASET.POLICY],
+           DBSCHEMA.MODE: data[DATASET.MODE]}
+    if DATASET.RETENTION in data:
+        row[DBSCHEMA.RETENTION] = data[DATASET.RETENTION]
+    return row
+
+
+def remove_retention(data):
+    """
+    Dataset as served by the API from a dataset written to HBase
     """
-    for file_entry in client.listdir(dir_path):
-        fullpath = os.path.join(dir_path, file_entry)
-        file_type = client.get_file_status(fullpath).type
-        if file_type == 'DIRECTORY':
-            for entry in dirwalk(client, fullpath):  # recurse into subdir
-                yield entry
-        else:
-            yield dir_path
+    return dict((key, value) for key, value in data.items() if key != DATASET.RETENTION)
 
 
 class Singleton(type):
@@ -75,7 +124,7 @@ class Singleton(type):
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args)
+            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
 
 
@@ -85,52 +134,110 @@ class HDBDataStore(object):
     Its not a generic HBase dataset handler.
     """
     __metaclass__ = Singleton
-    def __init__(self, hdfs_host, hbase_host, hbase_port_no, table_name, repo_path):
-        logging.info(
-            'Open connection pool for hbase host:%s port:%d', hbase_host, hbase_port_no)
+    def __init__(self, hdfs_host, hbase_host, hbase_port_no, table_name, repo_path,
+                 partition_ttl=PARTITION_CACHE_TTL,
+                 partition_rebuild_period=PARTITION_REBUILD_PERIOD,
+                 hdfs_walk_workers=HDFS_WALK_WORKERS,
+                 hdfs_walk_max_requests=HDFS_WALK_MAX_REQUESTS,
+                 hbase_scan_batch_size=HBASE_SCAN_BATCH_SIZE,
+                 hbase_change_detection=False,
+                 hbase_rescan_period=HBASE_RESCAN_PERIOD,
+                 hbase_pool_size=DB_CONNECTION_POOL_SIZE,
+                 hbase_write_batch_size=HBASE_WRITE_BATCH_SIZE,
+                 backend=None):
+        # the datasets table and filesystem, HBase and HDFS of the cluster unless given
+        if backend is None:
+            backend = HBaseBackend(hdfs_host, hbase_host, hbase_port_no, pool_size=hbase_pool_size)
         # create connection pools
         try:
-            self.conn_pool = happybase.ConnectionPool(DB_CONNECTION_POOL_SIZE, host=hbase_host,
-                                                      port=hbase_port_no,
-                                                      timeout=DB_CONNECTION_TIME_OUT)
+            self.conn_pool = backend.connection_pool()
         except Exception as exception:
             logging.warn("Exception throw for HBase Connection pool creation{%s}",
                          str(exception))
+        self.backend = backend
         self.hbase_host = hbase_host
         self.hdfs_host = hdfs_host
         self.hbase_port_no = hbase_port_no
         self.table_name = table_name
         self.repo_path = repo_path
-        self.master_dataset = list()
-        self.client = HdfsClient(hosts=hdfs_host, user_name='hdfs')
+        self.table_ready = False
+        self.scan_batch_size = hbase_scan_batch_size
+        self.write_batch_size = hbase_write_batch_size
+        # with change detection the table is only scanned again once its version changed
+        self.change_detection = hbase_change_detection
+        self.rescan_period = hbase_rescan_period
+        self.hbase_datasets = None
+        self.hbase_version = None
+        self.hbase_scanned = None
+        self.catalog = DatasetCatalog()
+        self.collected = None
+        self.collect_lock = threading.Lock()
+        # catalog version and writes a collection in progress may not have read from HBase
+        self.version = 0
+        self.writes = dict()
+        self.write_lock = threading.Lock()
+        # keep a pooled connection alive for every walker thread
+        self.client = backend.filesystem(pool_size=max(POOL_SIZE, hdfs_walk_workers))
+        self.walker = ParallelWalker(self.client, max_workers=hdfs_walk_workers,
+                                     max_in_flight=hdfs_walk_max_requests)
+        self.partition_ttl = partition_ttl
+        self.partition_rebuild_period = partition_rebuild_period
+        self.partition_indexes = dict()
+        self.partition_lock = threading.Lock()
+        REGISTRY.register(Gauge('dataservice_snapshot_age_seconds',
+                                'Seconds since the dataset snapshot was published',
+                                self.snapshot_age))
+        REGISTRY.register(Gauge('dataservice_snapshot_datasets',
+                                'Datasets in the published snapshot',
+                                lambda: len(self.catalog)))
+        REGISTRY.register(RequestMetricsCollector('dataservice_webhdfs', self.client.metrics))
 
+    @STAGE_SECONDS.timed(stage='collect')
     def collect(self):
         """
-        Collect datasets by reading from HDFS Repo and HBase repo
-        :return:
+        Collect datasets by reading from HDFS Repo and HBase repo.
+        The new dataset list is built aside and published with a single reference swap, so
+        readers always see a complete snapshot. Writes applied while HBase was being read
+        are reapplied on top of it, the scan may predate them. Overlapping calls are skipped.
+        :return: True if a new snapshot was published
+        """
+        if not self.collect_lock.acquire(False):
+            logging.info("Dataset collection already in progress, skipping this cycle")
+            return False
+        try:
+            started_version = self.version
+            datasets = self.build_snapshot()
+            with self.write_lock:
+                self.writes = dict((dataset_id, write) for dataset_id, write in self.writes.items()
+                                   if write[0] > started_version)
+                self.version += 1
+                self.catalog = DatasetCatalog(datasets).replace(
+                    [dataset for _, dataset in self.writes.values()], self.version)
+            self.collected = time.time()
+            self.prune_partition_indexes()
+        finally:
+            self.collect_lock.release()
+        return True
+
+    def snapshot_age(self):
+        """
+        Seconds since the current snapshot was published
+        :return: age or None before the first collection
+        """
+        if self.collected is None:
+            return None
+        return time.time() - self.collected
+
+    def build_snapshot(self):
+        """
+        Read HDFS and HBase and reconcile them into a new dataset list
+        :return: list of datasets
         """
         hdfs_list = self.read_data_from_repo()
         hbase_list = self.retrieve_datasets_from_hbase()
-        inter_list = list()
-        # find intersection and keep hbase copy
-        for hbase_entry, hdfs_entry in [(hbase_entry, hdfs_entry) for hbase_entry in hbase_list
-                                        for hdfs_entry in hdfs_list]:
-            if hbase_entry['id'] == hdfs_entry['id']:
-                # remove entries in HDFS list that matches hbase
-                inter_list.append(hbase_entry)
-                hdfs_list.remove(hdfs_entry)
-                hbase_list.remove(hbase_entry)
-        # yes intersection
-        if len(inter_list) > 0:
-            logging.debug("The intersection list:%s is", inter_list)
-            self.master_dataset = inter_list + hdfs_list
-            if len(hbase_list) != 0:
-                logging.warn(" Warning Untracked datasets of size %d", len(hbase_list))
-                self.master_dataset = self.master_dataset + tag_for_integrity(hbase_list)
-        else:
-            # god knows whats happening
-            self.master_dataset = tag_for_integrity(hbase_list) + hdfs_list
+        return merge_datasets(hbase_list, hdfs_list)
 
+    @STAGE_SECONDS.timed(stage='read_data_from_repo')
     def read_data_from_repo(self):
         """
         Read data from HDFS repo_path
@@ -172,25 +279,72 @@ class HDBDataStore(object):
             logging.warn("Error in walking HDFS File system %s", str(exception))
         return hdfs_dataset
 
+    def ensure_table(self, connection=None):
+        """
+        Create the datasets table if it doesn't exist yet. The check is made once, at
+        startup or on the first collection after it if HBase wasn't reachable.
+        :param connection: HBase connection, one is taken from the pool when None
+        :return: True if table exists
+        """
+        if connection is None:
+            try:
+                with self.conn_pool.connection(DB_CONNECTION_TIME_OUT) as connection:
+                    return self.ensure_table(connection)
+            except Exception as exception:
+                HBASE_ERRORS.inc(op='connect')
+                logging.warn("Failed to check hbase table error(%s):", str(exception))
+                return False
+        HBASE_CALLS.inc(op='tables')
+        if self.table_name.encode() not in connection.tables():
+            logging.info('creating hbase table %s', self.table_name)
+            HBASE_CALLS.inc(op='create_table')
+            connection.create_table(self.table_name, {'cf': dict()})
+        self.table_ready = True
+        return True
+
+    def is_unchanged(self, version):
+        """
+        Check whether the last scan of the table can be reused
+        :param version: current table version
+        """
+        return self.hbase_datasets is not None and version == self.hbase_version and \
+            time.time() - self.hbase_scanned < self.rescan_period
+
+    @STAGE_SECONDS.timed(stage='retrieve_datasets_from_hbase')
     def retrieve_datasets_from_hbase(self):
         """
-        Connect to hbase table and return list of hbase_dataset
+        Connect to hbase table and return list of hbase_dataset.
+        Only the dataset columns are scanned, in batches of scan_batch_size rows. With change
+        detection the previous list is returned while the table version is unchanged, the
+        table is scanned again at least every rescan_period seconds to pick up writes made
+        by other clients.
         :return:
         """
         hbase_datasets = list()
         table_name = self.table_name
+        operation = 'connect'
         try:
             with self.conn_pool.connection(DB_CONNECTION_TIME_OUT) as connection:
-                if table_name.encode() not in connection.tables():
-                    logging.info('creating hbase table %s', table_name)
-                    connection.create_table(table_name, {'cf': dict()})
+                if not self.table_ready:
+                    operation = 'tables'
+                    self.ensure_table(connection)
 
                 table = connection.table(table_name)
-                for _, data in table.scan(limit=1):
-                    logging.debug('%s found', table_name)
+                version = None
+                if self.change_detection:
+                    operation = 'counter_get'
+                    HBASE_CALLS.inc(op=operation)
+                    # read before scanning, a write made during the scan changes it again
+                    version = table.counter_get(VERSION_ROW, DBSCHEMA.VERSION)
+                    if self.is_unchanged(version):
+                        logging.debug('%s unchanged at version %d', table_name, version)
+                        return self.hbase_datasets
 
                 logging.debug('connecting to hbase to read hbase_dataset')
-                for key, data in table.scan():
+                operation = 'scan'
+                HBASE_CALLS.inc(op=operation)
+                for key, data in table.scan(columns=HBASE_COLUMNS,
+                                            batch_size=self.scan_batch_size):
                     item = {DATASET.ID: key.decode(), DATASET.PATH: data[DBSCHEMA.PATH].decode(),
                             DATASET.POLICY: data[DBSCHEMA.POLICY].decode(),
                             DATASET.MODE: data[DBSCHEMA.MODE].decode()}
@@ -199,54 +353,158 @@ class HDBDataStore(object):
                     elif item[DATASET.POLICY] == POLICY.SIZE:
                         item[DATASET.MAX_SIZE] = int(data[DBSCHEMA.RETENTION].decode())
                     hbase_datasets.append(item)
+                self.hbase_datasets = hbase_datasets
+                self.hbase_version = version
+                self.hbase_scanned = time.time()
         except Exception as exception:
+            HBASE_ERRORS.inc(op=operation)
             logging.warn("Failed to read table from hbase error(%s):", str(exception))
 
-        logging.info(hbase_datasets)
+        logging.debug("Read %d datasets from hbase", len(hbase_datasets))
         return hbase_datasets
 
+    def apply_writes(self, datasets):
+        """
+        Publish datasets written to HBase in a new catalog version
+        :param datasets: datasets as served by the API
+        :return: version of the new catalog
+        """
+        with self.write_lock:
+            self.version += 1
+            for dataset in datasets:
+                self.writes[dataset[DATASET.ID]] = (self.version, dataset)
+            self.catalog = self.catalog.replace(datasets, self.version)
+            return self.version
+
     def read_datasets(self):
         """
-        Connect to hbase table and return list of datasets
+        Return list of datasets from the current snapshot, callers must not modify it
         :return:
         """
-        return self.master_dataset
+        return self.catalog.datasets
+
+    def read_dataset(self, dataset_id):
+        """
+        Lookup a single dataset by id in the current snapshot
+        :param dataset_id: dataset identifier
+        :return: dataset or None
+        """
+        return self.catalog.get(dataset_id)
 
+    def find_datasets(self, policy=None, mode=None):
+        """
+        Return datasets matching policy and/or mode from the current snapshot
+        :param policy: policy filter
+        :param mode: mode filter
+        :return: list of datasets
+        """
+        return self.catalog.find(policy=policy, mode=mode)
+
+    def page_datasets(self, policy=None, mode=None, prefix=None, cursor=None, limit=None):
+        """
+        Return a page of datasets in id order from the current snapshot
+        :return: tuple of datasets and cursor for next page
+        """
+        return self.catalog.page(policy=policy, mode=mode, prefix=prefix, cursor=cursor,
+                                 limit=limit)
+
+    def partition_index(self, data_path):
+        """
+        Return the partition index of a dataset path, creating it on first use
+        :param data_path: dataset path
+        :return: PartitionIndex
+        """
+        with self.partition_lock:
+            index = self.partition_indexes.get(data_path)
+            if index is None:
+                index = PartitionIndex(self.client, data_path, self.walker)
+                self.partition_indexes[data_path] = index
+            return index
+
+    def prune_partition_indexes(self):
+        """
+        Drop partition indexes of datasets no longer in the catalog
+        :return: None
+        """
+        paths = set(dataset[DATASET.PATH] for dataset in self.catalog.datasets)
+        with self.partition_lock:
+            for data_path in list(self.partition_indexes):
+                if data_path not in paths:
+                    del self.partition_indexes[data_path]
+
+    @STAGE_SECONDS.timed(stage='read_partitions')
     def read_partitions(self, data_path):
         """
-        Read partition for a HDFS dataset
+        Read partition for a HDFS dataset from its partition index, refreshing the index
+        when it is older than partition_ttl
         :param data_path:
         :return:
         """
-        data_parts = list()
+        index = self.partition_index(data_path)
         try:
-            for entry in dirwalk(self.client, data_path):
-                if entry not in data_parts:
-                    data_parts.append(entry)
+            index.update(self.partition_ttl, self.partition_rebuild_period)
         except HdfsException as exception:
             logging.warn(
                 "Error in walking HDFS File system for partitions errormsg:%s", str(exception))
-        return data_parts
+        return index.partitions
+
+    def partitions_age(self, data_path):
+        """
+        Age in seconds of partitions served for a dataset
+        :param data_path: dataset path
+        :return: age or None if partitions were never read
+        """
+        return self.partition_index(data_path).age()
 
     def write_dataset(self, data):
         """
-        Persist dataset entry into HBase Table
+        Persist dataset entry into HBase Table and, once written, into the catalog
         :param data: api that needs update
-        :return: None
+        :return: True if dataset was written
         """
         try:
             logging.debug("Write dataset:{%s}", data)
             table_name = self.table_name
             with self.conn_pool.connection(DB_CONNECTION_TIME_OUT) as connection:
                 table = connection.table(table_name)
-                dataset = {DBSCHEMA.PATH: data[DATASET.PATH], DBSCHEMA.POLICY: data[DATASET.POLICY],
-                           DBSCHEMA.MODE: data[DATASET.MODE]}
-                if DATASET.RETENTION in data:
-                    dataset[DBSCHEMA.RETENTION] = data[DATASET.RETENTION]
+                dataset = dataset_row(data)
                 logging.debug("calling put on table for %s", dataset)
+                HBASE_CALLS.inc(op='put')
                 table.put(data[DATASET.ID], dataset)
+                HBASE_CALLS.inc(op='counter_inc')
+                table.counter_inc(VERSION_ROW, DBSCHEMA.VERSION)
         except Exception as exception:
+            HBASE_ERRORS.inc(op='put')
             logging.warn("Failed to write dataset into hbase,  error(%s):", str(exception))
+            return False
+        self.apply_writes([remove_retention(data)])
+        return True
+
+    def write_datasets(self, datasets):
+        """
+        Persist dataset entries into HBase in batches of write_batch_size mutations and, once
+        all of them are written, into the catalog as a single new version.
+        HBase has no multi row transactions, after a failure some of the entries may have
+        been written. They are picked up by the next collection.
+        :param datasets: datasets as written by write_dataset
+        :return: True if all datasets were written
+        """
+        try:
+            logging.debug("Write %d datasets", len(datasets))
+            with self.conn_pool.connection(DB_CONNECTION_TIME_OUT) as connection:
+                table = connection.table(self.table_name)
+                HBASE_CALLS.inc(op='batch')
+                with table.batch(batch_size=self.write_batch_size) as batch:
+                    for data in datasets:
+                        batch.put(data[DATASET.ID], dataset_row(data))
+                HBASE_CALLS.inc(op='counter_inc')
+                table.counter_inc(VERSION_ROW, DBSCHEMA.VERSION)
+        except Exception as exception:
+            HBASE_ERRORS.inc(op='batch')
+            logging.warn("Failed to write datasets into hbase,  error(%s):", str(exception))
+            return False
+        self.apply_writes([remove_retention(data) for data in datasets])
+        return True
 
     def delete_dataset(self, data):
         """
@@ -259,6 +517,10 @@ class HDBDataStore(object):
             with self.conn_pool.connection(DB_CONNECTION_TIME_OUT) as connection:
                 table = connection.table(table_name)
                 logging.debug("Deleting dataset from HBase:{%s}", data)
+                HBASE_CALLS.inc(op='delete')
                 table.delete(data['id'])
+                HBASE_CALLS.inc(op='counter_inc')
+                table.counter_inc(VERSION_ROW, DBSCHEMA.VERSION)
         except Exception as exception:
+            HBASE_ERRORS.inc(op='delete')
             logging.warn("Failed to delete dataset in hbase,  error(%s):", str(exception))
@@ -0,0 +1,279 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Service metrics rendered in the Prometheus text exposition format
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from .webhdfs import LATENCY_BUCKETS
+
+
+def format_labels(labels):
+    """
+    Render label pairs, e.g. {stage="collect"}
+    :param labels: tuple of (name, value) pairs
+    :return: label string, empty without labels
+    """
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                                                  .replace('"', '\\"'))
+                             for name, value in labels)
+
+
+def format_value(value):
+    """
+    Render sample value
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter(object):
+    """
+    Monotonic counter, one series per label set
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = dict()
+
+    def inc(self, value=1, **labels):
+        """
+        Increment series of labels
+        :return: None
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        """
+        :return: list of (name, labels, value)
+        """
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+
+class Histogram(object):
+    """
+    Latency histogram with cumulative buckets, one series per label set
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = dict()
+
+    def observe(self, seconds, **labels):
+        """
+        Record an observation in series of labels
+        :return: None
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, seconds)] += 1
+            series[1] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe time spent in the with block
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - started, **labels)
+
+    def timed(self, **labels):
+        """
+        Decorator observing time spent in the function
+        """
+        def decorator(func):
+            """
+            Decorator
+            """
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                """
+                Wrapper function
+                """
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        """
+        :return: list of (name, labels, value)
+        """
+        samples = list()
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    samples.append((self.name + '_bucket', key + (('le', format_value(bound)),),
+                                    cumulative))
+                samples.append((self.name + '_sum', key, total))
+                samples.append((self.name + '_count', key, cumulative))
+        return samples
+
+
+class Gauge(object):
+    """
+    Gauge read from a callback at render time. The callback returns a value, or a list of
+    (labels dict, value) pairs for several series.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        """
+        :return: list of (name, labels, value)
+        """
+        value = self.callback()
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            return [(self.name, (), value)]
+        return [(self.name, tuple(sorted(labels.items())), series_value)
+                for labels, series_value in value]
+
+
+class RequestMetricsCollector(object):
+    """
+    Exposes RequestMetrics of a PooledHdfsClient as request counter, error counter and
+    latency histogram per WebHDFS operation
+    """
+
+    def __init__(self, name, request_metrics):
+        self.name = name
+        self.request_metrics = request_metrics
+
+    def metrics(self):
+        """
+        :return: list of (name, kind, documentation, samples)
+        """
+        requests, errors, latency = list(), list(), list()
+        for operation, stats in sorted(self.request_metrics.snapshot().items()):
+            key = (('op', operation),)
+            requests.append((self.name + '_requests_total', key, stats['count']))
+            errors.append((self.name + '_errors_total', key, stats['errors']))
+            for bound, count in stats['buckets']:
+                latency.append((self.name + '_request_seconds_bucket',
+                                key + (('le', format_value(bound)),), count))
+            latency.append((self.name + '_request_seconds_sum', key, stats['seconds']))
+            latency.append((self.name + '_request_seconds_count', key, stats['count']))
+        return [(self.name + '_requests_total', 'counter', 'WebHDFS requests by operation',
+                 requests),
+                (self.name + '_errors_total', 'counter', 'Failed WebHDFS requests by operation',
+                 errors),
+                (self.name + '_request_seconds', 'histogram',
+                 'WebHDFS request latency by operation', latency)]
+
+
+class MetricsRegistry(object):
+    """
+    Metrics of the service by name. Registering a metric under a name that is already
+    registered replaces it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.registered = dict()
+
+    def register(self, metric):
+        """
+        Register a Counter, Histogram, Gauge or collector
+        :return: metric
+        """
+        with self.lock:
+            self.registered[metric.name] = metric
+        return metric
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+        :return: text
+        """
+        with self.lock:
+            registered = [self.registered[name] for name in sorted(self.registered)]
+        families = list()
+        for metric in registered:
+            if hasattr(metric, 'metrics'):
+                families.extend(metric.metrics())
+            else:
+                families.append((metric.name, metric.kind, metric.documentation,
+                                 metric.samples()))
+        lines = list()
+        for name, kind, documentation, samples in families:
+            lines.append('# HELP %s %s' % (name, documentation))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for sample_name, labels, value in samples:
+                lines.append('%s%s %s' % (sample_name, format_labels(labels),
+                                          format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'dataservice_stage_seconds', 'Time spent in dataset collection and partition read stages'))
+HBASE_CALLS = REGISTRY.register(Counter(
+    'dataservice_hbase_calls_total', 'HBase calls by operation'))
+HBASE_ERRORS = REGISTRY.register(Counter(
+    'dataservice_hbase_errors_total', 'Failed HBase calls by operation'))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'dataservice_request_seconds', 'API request latency by route and method'))
+REQUESTS = REGISTRY.register(Counter(
+    'dataservice_requests_total', 'API requests by route, method and status code'))
+
+
+# thread pools whose queue depth is reported, by name
+EXECUTORS = dict()
+
+
+def executor_queue_depth():
+    """
+    Gauge callback reporting tasks waiting for a worker thread, per executor
+    :return: list of (labels, value)
+    """
+    # pylint: disable=protected-access
+    return [({'executor': name}, executor._work_queue.qsize())
+            for name, executor in sorted(EXECUTORS.items())]
+
+
+EXECUTOR_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'dataservice_executor_queue_depth', 'Tasks waiting for a worker thread by executor',
+    executor_queue_depth))
@@ -0,0 +1,178 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Cached, incrementally refreshed partition index of a dataset
+"""
+
+import posixpath
+import threading
+import time
+
+from .hdfswalk import DIRECTORY
+from .hdfswalk import dirwalk
+from .hdfswalk import list_entries
+
+
+def raise_error(exception):
+    """
+    Walk error callback, a partially listed dataset must not be served as complete
+    """
+    raise exception
+
+
+class PartitionNode(object):
+    """
+    Directory of a dataset as seen on its last listing
+    """
+    __slots__ = ('mtime', 'has_files', 'children')
+
+    def __init__(self, mtime=None):
+        self.mtime = mtime
+        self.has_files = False
+        self.children = dict()
+
+
+class PartitionIndex(object):
+    """
+    Partitions (directories holding files) of a dataset.
+    The directory tree is listed once and kept in memory. On refresh a directory is only
+    listed again when its modification time changed, it is new, or it is the newest
+    partition at its level, which is where ingestion keeps adding data. A periodic full
+    rebuild picks up changes deep down older branches.
+    """
+
+    def __init__(self, client, data_path, walker=None):
+        self.client = client
+        self.walker = walker
+        self.data_path = data_path
+        self.root = None
+        self.partitions = list()
+        self.refreshed = None
+        self.built = None
+        self.lock = threading.Lock()
+
+    def age(self):
+        """
+        Seconds since index was last refreshed, None if never built
+        """
+        if self.refreshed is None:
+            return None
+        return time.time() - self.refreshed
+
+    def is_fresh(self, ttl):
+        """
+        Check whether index can be served without refresh
+        :param ttl: time to live in seconds
+        """
+        age = self.age()
+        return age is not None and age < ttl
+
+    def update(self, ttl, rebuild_period):
+        """
+        Refresh index if it is older than ttl. While another thread refreshes, the previous
+        partitions keep being served.
+        :param ttl: time to live in seconds
+        :param rebuild_period: seconds after which index is rebuilt from scratch
+        :return: True if index was refreshed
+        """
+        if self.is_fresh(ttl):
+            return False
+        if not self.lock.acquire(False):
+            if self.refreshed is not None:
+                return False
+            self.lock.acquire()
+        try:
+            if self.is_fresh(ttl):
+                return False
+            rebuild = self.built is None or time.time() - self.built >= rebuild_period
+            self.refresh(rebuild)
+            return True
+        finally:
+            self.lock.release()
+
+    def refresh(self, rebuild=False):
+        """
+        List changed directories and recompute partitions
+        :param rebuild: discard cached tree and list everything again
+        :return: None
+        """
+        if rebuild or self.root is None:
+            self.root = self.build()
+            self.built = time.time()
+        else:
+            self.refresh_node(self.root, self.data_path)
+        self.partitions = list(self.collect(self.root, self.data_path))
+        self.refreshed = time.time()
+
+    def build(self):
+        """
+        Walk the whole dataset and build its directory tree
+        :return: root PartitionNode
+        """
+        root = PartitionNode()
+        nodes = {self.data_path: root}
+        if self.walker is None:
+            entries = dirwalk(self.client, self.data_path)
+        else:
+            entries = self.walked_entries()
+        for entry in entries:
+            parent = nodes[posixpath.dirname(entry.path)]
+            if entry.type == DIRECTORY:
+                node = PartitionNode(entry.modificationTime)
+                parent.children[posixpath.basename(entry.path)] = node
+                nodes[entry.path] = node
+            else:
+                parent.has_files = True
+        return root
+
+    def walked_entries(self):
+        """
+        Entries of the dataset listed concurrently by the walker, parents come first
+        """
+        for _, dirs, files in self.walker.walk(self.data_path, topdown=True, onerror=raise_error):
+            for entry in dirs + files:
+                yield entry
+
+    def refresh_node(self, node, node_path):
+        """
+        List a directory and descend into the children that may have changed
+        """
+        dirs = list()
+        has_files = False
+        for entry in list_entries(self.client, node_path):
+            if entry.type == DIRECTORY:
+                dirs.append(entry)
+            else:
+                has_files = True
+        latest = max(entry.path for entry in dirs) if dirs else None
+        children = dict()
+        for entry in dirs:
+            name = posixpath.basename(entry.path)
+            child = node.children.get(name)
+            if child is None or child.mtime != entry.modificationTime or entry.path == latest:
+                child = child or PartitionNode()
+                self.refresh_node(child, entry.path)
+                child.mtime = entry.modificationTime
+            children[name] = child
+        node.children = children
+        node.has_files = has_files
+
+    def collect(self, node, node_path):
+        """
+        Yield partitions below node, in path order
+        """
+        if node.has_files:
+            yield node_path
+        for name in sorted(node.children):
+            for entry in self.collect(node.children[name], posixpath.join(node_path, name)):
+                yield entry
@@ -0,0 +1,84 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Refresh dataset snapshot in background without blocking the IOLoop
+"""
+
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from .metrics import EXECUTORS
+
+
+class DatasetRefresher(object):
+    """
+    Periodically runs HDBDataStore.collect on a dedicated worker thread.
+    The next cycle is only scheduled once the previous one has completed, so a slow
+    HDFS walk or HBase scan never overlaps with the next refresh and never runs on the IOLoop.
+    """
+
+    def __init__(self, db_store, sync_period):
+        """
+        :param db_store: datastore exposing collect()
+        :param sync_period: refresh interval in milliseconds
+        """
+        self.db_store = db_store
+        self.sync_period = sync_period
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.running = False
+        EXECUTORS['refresher'] = self.executor
+
+    def start(self):
+        """
+        Start refreshing on the current IOLoop
+        :return: None
+        """
+        if not self.running:
+            self.running = True
+            IOLoop.current().spawn_callback(self.run)
+
+    def stop(self):
+        """
+        Stop refreshing once the in-flight cycle completes
+        :return: None
+        """
+        self.running = False
+
+    @gen.coroutine
+    def refresh(self):
+        """
+        Run a single collect cycle off the IOLoop
+        :return: seconds taken by the cycle
+        """
+        started = time.time()
+        try:
+            yield self.executor.submit(self.db_store.collect)
+        except Exception as exception:
+            logging.warn("Failed to refresh datasets error(%s):", str(exception))
+        elapsed = time.time() - started
+        logging.debug("Dataset refresh took %.3f seconds", elapsed)
+        raise gen.Return(elapsed)
+
+    @gen.coroutine
+    def run(self):
+        """
+        Refresh loop, sleeps for whatever is left of the sync period after each cycle
+        :return: None
+        """
+        while self.running:
+            elapsed = yield self.refresh()
+            yield gen.sleep(max(self.sync_period / 1000.0 - elapsed, 0))
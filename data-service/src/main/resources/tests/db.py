@@ -13,14 +13,20 @@
    ANY KIND, either express or implied.
    Purpose: API Handler tests
 """
+import posixpath
+
+from pyhdfs import FileStatus
+
 from main.resources.dataservice import DBSCHEMA
 from main.resources.dataservice import DATASET
+from main.resources.dataservice import DatasetCatalog
 
 
 class TestDB(object):
     repo_path = "test"
     data = ""
     delete = ""
+    fail_writes = False
 
     def write_dataset(self, data):
         """
@@ -29,20 +35,77 @@ class TestDB(object):
         :return: None
         """
         print data
+        if self.fail_writes:
+            return False
         self.data = {DBSCHEMA.PATH: data[DATASET.PATH], DBSCHEMA.POLICY: data[DATASET.POLICY],
                      DBSCHEMA.MODE: data[DATASET.MODE], DBSCHEMA.RETENTION: data[DATASET.RETENTION]}
+        self.catalog = self.catalog.replace([data], self.catalog.version + 1)
+        return True
 
-    def read_datasets(self):
+    def write_datasets(self, datasets):
+        if self.fail_writes:
+            return False
+        self.batches.append(datasets)
+        self.catalog = self.catalog.replace(datasets, self.catalog.version + 1)
+        return True
+
+    def __init__(self):
+        self.batches = list()
         item1 = {"id": 'test', 'policy': 'age', 'path': 'repo', 'mode': 'archive', "retention": '2'}
         item2 = {"id": 'test2', 'policy': 'age', 'path': 'repo', 'mode': 'archive', "retention":
                  '3'}
         item3 = {"id": 'test3', 'policy': 'age', 'path': 'repo', 'mode': 'archive', "retention":
                  '4'}
-        items = list()
-        items.append(item1)
-        items.append(item2)
-        items.append(item3)
-        return items
+        self.catalog = DatasetCatalog([item1, item2, item3])
+
+    def read_datasets(self):
+        return self.catalog.datasets
+
+    def read_dataset(self, dataset_id):
+        return self.catalog.get(dataset_id)
+
+    def find_datasets(self, policy=None, mode=None):
+        return self.catalog.find(policy=policy, mode=mode)
+
+    def page_datasets(self, **kwargs):
+        return self.catalog.page(**kwargs)
+
+    def read_partitions(self, data_path):
+        return [data_path + '/year=2016', data_path + '/year=2017']
+
+    def partitions_age(self, data_path):
+        # pylint: disable=unused-argument
+        return 12.5
 
     def delete_dataset(self, data):
         self.delete = data
+
+
+class FakeHdfs(object):
+    """
+    In memory HDFS tree, directories are dicts and files are sizes
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.mtimes = dict()
+        self.listed = list()
+
+    def node(self, path):
+        node = self.tree
+        for part in [p for p in path.split('/') if p]:
+            node = node[part]
+        return node
+
+    def touch(self, path, mtime):
+        self.mtimes[path] = mtime
+
+    def list_status(self, path):
+        self.listed.append(path)
+        statuses = list()
+        for name, value in sorted(self.node(path).items()):
+            child = posixpath.join(path, name)
+            file_type = 'DIRECTORY' if isinstance(value, dict) else 'FILE'
+            statuses.append(FileStatus(pathSuffix=name, type=file_type,
+                                       modificationTime=self.mtimes.get(child, 0),
+                                       length=0 if file_type == 'DIRECTORY' else value))
+        return statuses
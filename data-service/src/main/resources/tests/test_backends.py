@@ -0,0 +1,109 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for the local storage backend
+"""
+
+from unittest import TestCase
+
+from pyhdfs import HdfsFileNotFoundException
+
+from ..dataservice import HDBDataStore
+from ..dataservice.backends import LocalBackend
+from ..dataservice.backends import SQLiteConnectionPool
+from ..dataservice.backends import SQLiteDatabase
+from ..dataservice.backends import SyntheticHdfs
+
+REPO = '/user/pnda/datasets'
+
+
+class TestSQLiteTable(TestCase):
+    def get_table(self):
+        pool = SQLiteConnectionPool(SQLiteDatabase())
+        with pool.connection() as connection:
+            connection.create_table('platform_datasets', {'cf': dict()})
+            self.assertEqual(connection.tables(), ['platform_datasets'])
+            return connection.table('platform_datasets')
+
+    def test_scan_in_batches(self):
+        table = self.get_table()
+        with table.batch(batch_size=2) as batch:
+            for i in range(5):
+                batch.put('ds%d' % i, {'cf:path': 'p%d' % i, 'cf:policy': 'age'})
+        table.put('~version', {'cf:other': 'x'})
+        rows = list(table.scan(columns=['cf:path', 'cf:policy'], batch_size=2))
+        self.assertEqual([row for row, _ in rows], ['ds0', 'ds1', 'ds2', 'ds3', 'ds4'])
+        self.assertEqual(rows[3][1], {'cf:path': 'p3', 'cf:policy': 'age'})
+        self.assertEqual(len(list(table.scan(limit=3, batch_size=2))), 3)
+        table.delete('ds0')
+        self.assertEqual(list(table.scan(columns=['cf:path']))[0][0], 'ds1')
+
+    def test_counter(self):
+        table = self.get_table()
+        self.assertEqual(table.counter_get('~version', 'cf:version'), 0)
+        self.assertEqual(table.counter_inc('~version', 'cf:version'), 1)
+        self.assertEqual(table.counter_inc('~version', 'cf:version', 2), 3)
+        self.assertEqual(table.counter_get('~version', 'cf:version'), 3)
+
+
+class TestSyntheticHdfs(TestCase):
+    def test_tree(self):
+        hdfs = SyntheticHdfs(REPO, datasets=3, days=2, hours=3, files=2)
+        self.assertEqual(hdfs.partitions(), 3 * 12 * 2 * 3)
+        self.assertEqual([status.pathSuffix for status in hdfs.list_status(REPO)],
+                         ['source=ds0', 'source=ds1', 'source=ds2'])
+        hours = hdfs.list_status(REPO + '/source=ds1/year=2016/month=02/day=02')
+        self.assertEqual([status.pathSuffix for status in hours],
+                         ['hour=00', 'hour=01', 'hour=02'])
+        # modification time is the end of the partition
+        self.assertEqual(hours[0].modificationTime, 1454374800000)
+        files = hdfs.list_status(REPO + '/source=ds1/year=2016/month=02/day=02/hour=02')
+        self.assertEqual([(status.type, status.length) for status in files],
+                         [('FILE', 64 * 1024 * 1024)] * 2)
+        self.assertEqual(hdfs.metrics.snapshot()['LISTSTATUS']['count'], 3)
+
+    def test_walk(self):
+        hdfs = SyntheticHdfs(REPO, datasets=2, days=1, hours=2, files=1)
+        leaves = [root for root, dirs, _ in hdfs.walk(REPO + '/source=ds0') if not dirs]
+        self.assertEqual(len(leaves), 12 * 2)
+        self.assertEqual(leaves[-1], REPO + '/source=ds0/year=2016/month=12/day=01/hour=01')
+
+    def test_missing(self):
+        hdfs = SyntheticHdfs(REPO, datasets=2, days=1, hours=2)
+        for path in (REPO + '/topics', REPO + '/source=ds2', '/other',
+                     REPO + '/source=ds0/year=2016/month=13',
+                     REPO + '/source=ds0/year=2016/month=01/day=01/hour=00/part-00000'):
+            self.assertRaises(HdfsFileNotFoundException, hdfs.list_status, path)
+        self.assertEqual(hdfs.metrics.snapshot()['LISTSTATUS']['errors'], 5)
+
+
+class TestLocalBackend(TestCase):
+    def test_collect(self):
+        backend = LocalBackend(REPO, 'platform_datasets', datasets=4, days=1, hours=2)
+        # bypass the singleton, the other tests share its instance
+        store = type.__call__(HDBDataStore, 'localhost', 'localhost', 9090,
+                              'platform_datasets', REPO, hbase_change_detection=True,
+                              backend=backend)
+        self.assertTrue(store.ensure_table())
+        store.collect()
+        datasets = sorted(store.catalog.find(), key=lambda item: item['id'])
+        self.assertEqual([item['id'] for item in datasets], ['ds0', 'ds1', 'ds2', 'ds3'])
+        self.assertEqual(datasets[1]['policy'], 'age')
+        self.assertEqual(datasets[1]['max_age_days'], 30)
+        self.assertEqual(datasets[0]['max_size_gigabytes'], 100)
+        self.assertEqual(len(store.read_partitions(datasets[0]['path'])), 12 * 2)
+        updated = dict(datasets[0], policy='age', retention='7')
+        self.assertTrue(store.write_dataset(updated))
+        # the write bumped the table version, so the next collection scans again
+        store.collect()
+        self.assertEqual(store.catalog.get('ds0')['max_age_days'], 7)
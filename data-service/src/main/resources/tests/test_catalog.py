@@ -0,0 +1,107 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for dataset catalog
+"""
+
+from unittest import TestCase
+
+from ..dataservice import DatasetCatalog
+
+
+def get_samples():
+    items = list()
+    items.append({"id": 'test', 'policy': 'age', 'path': 'repo', 'mode': 'archive'})
+    items.append({"id": 'test2', 'policy': 'size', 'path': 'repo', 'mode': 'delete'})
+    items.append({"id": 'test3', 'policy': 'age', 'path': 'repo', 'mode': 'delete'})
+    items.append({"id": 'test4', 'policy': 'size', 'path': 'repo', 'mode': 'keep'})
+    return items
+
+
+class TestCatalog(TestCase):
+    def test_get(self):
+        catalog = DatasetCatalog(get_samples())
+        self.assertEqual(catalog.get('test3')['policy'], 'age')
+        self.assertIsNone(catalog.get('redbull'))
+        self.assertTrue('test2' in catalog)
+        self.assertEqual(len(catalog), 4)
+
+    def test_find(self):
+        catalog = DatasetCatalog(get_samples())
+        self.assertEqual(catalog.find(), get_samples())
+        self.assertEqual([i['id'] for i in catalog.find(policy='age')], ['test', 'test3'])
+        self.assertEqual([i['id'] for i in catalog.find(mode='delete')], ['test2', 'test3'])
+        self.assertEqual([i['id'] for i in catalog.find(policy='size', mode='delete')], ['test2'])
+        self.assertEqual(catalog.find(policy='age', mode='keep'), [])
+        self.assertEqual(catalog.find(mode='invalid'), [])
+
+    def test_replace(self):
+        catalog = DatasetCatalog(get_samples(), version=3)
+        updated = catalog.replace([{"id": 'test2', 'policy': 'age', 'path': 'repo',
+                                    'mode': 'keep'},
+                                   {"id": 'test5', 'policy': 'size', 'path': 'repo',
+                                    'mode': 'keep'}], version=4)
+        self.assertEqual(updated.version, 4)
+        self.assertEqual([i['id'] for i in updated.datasets],
+                         ['test', 'test2', 'test3', 'test4', 'test5'])
+        self.assertEqual([i['id'] for i in updated.find(policy='age')], ['test', 'test2', 'test3'])
+        self.assertEqual(catalog.get('test2')['policy'], 'size')
+        self.assertIsNone(catalog.get('test5'))
+
+    def test_empty(self):
+        catalog = DatasetCatalog()
+        self.assertEqual(catalog.datasets, [])
+        self.assertIsNone(catalog.get('test'))
+
+    def test_page(self):
+        catalog = DatasetCatalog(list(reversed(get_samples())))
+        page, cursor = catalog.page(limit=3)
+        self.assertEqual([i['id'] for i in page], ['test', 'test2', 'test3'])
+        self.assertEqual(cursor, 'test3')
+        page, cursor = catalog.page(limit=3, cursor=cursor)
+        self.assertEqual([i['id'] for i in page], ['test4'])
+        self.assertIsNone(cursor)
+        page, cursor = catalog.page(limit=2, cursor='test4')
+        self.assertEqual(page, [])
+        self.assertIsNone(cursor)
+
+    def test_page_filtered(self):
+        catalog = DatasetCatalog(get_samples())
+        page, cursor = catalog.page(policy='size', limit=1)
+        self.assertEqual([i['id'] for i in page], ['test2'])
+        self.assertEqual(cursor, 'test2')
+        page, cursor = catalog.page(policy='size', limit=1, cursor=cursor)
+        self.assertEqual([i['id'] for i in page], ['test4'])
+        self.assertIsNone(cursor)
+        page, _ = catalog.page(policy='age', mode='delete')
+        self.assertEqual([i['id'] for i in page], ['test3'])
+        page, cursor = catalog.page(policy='size', mode='keep', cursor='test2')
+        self.assertEqual([i['id'] for i in page], ['test4'])
+        self.assertEqual(catalog.page(policy='keep', mode='delete'), ([], None))
+
+    def test_page_prefix(self):
+        samples = get_samples()
+        samples.append({"id": 'other', 'policy': 'age', 'path': 'repo', 'mode': 'keep'})
+        samples.append({"id": 'zoo', 'policy': 'age', 'path': 'repo', 'mode': 'keep'})
+        catalog = DatasetCatalog(samples)
+        page, cursor = catalog.page(prefix='test')
+        self.assertEqual([i['id'] for i in page], ['test', 'test2', 'test3', 'test4'])
+        self.assertIsNone(cursor)
+        page, cursor = catalog.page(prefix='test', limit=4)
+        self.assertIsNone(cursor)
+        page, cursor = catalog.page(prefix='test', limit=2)
+        self.assertEqual([i['id'] for i in page], ['test', 'test2'])
+        self.assertEqual(cursor, 'test2')
+        page, cursor = catalog.page(prefix='missing')
+        self.assertEqual(page, [])
+        self.assertIsNone(cursor)
@@ -20,7 +20,9 @@ from unittest import TestCase
 import mock as mock
 from mock import Mock
 from mock import MagicMock
+from ..dataservice import DatasetCatalog
 from ..dataservice import HDBDataStore
+from ..dataservice.hdb import merge_datasets
 
 
 def get_repo_samples1():
@@ -162,3 +164,162 @@ class TestHDB(TestCase):
         db1.write_dataset(sample_data)
         table.put.assert_called_once_with('test', {'cf:mode': 'archive', 'cf:policy': 'age',
                                                    'cf:path': 'repo', 'cf:retention': '222'})
+
+    @mock.patch('happybase.ConnectionPool')
+    def test_collect_skips_overlapping_refresh(self, hbase):
+        # pylint: disable=unused-argument
+        db1 = self.get_hdb()
+        db1.read_data_from_repo = Mock(return_value=get_repo_samples1())
+        db1.retrieve_datasets_from_hbase = Mock(return_value=get_repo_samples1())
+        db1.catalog = DatasetCatalog()
+        db1.collect_lock.acquire()
+        try:
+            self.assertFalse(db1.collect())
+        finally:
+            db1.collect_lock.release()
+        self.assertEqual(db1.read_datasets(), list())
+        self.assertFalse(db1.read_data_from_repo.called)
+        self.assertTrue(db1.collect())
+        self.assertEqual(db1.read_datasets(), get_repo_samples1())
+
+    @mock.patch('happybase.ConnectionPool')
+    def test_collect_swaps_snapshot(self, hbase):
+        # pylint: disable=unused-argument
+        db1 = self.get_hdb()
+        db1.read_data_from_repo = Mock(return_value=get_repo_samples1())
+        db1.retrieve_datasets_from_hbase = Mock(return_value=list())
+        db1.collect()
+        previous = db1.read_datasets()
+        db1.read_data_from_repo = Mock(return_value=get_repo_sample3())
+        db1.collect()
+        self.assertEqual(previous, get_repo_samples1())
+        self.assertIsNot(previous, db1.read_datasets())
+
+    def test_write_applies_to_catalog(self):
+        db1 = self.get_hdb()
+        db1.conn_pool = MagicMock(name="ConnectionPool")
+        db1.catalog = DatasetCatalog(get_repo_sample3())
+        version = db1.catalog.version
+        previous = db1.catalog
+        sample_data = {"id": 'test', 'policy': 'size', 'path': 'repo', 'retention': '222',
+                       'mode': "archive", 'max_size_gigabytes': 222}
+        self.assertTrue(db1.write_dataset(sample_data))
+        self.assertTrue(db1.catalog.version > version)
+        self.assertEqual(db1.read_dataset('test')['policy'], 'size')
+        self.assertNotIn('retention', db1.read_dataset('test'))
+        self.assertEqual(previous.get('test')['policy'], 'age')
+
+    def test_write_datasets_batched(self):
+        db1 = self.get_hdb()
+        _, table = self.get_hbase_table(db1)
+        batch = table.batch.return_value.__enter__.return_value
+        db1.catalog = DatasetCatalog(get_repo_sample3())
+        datasets = [{"id": 'test', 'policy': 'size', 'path': 'repo', 'retention': '10',
+                     'mode': "archive", 'max_size_gigabytes': 10},
+                    {"id": 'test2', 'policy': 'size', 'path': 'repo', 'mode': "delete"}]
+        self.assertTrue(db1.write_datasets(datasets))
+        table.batch.assert_called_once_with(batch_size=db1.write_batch_size)
+        self.assertEqual(batch.put.call_count, 2)
+        batch.put.assert_any_call('test', {'cf:mode': 'archive', 'cf:policy': 'size',
+                                           'cf:path': 'repo', 'cf:retention': '10'})
+        self.assertEqual(db1.read_dataset('test')['max_size_gigabytes'], 10)
+        self.assertEqual(db1.read_dataset('test2')['mode'], 'delete')
+
+    def test_failed_write_not_applied(self):
+        db1 = self.get_hdb()
+        db1.conn_pool = MagicMock(name="ConnectionPool")
+        db1.conn_pool.connection.side_effect = Exception("hbase down")
+        db1.catalog = DatasetCatalog(get_repo_sample3())
+        sample_data = {"id": 'test', 'policy': 'size', 'path': 'repo', 'retention': '222',
+                       'mode': "archive"}
+        self.assertFalse(db1.write_dataset(sample_data))
+        self.assertEqual(db1.read_dataset('test')['policy'], 'age')
+
+    @mock.patch('happybase.ConnectionPool')
+    def test_collect_keeps_newer_writes(self, hbase):
+        # pylint: disable=unused-argument
+        db1 = self.get_hdb()
+        db1.conn_pool = MagicMock(name="ConnectionPool")
+        written = {"id": 'test2', 'policy': 'age', 'path': 'repo', 'mode': "delete",
+                   'retention': '5'}
+
+        def scan_racing_write():
+            # the write lands in HBase after the scan read the row
+            rows = get_repo_samples1()
+            db1.write_dataset(written)
+            return rows
+
+        db1.read_data_from_repo = Mock(return_value=get_repo_samples1())
+        db1.retrieve_datasets_from_hbase = Mock(side_effect=scan_racing_write)
+        db1.collect()
+        self.assertEqual(db1.read_dataset('test2')['mode'], 'delete')
+        # the next scan reads the write from HBase
+        db1.retrieve_datasets_from_hbase = Mock(return_value=get_repo_samples1())
+        db1.collect()
+        self.assertEqual(db1.read_dataset('test2')['policy'], 'keep')
+
+    def get_hbase_table(self, db1):
+        table = MagicMock()
+        table.scan.return_value = [(b'test', {b'cf:path': b'repo', b'cf:policy': b'age',
+                                              b'cf:mode': b'keep', b'cf:retention': b'30'})]
+        table.counter_get.return_value = 4
+        connection = MagicMock()
+        connection.tables.return_value = [b'platform_datasets']
+        connection.table.return_value = table
+        db1.conn_pool = MagicMock(name="ConnectionPool")
+        db1.conn_pool.connection.return_value.__enter__.return_value = connection
+        # the store is a singleton, other tests mock the method on the instance
+        vars(db1).pop('retrieve_datasets_from_hbase', None)
+        return connection, table
+
+    def test_retrieve_projected_scan(self):
+        db1 = self.get_hdb()
+        connection, table = self.get_hbase_table(db1)
+        db1.table_ready = False
+        db1.change_detection = False
+        expected = [{'id': 'test', 'path': 'repo', 'policy': 'age', 'mode': 'keep',
+                     'max_age_days': 30}]
+        self.assertEqual(db1.retrieve_datasets_from_hbase(), expected)
+        self.assertEqual(db1.retrieve_datasets_from_hbase(), expected)
+        self.assertEqual(connection.tables.call_count, 1)
+        self.assertEqual(table.scan.call_count, 2)
+        table.scan.assert_called_with(columns=[b'cf:path', b'cf:policy', b'cf:retention',
+                                               b'cf:mode'],
+                                      batch_size=db1.scan_batch_size)
+
+    def test_retrieve_unchanged_table(self):
+        db1 = self.get_hdb()
+        _, table = self.get_hbase_table(db1)
+        db1.change_detection = True
+        db1.hbase_datasets = None
+        first = db1.retrieve_datasets_from_hbase()
+        self.assertEqual(db1.retrieve_datasets_from_hbase(), first)
+        self.assertEqual(table.scan.call_count, 1)
+        table.counter_get.return_value = 5
+        self.assertEqual(db1.retrieve_datasets_from_hbase(), first)
+        self.assertEqual(table.scan.call_count, 2)
+        db1.change_detection = False
+
+    def test_merge_datasets_keyed(self):
+        hdfs = [{'id': 'hdfs%d' % i, 'policy': 'size', 'path': 'repo', 'mode': 'keep'}
+                for i in range(1000)]
+        hbase = [{'id': 'hdfs%d' % i, 'policy': 'age', 'path': 'repo', 'mode': 'archive'}
+                 for i in range(500, 1500)]
+        merged = merge_datasets(hbase, hdfs)
+        self.assertEqual(len(merged), 1500)
+        self.assertEqual([i['id'] for i in merged[:500]], ['hdfs%d' % i for i in range(500, 1000)])
+        self.assertTrue(all(i['policy'] == 'age' for i in merged[:500]))
+        self.assertTrue(all(i['mode'] == 'keep' for i in merged[500:1000]))
+        self.assertTrue(all(i['policy'] == 'integrity_error' for i in merged[1000:]))
+
+    @mock.patch('happybase.ConnectionPool')
+    def test_read_dataset_by_id(self, hbase):
+        # pylint: disable=unused-argument
+        db1 = self.get_hdb()
+        db1.read_data_from_repo = Mock(return_value=get_repo_samples1())
+        db1.retrieve_datasets_from_hbase = Mock(return_value=get_repo_sample3())
+        db1.collect()
+        self.assertEqual(db1.read_dataset('test2')['policy'], 'size')
+        self.assertEqual(db1.read_dataset('test5')['policy'], 'integrity_error')
+        self.assertIsNone(db1.read_dataset('redbull'))
+        self.assertEqual([i['id'] for i in db1.find_datasets(policy='keep')], ['test3'])
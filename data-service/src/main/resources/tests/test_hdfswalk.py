@@ -0,0 +1,149 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for HDFS walk helpers
+"""
+
+import filecmp
+import os
+import threading
+import time
+from unittest import TestCase
+
+from ..dataservice.hdfswalk import dirwalk
+from ..dataservice.hdfswalk import HdfsEntry
+from ..dataservice.hdfswalk import ParallelWalker
+from ..dataservice.hdfswalk import walk_order
+from .db import FakeHdfs
+
+
+def get_tree():
+    return {'data': {'year=2016': {'month=01': {'f1': 10, 'f2': 20}}, 'year=2017': {}, 'f3': 5}}
+
+
+class TestDirwalk(TestCase):
+    def test_typed_entries(self):
+        client = FakeHdfs(get_tree())
+        client.touch('/data/year=2016/month=01/f2', 42)
+        entries = list(dirwalk(client, '/data'))
+        self.assertEqual([entry.path for entry in entries],
+                         ['/data/f3', '/data/year=2016', '/data/year=2016/month=01',
+                          '/data/year=2016/month=01/f1', '/data/year=2016/month=01/f2',
+                          '/data/year=2017'])
+        self.assertEqual(entries[4], HdfsEntry('/data/year=2016/month=01/f2', 'FILE', 20, 42))
+        self.assertEqual(entries[1].type, 'DIRECTORY')
+
+    def test_one_listing_per_directory(self):
+        client = FakeHdfs(get_tree())
+        list(dirwalk(client, '/data'))
+        self.assertEqual(sorted(client.listed), ['/data', '/data/year=2016',
+                                                 '/data/year=2016/month=01', '/data/year=2017'])
+
+
+class SlowHdfs(FakeHdfs):
+    """
+    Fake HDFS that tracks how many listings run at the same time
+    """
+    def __init__(self, tree):
+        super(SlowHdfs, self).__init__(tree)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def list_status(self, path):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        try:
+            return super(SlowHdfs, self).list_status(path)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def get_wide_tree():
+    return {'data': dict(('day=%02d' % day, dict(('hour=%02d' % hour, {'f': 1})
+                                                 for hour in range(4)))
+                         for day in range(8))}
+
+
+class TestParallelWalker(TestCase):
+    def test_topdown_parent_first(self):
+        walker = ParallelWalker(FakeHdfs(get_tree()), max_workers=4)
+        seen = list()
+        for dir_path, dirs, files in walker.walk('/data'):
+            if dir_path != '/data':
+                self.assertIn(dir_path.rsplit('/', 1)[0], seen)
+            seen.append(dir_path)
+            if dir_path == '/data':
+                self.assertEqual([entry.path for entry in files], ['/data/f3'])
+                self.assertEqual(len(dirs), 2)
+        walker.shutdown()
+        self.assertEqual(sorted(seen), ['/data', '/data/year=2016', '/data/year=2016/month=01',
+                                        '/data/year=2017'])
+        self.assertEqual(walker.level_timings[1][0], 2)
+
+    def test_bottom_up(self):
+        walker = ParallelWalker(FakeHdfs(get_tree()), max_workers=4)
+        seen = [dir_path for dir_path, _, _ in walker.walk('/data', topdown=False)]
+        walker.shutdown()
+        self.assertEqual(seen, ['/data/year=2016/month=01', '/data/year=2016',
+                                '/data/year=2017', '/data'])
+
+    def test_bottom_up_streams(self):
+        client = FakeHdfs(get_wide_tree())
+        walker = ParallelWalker(client, max_workers=2, lookahead=4)
+        walk = walker.walk('/data', topdown=False)
+        self.assertEqual(next(walk)[0], '/data/day=00/hour=00')
+        # the first subtree is yielded before the rest of the tree is listed
+        self.assertTrue(len(client.listed) < 1 + 8 + 32)
+        seen = ['/data/day=00/hour=00'] + [dir_path for dir_path, _, _ in walk]
+        walker.shutdown()
+        self.assertEqual(len(seen), 1 + 8 + 32)
+        self.assertEqual(seen[4:6], ['/data/day=00', '/data/day=01/hour=00'])
+        self.assertEqual(seen, sorted(seen, key=walk_order))
+
+    def test_descend(self):
+        client = FakeHdfs(get_tree())
+        walker = ParallelWalker(client, max_workers=2)
+        seen = [dir_path for dir_path, _, _ in
+                walker.walk('/data', topdown=False,
+                            descend=lambda entry: not entry.path.endswith('year=2016'))]
+        walker.shutdown()
+        self.assertEqual(seen, ['/data/year=2017', '/data'])
+        self.assertEqual(sorted(client.listed), ['/data', '/data/year=2017'])
+
+    def test_in_flight_cap(self):
+        client = SlowHdfs(get_wide_tree())
+        walker = ParallelWalker(client, max_workers=8, max_in_flight=3)
+        listed = list(walker.walk('/data'))
+        walker.shutdown()
+        self.assertEqual(len(listed), 1 + 8 + 32)
+        self.assertTrue(1 < client.max_active <= 3)
+
+    def test_copies_match(self):
+        # hdfs-cleaner is packaged separately and holds its own copy
+        resources = os.path.join(os.path.dirname(__file__), '..')
+        self.assertTrue(filecmp.cmp(
+            os.path.join(resources, 'dataservice', 'hdfswalk.py'),
+            os.path.join(resources, '..', '..', '..', '..', 'hdfs-cleaner', 'src', 'main',
+                         'resources', 'hdfswalk.py'), shallow=False))
+
+    def test_onerror(self):
+        errors = list()
+        walker = ParallelWalker(FakeHdfs(get_tree()), max_workers=2)
+        listed = list(walker.walk('/missing', onerror=errors.append))
+        walker.shutdown()
+        self.assertEqual(listed, [])
+        self.assertEqual(len(errors), 1)
@@ -0,0 +1,67 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for service metrics
+"""
+
+from unittest import TestCase
+
+from ..dataservice.metrics import Counter
+from ..dataservice.metrics import Gauge
+from ..dataservice.metrics import Histogram
+from ..dataservice.metrics import MetricsRegistry
+from ..dataservice.metrics import RequestMetricsCollector
+from ..dataservice.webhdfs import RequestMetrics
+
+
+class TestMetricsRegistry(TestCase):
+    def test_render(self):
+        registry = MetricsRegistry()
+        calls = registry.register(Counter('calls_total', 'Calls'))
+        stages = registry.register(Histogram('stage_seconds', 'Stages', buckets=(0.1, 1.0)))
+        registry.register(Gauge('queue_depth', 'Queue', lambda: [({'executor': 'a'}, 3)]))
+        registry.register(Gauge('age_seconds', 'Age', lambda: None))
+        calls.inc(op='scan')
+        calls.inc(2, op='scan')
+        stages.observe(0.5, stage='collect')
+        stages.observe(2.0, stage='collect')
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE calls_total counter', lines)
+        self.assertIn('calls_total{op="scan"} 3.0', lines)
+        self.assertIn('stage_seconds_bucket{stage="collect",le="0.1"} 0.0', lines)
+        self.assertIn('stage_seconds_bucket{stage="collect",le="1.0"} 1.0', lines)
+        self.assertIn('stage_seconds_bucket{stage="collect",le="+Inf"} 2.0', lines)
+        self.assertIn('stage_seconds_sum{stage="collect"} 2.5', lines)
+        self.assertIn('stage_seconds_count{stage="collect"} 2.0', lines)
+        self.assertIn('queue_depth{executor="a"} 3.0', lines)
+        self.assertIn('# TYPE age_seconds gauge', lines)
+        self.assertFalse([line for line in lines if line.startswith('age_seconds')])
+
+    def test_timed(self):
+        stages = Histogram('stage_seconds', 'Stages')
+
+        @stages.timed(stage='read')
+        def read():
+            return 42
+        self.assertEqual(read(), 42)
+        self.assertEqual(stages.samples()[-1], ('stage_seconds_count', (('stage', 'read'),), 1))
+
+    def test_webhdfs_collector(self):
+        request_metrics = RequestMetrics(buckets=(1.0,))
+        request_metrics.observe('LISTSTATUS', 0.5, failed=True)
+        registry = MetricsRegistry()
+        registry.register(RequestMetricsCollector('webhdfs', request_metrics))
+        lines = registry.render().splitlines()
+        self.assertIn('webhdfs_requests_total{op="LISTSTATUS"} 1.0', lines)
+        self.assertIn('webhdfs_errors_total{op="LISTSTATUS"} 1.0', lines)
+        self.assertIn('webhdfs_request_seconds_bucket{op="LISTSTATUS",le="1.0"} 1.0', lines)
@@ -0,0 +1,91 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for partition index
+"""
+
+from unittest import TestCase
+
+from ..dataservice.hdfswalk import ParallelWalker
+from ..dataservice.partitions import PartitionIndex
+from .db import FakeHdfs
+
+
+def get_tree():
+    return {'data': {'source=x': {
+        'year=2016': {'month=01': {'f1': 10, 'f2': 10}, 'month=02': {'f3': 10}},
+        'year=2017': {'month=01': {'f4': 10}, 'month=02': {}}}}}
+
+
+class TestPartitionIndex(TestCase):
+    def test_build(self):
+        client = FakeHdfs(get_tree())
+        index = PartitionIndex(client, '/data/source=x')
+        self.assertTrue(index.update(60, 3600))
+        self.assertEqual(index.partitions, ['/data/source=x/year=2016/month=01',
+                                            '/data/source=x/year=2016/month=02',
+                                            '/data/source=x/year=2017/month=01'])
+        self.assertEqual(len(client.listed), 7)
+        self.assertTrue(index.age() >= 0)
+
+    def test_served_from_memory_within_ttl(self):
+        client = FakeHdfs(get_tree())
+        index = PartitionIndex(client, '/data/source=x')
+        index.update(60, 3600)
+        listed = len(client.listed)
+        self.assertFalse(index.update(60, 3600))
+        self.assertEqual(len(client.listed), listed)
+
+    def test_incremental_refresh(self):
+        tree = get_tree()
+        client = FakeHdfs(tree)
+        index = PartitionIndex(client, '/data/source=x')
+        index.update(0, 3600)
+        del client.listed[:]
+        # new data lands in the newest partition
+        tree['data']['source=x']['year=2017']['month=02']['f5'] = 10
+        index.update(0, 3600)
+        self.assertIn('/data/source=x/year=2017/month=02', index.partitions)
+        # unchanged older branch is not listed again
+        self.assertNotIn('/data/source=x/year=2016', client.listed)
+        self.assertNotIn('/data/source=x/year=2016/month=01', client.listed)
+
+    def test_changed_directory_relisted(self):
+        tree = get_tree()
+        client = FakeHdfs(tree)
+        index = PartitionIndex(client, '/data/source=x')
+        index.update(0, 3600)
+        del tree['data']['source=x']['year=2016']['month=02']
+        client.touch('/data/source=x/year=2016', 1000)
+        index.update(0, 3600)
+        self.assertNotIn('/data/source=x/year=2016/month=02', index.partitions)
+        self.assertIn('/data/source=x/year=2016', client.listed)
+
+    def test_rebuild(self):
+        client = FakeHdfs(get_tree())
+        index = PartitionIndex(client, '/data/source=x')
+        index.update(0, 3600)
+        del client.listed[:]
+        index.update(0, 0)
+        self.assertEqual(len(client.listed), 7)
+
+    def test_build_with_walker(self):
+        client = FakeHdfs(get_tree())
+        walker = ParallelWalker(client, max_workers=4)
+        index = PartitionIndex(client, '/data/source=x', walker)
+        index.update(60, 3600)
+        walker.shutdown()
+        self.assertEqual(index.partitions, ['/data/source=x/year=2016/month=01',
+                                            '/data/source=x/year=2016/month=02',
+                                            '/data/source=x/year=2017/month=01'])
+        self.assertEqual(len(client.listed), 7)
@@ -0,0 +1,68 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for background dataset refresher
+"""
+
+import threading
+
+from mock import Mock
+from tornado import gen
+from tornado.testing import AsyncTestCase
+from tornado.testing import gen_test
+
+from ..dataservice import DatasetRefresher
+
+
+class TestRefresher(AsyncTestCase):
+    @gen_test
+    def test_refresh_runs_off_ioloop(self):
+        main_thread = threading.current_thread()
+        threads = list()
+        db_store = Mock()
+        db_store.collect = Mock(side_effect=lambda: threads.append(threading.current_thread()))
+        refresher = DatasetRefresher(db_store, 10)
+        yield refresher.refresh()
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], main_thread)
+
+    @gen_test
+    def test_refresh_survives_collect_error(self):
+        db_store = Mock()
+        db_store.collect = Mock(side_effect=Exception("hbase down"))
+        refresher = DatasetRefresher(db_store, 10)
+        elapsed = yield refresher.refresh()
+        self.assertTrue(elapsed >= 0)
+
+    @gen_test
+    def test_cycles_never_overlap(self):
+        state = dict(active=0, overlap=False, calls=0)
+        lock = threading.Lock()
+
+        def collect():
+            with lock:
+                state['active'] += 1
+                state['calls'] += 1
+                state['overlap'] = state['overlap'] or state['active'] > 1
+            threading.Event().wait(0.02)
+            with lock:
+                state['active'] -= 1
+
+        db_store = Mock()
+        db_store.collect = Mock(side_effect=collect)
+        refresher = DatasetRefresher(db_store, 1)
+        refresher.start()
+        yield gen.sleep(0.15)
+        refresher.stop()
+        self.assertTrue(state['calls'] > 1)
+        self.assertFalse(state['overlap'])
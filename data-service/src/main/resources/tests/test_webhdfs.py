@@ -0,0 +1,96 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for pooled WebHDFS client
+"""
+
+import filecmp
+import json
+import os
+from unittest import TestCase
+
+import requests
+from pyhdfs import HdfsFileNotFoundException
+
+from ..dataservice.webhdfs import PooledHdfsClient
+from ..dataservice.webhdfs import RequestMetrics
+from ..dataservice.webhdfs import pooled_session
+
+
+class FakeSession(object):
+    """
+    Session answering WebHDFS requests, failing over from hosts listed in down
+    """
+    def __init__(self, down=()):
+        self.down = down
+        self.requests = list()
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs['params']['op']))
+        if any(host in url for host in self.down):
+            raise requests.exceptions.ConnectionError()
+        response = requests.Response()
+        if kwargs['params']['op'] == 'GETFILESTATUS':
+            response.status_code = 404
+            response._content = json.dumps({'RemoteException': {
+                'exception': 'FileNotFoundException', 'javaClassName':
+                'java.io.FileNotFoundException', 'message': 'File does not exist'}})
+        else:
+            response.status_code = 200
+            response._content = json.dumps({'FileStatuses': {'FileStatus': []}})
+        return response
+
+
+class TestRequestMetrics(TestCase):
+    def test_histogram(self):
+        metrics = RequestMetrics(buckets=(0.1, 1.0))
+        metrics.observe('LISTSTATUS', 0.05)
+        metrics.observe('LISTSTATUS', 0.5)
+        metrics.observe('LISTSTATUS', 5.0, failed=True)
+        stats = metrics.snapshot()['LISTSTATUS']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['errors'], 1)
+        self.assertAlmostEqual(stats['seconds'], 5.55)
+        self.assertEqual(stats['buckets'], [(0.1, 1), (1.0, 2), (float('inf'), 3)])
+
+
+class TestPooledHdfsClient(TestCase):
+    def test_session_pool(self):
+        session = pooled_session(pool_size=12, max_retries=2)
+        adapter = session.get_adapter('http://namenode:50070')
+        self.assertEqual(adapter._pool_maxsize, 12)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertEqual(adapter.max_retries.connect, 0)
+
+    def test_metrics_and_failover(self):
+        session = FakeSession(down=('nn1',))
+        client = PooledHdfsClient('nn1:50070,nn2:50070', user_name='hdfs',
+                                  randomize_hosts=False, requests_session=session)
+        self.assertEqual(client.list_status('/data'), [])
+        self.assertEqual(client.list_status('/data'), [])
+        self.assertRaises(HdfsFileNotFoundException, client.get_file_status, '/missing')
+        # the active NameNode is tried first once known
+        self.assertEqual([url.split('/')[2] for _, url, _ in session.requests],
+                         ['nn1:50070', 'nn2:50070', 'nn2:50070', 'nn2:50070'])
+        stats = client.metrics.snapshot()
+        self.assertEqual(stats['LISTSTATUS']['count'], 2)
+        self.assertEqual(stats['LISTSTATUS']['errors'], 0)
+        self.assertEqual(stats['GETFILESTATUS']['errors'], 1)
+
+    def test_copies_match(self):
+        # hdfs-cleaner is packaged separately and holds its own copy
+        resources = os.path.join(os.path.dirname(__file__), '..')
+        self.assertTrue(filecmp.cmp(
+            os.path.join(resources, 'dataservice', 'webhdfs.py'),
+            os.path.join(resources, '..', '..', '..', '..', 'hdfs-cleaner', 'src', 'main',
+                         'resources', 'webhdfs.py'), shallow=False))
@@ -16,6 +16,7 @@
 
 import json
 import logging
+import threading
 import unittest
 
 from tornado.httputil import HTTPHeaders
@@ -26,6 +27,8 @@ from tornado_json.routes import get_routes
 
 from db import TestDB
 from main.resources import dataservice
+from main.resources.dataservice.api.dataservice import DataHandler
+from main.resources.dataservice.api.dataservice import configure_executors
 
 # Disable tornado access warnings
 
@@ -49,7 +52,8 @@ class TestServer(AsyncHTTPTestCase):
             hbase_thrift_port=9095,
             hdfs_host='192.168.33.10'
         )
-        return Application(routes=routes, settings=settings, db_conn=TestDB())
+        self.db = TestDB()
+        return Application(routes=routes, settings=settings, db_conn=self.db)
 
     def tearDown(self):
         super(TestServer, self).tearDown()
@@ -62,6 +66,77 @@ class ListHandler(TestServer):
         self.assertEqual(result.code, 200)
 
 
+    def test_list_paginated(self):
+        result = self.fetch("/api/v1/datasets?limit=2", method="GET")
+        self.assertEqual(result.code, 200)
+        self.assertEqual([i['id'] for i in json.loads(result.body)['data']], ['test', 'test2'])
+        cursor = result.headers['X-Next-Cursor']
+        result = self.fetch("/api/v1/datasets?limit=2&cursor=" + cursor, method="GET")
+        self.assertEqual([i['id'] for i in json.loads(result.body)['data']], ['test3'])
+        self.assertNotIn('X-Next-Cursor', result.headers)
+
+    def test_list_filtered_projection(self):
+        result = self.fetch("/api/v1/datasets?prefix=test&policy=age&fields=id,mode",
+                            method="GET")
+        self.assertEqual(result.code, 200)
+        data = json.loads(result.body)['data']
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0], {'id': 'test', 'mode': 'archive'})
+        result = self.fetch("/api/v1/datasets?mode=delete", method="GET")
+        self.assertEqual(json.loads(result.body)['data'], [])
+
+    def test_list_invalid_query(self):
+        result = self.fetch("/api/v1/datasets?limit=abc", method="GET")
+        self.assertEqual(result.code, 400)
+        result = self.fetch("/api/v1/datasets?limit=0", method="GET")
+        self.assertEqual(result.code, 400)
+        result = self.fetch("/api/v1/datasets?fields=secret", method="GET")
+        self.assertEqual(result.code, 400)
+
+    def test_bulk_update(self):
+        request_data = {'test': dict(policy='size', max_size_gigabytes=5),
+                        'test2': dict(mode='delete')}
+        result = self.fetch("/api/v1/datasets", method="PATCH", body=json.dumps(request_data),
+                            headers=HTTPHeaders({"content-type": "application/json"}))
+        self.assertEqual(result.code, 200)
+        self.assertEqual([i['id'] for i in json.loads(result.body)['data']], ['test', 'test2'])
+        self.assertEqual(len(self.db.batches), 1)
+        self.assertEqual(self.db.batches[0][0]['retention'], '5')
+        self.assertEqual(self.db.read_dataset('test')['policy'], 'size')
+        self.assertEqual(self.db.read_dataset('test2')['mode'], 'delete')
+
+    def test_bulk_update_invalid(self):
+        for request_data, code in [({'test': dict(policy='size'), 'test2': dict(mode='keep')}, 400),
+                                   ({'test': dict(mode='invalid')}, 400),
+                                   ({'redbull': dict(mode='keep')}, 404),
+                                   ({'test': dict(policy='age', max_age_days='7')}, 400),
+                                   ([dict(mode='keep')], 400)]:
+            result = self.fetch("/api/v1/datasets", method="PATCH",
+                                body=json.dumps(request_data),
+                                headers=HTTPHeaders({"content-type": "application/json"}))
+            self.assertEqual(result.code, code)
+        self.assertEqual(self.db.batches, [])
+        self.assertEqual(self.db.read_dataset('test2')['mode'], 'archive')
+
+    def test_bulk_update_integrity_error(self):
+        broken = {'id': 'test4', 'policy': 'integrity_error', 'path': 'repo', 'mode': 'archive'}
+        self.db.catalog = self.db.catalog.replace([broken], self.db.catalog.version + 1)
+        result = self.fetch("/api/v1/datasets", method="PATCH",
+                            body=json.dumps({'test4': dict(mode='delete')}),
+                            headers=HTTPHeaders({"content-type": "application/json"}))
+        self.assertEqual(result.code, 200)
+        self.assertEqual(self.db.read_dataset('test4')['mode'], 'delete')
+        self.assertEqual(self.db.read_dataset('test4')['policy'], 'integrity_error')
+
+
+class PartitionsHandler(TestServer):
+    def test_get_partitions(self):
+        result = self.fetch("/api/v1/datasets/test2/partitions", method="GET")
+        self.assertEqual(result.code, 200)
+        self.assertEqual(json.loads(result.body)['data'], ['repo/year=2016', 'repo/year=2017'])
+        self.assertEqual(result.headers['X-Partitions-Age'], '12.500')
+
+
 class UpdateHandler(TestServer):
     def test_get_dataset(self):
         result = self.fetch("/api/v1/datasets/test3", method="GET")
@@ -140,5 +215,52 @@ class UpdateHandler(TestServer):
                             headers=HTTPHeaders({"content-type": "application/json"}))
         self.assertNotEqual(result.code, 200)
 
+    def test_put_read_your_writes(self):
+        request_data = dict(policy="size", max_size_gigabytes=20)
+        result = self.fetch("/api/v1/datasets/test3", method="PUT", body=json.dumps(request_data),
+                            headers=HTTPHeaders({"content-type": "application/json"}))
+        self.assertEqual(result.code, 200)
+        result = self.fetch("/api/v1/datasets/test3", method="GET")
+        self.assertEqual(json.loads(result.body)['data']['policy'], 'size')
+        self.assertEqual(json.loads(result.body)['data']['max_size_gigabytes'], 20)
+
+    def test_put_write_failure(self):
+        self.db.fail_writes = True
+        request_data = dict(mode='keep')
+        result = self.fetch("/api/v1/datasets/test3", method="PUT", body=json.dumps(request_data),
+                            headers=HTTPHeaders({"content-type": "application/json"}))
+        self.assertEqual(result.code, 503)
+        self.assertEqual(self.db.read_dataset('test3')['mode'], 'archive')
+
+
+class ExecutorLanes(TestServer):
+    def test_writes_not_queued_behind_walks(self):
+        configure_executors(hdfs_workers=1, hbase_workers=1)
+        release = threading.Event()
+        try:
+            # occupy the only HDFS lane thread
+            DataHandler.hdfs_executor.submit(release.wait, 5)
+            request_data = dict(mode='keep')
+            result = self.fetch("/api/v1/datasets/test3", method="PUT",
+                                body=json.dumps(request_data),
+                                headers=HTTPHeaders({"content-type": "application/json"}))
+            self.assertEqual(result.code, 200)
+            self.assertFalse(release.is_set())
+        finally:
+            release.set()
+            configure_executors()
+
+
+class MetricsHandler(TestServer):
+    def test_metrics(self):
+        self.fetch("/api/v1/datasets", method="GET")
+        result = self.fetch("/metrics", method="GET")
+        self.assertEqual(result.code, 200)
+        self.assertTrue(result.headers['Content-Type'].startswith('text/plain'))
+        self.assertIn('dataservice_requests_total{code="200",method="GET",route="ListDatasets"}',
+                      result.body)
+        self.assertIn('dataservice_executor_queue_depth{executor="hbase"} 0.0', result.body)
+        self.assertIn('dataservice_executor_queue_depth{executor="hdfs"} 0.0', result.body)
+
 if __name__ == "__main__":
     unittest.main()
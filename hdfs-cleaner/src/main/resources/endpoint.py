@@ -13,6 +13,8 @@
    ANY KIND, either express or implied.
    Purpose: Discover API endpoints of a cluster.
 """
+import logging
+
 import requests
 
 from cm_api.api_client import ApiResource
@@ -118,6 +120,12 @@ class Cloudera(Platform):
                         hbase_host = '%s' % api.get_host(role.hostRef.hostId).hostname
                         endpoints['HBASE'] = Endpoint("HBASE", hbase_host)
                         break
+            elif service.type == "YARN":
+                for role in service.get_all_roles():
+                    if role.type == "RESOURCEMANAGER":
+                        rm_host = '%s:8088' % api.get_host(role.hostRef.hostId).hostname
+                        endpoints['YARN'] = Endpoint("YARN", rm_host)
+                        break
         return endpoints
 
 class Hortonworks(Platform):
@@ -160,6 +168,17 @@ class Hortonworks(Platform):
                                                 % (cluster_name, "HBASE", "HBASE_MASTER"))
         endpoints['HBASE'] = Endpoint("HBASE", self._component_host(hbase_components))
 
+        # YARN is optional, without it the Spark application check is skipped
+        try:
+            rm_components = self._ambari_request(ambari, '/clusters/%s/services/%s/components/%s'
+                                                 % (cluster_name, "YARN", "RESOURCEMANAGER"))
+            rm_host = self._component_host(rm_components)
+        except (KeyError, ValueError) as exception:
+            logging.warn("ResourceManager not found on %s error(%s)", cluster_name, str(exception))
+            rm_host = ''
+        if rm_host:
+            endpoints['YARN'] = Endpoint("YARN", "%s:8088" % rm_host)
+
         return endpoints
 
 class Local(Platform):
@@ -168,5 +187,6 @@ class Local(Platform):
     """
     def discover(self, properties):
         endpoints = {"HDFS": Endpoint("HDFS", "192.168.33.10:50070"),
-                     'HBASE': Endpoint("HBASE", "192.168.33.10")}
+                     'HBASE': Endpoint("HBASE", "192.168.33.10"),
+                     'YARN': Endpoint("YARN", "192.168.33.10:8088")}
         return endpoints
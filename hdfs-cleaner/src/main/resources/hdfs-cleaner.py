@@ -14,6 +14,11 @@
    Purpose: Run jobs periodically to clean log files and manage datasets as per policy
 """
 
+import argparse
+import calendar
+import datetime
+import heapq
+import inspect
 import json
 import logging
 from logging.config import fileConfig
@@ -21,19 +26,45 @@ import os
 import posixpath as path
 import re
 import subprocess
+import threading
 import time
 import traceback
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import partial
 from functools import wraps
 
 import happybase
 import swiftclient
-from pyhdfs import HdfsClient, HdfsFileNotFoundException
+from pyhdfs import HdfsException, HdfsFileNotFoundException
 import boto.s3
+import requests
+from concurrent.futures import ThreadPoolExecutor
 
 from endpoint import Platform
+from hdfswalk import ParallelWalker
+from hdfswalk import walk_order
+from webhdfs import PooledHdfsClient
 
 NEG_SIZE = 2
+ARCHIVE_BATCH_SIZE = 10000
+ARCHIVE_LIST_DIR = '/tmp/hdfs-cleaner'
+MAX_CONCURRENT_JOBS = 4
+PLAN_BATCH_SIZE = 1000
+CHECKPOINT_INTERVAL = 60
+WATERMARK_FULL_SCAN_PERIOD = 7 * 24 * 3600
+PARTITION_KEYS = ('year', 'month', 'day', 'hour')
+YARN_ACTIVE_STATES = ('NEW', 'NEW_SAVING', 'SUBMITTED', 'ACCEPTED', 'RUNNING')
+MAX_CONCURRENT_OPERATIONS = 16
+HDFS_WALK_WORKERS = 8
+HDFS_WALK_MAX_REQUESTS = 8
+HBASE_SCAN_BATCH_SIZE = 1000
+HBASE_COLUMNS = ['cf:path', 'cf:policy', 'cf:retention', 'cf:mode']
+TELEMETRY_PREFIX = 'hdfs_cleaner'
+# counter of an applied plan action
+PLAN_ACTION_COUNTERS = {'delete': 'files_deleted', 'delete_tree': 'subtrees_deleted',
+                        'delete_dir': 'directories_removed'}
 FNULL = open(os.devnull, 'w')
 
 
@@ -45,32 +76,374 @@ def delete(hdfs, file_path):
     :return:
     """
     logging.debug("Delete HDFS File:%s", file_path)
-    hdfs.delete(file_path)
+    with TELEMETRY.stage('delete'):
+        hdfs.delete(file_path)
+    TELEMETRY.count('files_deleted')
 
 
-def archive(container_path, hdfs, file_path):
+def archive(container_path, hdfs, file_path, shell=subprocess):
     """
     Archive contents of file onto swift container
     :param container_path:
     :param hdfs:
     :param file_path:
-    :return:
+    :param shell: subprocess module, or a Throttle over it
+    :return: list holding file_path if it failed to archive
     """
     logging.info("Archive file onto swift container %s", file_path)
     archive_path = container_path
     try:
         file_date = re.findall(r"=(\w*)", file_path)
-        if file_date:
-            subprocess.call(['hdfs', 'dfs', '-mkdir', '-p', container_path + '/' + file_date[0]], stderr=FNULL)
-            archive_path = path.join(container_path, file_date[0], '-'.join(file_date) + '-' + path.basename(file_path))
-        logging.info("swift archive path %s", archive_path)
-        subprocess.check_output(['hdfs', 'dfs', '-cp', file_path, archive_path])
+        with TELEMETRY.stage('archive'):
+            if file_date:
+                shell.call(['hdfs', 'dfs', '-mkdir', '-p', container_path + '/' + file_date[0]], stderr=FNULL)
+                archive_path = path.join(container_path, file_date[0], '-'.join(file_date) + '-' + path.basename(file_path))
+            logging.info("swift archive path %s", archive_path)
+            shell.check_output(['hdfs', 'dfs', '-cp', file_path, archive_path])
+        TELEMETRY.count('files_archived')
         delete(hdfs, file_path)
     except subprocess.CalledProcessError as cpe:
         logging.error('CPE:failed to archive {%s} with following error{%s}', file_path, str(cpe))
+        return [file_path]
     except ValueError as value_error:
         logging.error('VE:failed to archive {%s} with following error{%s}', file_path,
                       str(value_error))
+        return [file_path]
+    return []
+
+
+def archive_target_dir(container_path, file_path):
+    """
+    Directory of the archive container a file is copied to by batched archives.
+    Partition values found in the path are kept as source name and partition directory, e.g.
+    source=netflow/year=2019/month=01/f1 is archived as <container>/netflow/netflow-2019-01/f1
+    :param container_path: archive container path
+    :param file_path: file being archived
+    :return: target directory
+    """
+    file_date = re.findall(r"=(\w*)", file_path)
+    if not file_date:
+        return container_path
+    return path.join(container_path, file_date[0], '-'.join(file_date))
+
+
+class ArchiveBatch(object):
+    """
+    Archive command that copies files in bulk.
+    Files are grouped by target directory and each group is copied by a single DistCp job
+    reading its sources from a generated file list, instead of one 'hdfs dfs -cp' JVM per file.
+    Sources are deleted only once the DistCp job of their group succeeded, a source that
+    can't be deleted counts as failed to archive.
+    """
+
+    def __init__(self, container_path, hdfs, list_dir=ARCHIVE_LIST_DIR,
+                 batch_size=ARCHIVE_BATCH_SIZE, shell=subprocess):
+        """
+        :param container_path: archive container path
+        :param hdfs: hdfs instance
+        :param list_dir: HDFS directory for DistCp file lists
+        :param batch_size: maximum number of files copied by one DistCp job
+        :param shell: subprocess module, or a Throttle over it
+        """
+        self.container_path = container_path
+        self.hdfs = hdfs
+        self.shell = shell
+        self.list_dir = list_dir
+        self.batch_size = batch_size
+        self.groups = OrderedDict()
+
+    def __call__(self, file_path):
+        """
+        Queue a file, its group is copied once it holds batch_size files
+        :return: files of the group that failed to archive when it was copied
+        """
+        target_dir = archive_target_dir(self.container_path, file_path)
+        group = self.groups.setdefault(target_dir, list())
+        group.append(file_path)
+        if len(group) >= self.batch_size:
+            return self.flush([target_dir])
+        return []
+
+    def flush(self, target_dirs=None):
+        """
+        Copy pending groups to the archive container and delete their sources
+        :param target_dirs: groups to flush, all pending groups when None
+        :return: files of the groups that failed to archive
+        """
+        target_dirs = list(self.groups) if target_dirs is None else target_dirs
+        if not target_dirs:
+            return []
+        # a single mkdir for all groups, DistCp would copy a lone source onto a missing target
+        self.shell.call(['hdfs', 'dfs', '-mkdir', '-p'] + target_dirs, stderr=FNULL)
+        failed = list()
+        for target_dir in target_dirs:
+            failed.extend(self.copy_group(target_dir, self.groups.pop(target_dir)))
+        return failed
+
+    def copy_group(self, target_dir, files):
+        """
+        Copy one group with DistCp and delete sources on success
+        :return: files that failed to archive, all of them when the copy failed
+        """
+        logging.info("Archive %d files onto container %s", len(files), target_dir)
+        list_path = path.join(self.list_dir, 'archive-%s.lst' % uuid.uuid4().hex)
+        try:
+            with TELEMETRY.stage('archive'):
+                self.hdfs.create(list_path, '\n'.join(files), overwrite=True)
+                self.shell.check_output(['hadoop', 'distcp', '-f', list_path, target_dir],
+                                        stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as cpe:
+            logging.error('CPE:failed to archive %d files to {%s} with following error{%s}',
+                          len(files), target_dir, cpe.output)
+            return files
+        except HdfsException as exception:
+            logging.error('failed to write archive file list {%s} error{%s}', list_path,
+                          str(exception))
+            return files
+        finally:
+            try:
+                self.hdfs.delete(list_path)
+            except HdfsException:
+                logging.warn('failed to remove archive file list {%s}', list_path)
+
+        TELEMETRY.count('files_archived', len(files))
+        failed = list()
+        for file_path in files:
+            try:
+                delete(self.hdfs, file_path)
+            except HdfsException as exception:
+                logging.error('failed to delete archived file {%s} error{%s}', file_path,
+                              str(exception))
+                failed.append(file_path)
+        with TELEMETRY.stage('empty_dirs'):
+            for dir_path in set(path.dirname(file_path) for file_path in files):
+                try:
+                    if not self.hdfs.listdir(dir_path):
+                        logging.debug("Delete directory:->{%s} as its empty", dir_path)
+                        self.hdfs.delete(dir_path)
+                        TELEMETRY.count('directories_removed')
+                except HdfsException as exception:
+                    logging.warn("Failed to delete directory{%s} error(%s)", dir_path,
+                                 str(exception))
+        return failed
+
+
+class Throttle(object):
+    """
+    Proxy that runs every function call of the wrapped object within a shared semaphore.
+    Wrapping the HDFS client and the subprocess module with the same semaphore caps WebHDFS
+    requests and command launches across concurrently running jobs.
+    """
+
+    def __init__(self, target, slots):
+        self.target = target
+        self.slots = slots
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not inspect.isroutine(attr):
+            return attr
+
+        @wraps(attr)
+        def throttled(*args, **kwargs):
+            """
+            Call wrapped function once a slot is available
+            """
+            with self.slots:
+                return attr(*args, **kwargs)
+        return throttled
+
+
+def escape_label(value):
+    """
+    Escape a Prometheus label value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_atomic(file_path, content):
+    """
+    Write file through a temporary file renamed over it, readers never see a partial file
+    :return: None
+    """
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w') as out_file:
+        out_file.write(content)
+    os.rename(temp_path, file_path)
+
+
+class RunTelemetry(object):
+    """
+    Counters and stage timers of a cleanup run, kept per job.
+    Stages are walk (waiting on directory listings), stat, delete, archive and empty_dirs
+    (empty directory cleanup). Work is accounted to the job the calling thread runs, set
+    with job(), and to 'run' outside of any job.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.jobs = OrderedDict()
+
+    def current(self):
+        """
+        Job of the calling thread
+        """
+        return getattr(self.local, 'job', None) or 'run'
+
+    def stats(self, job):
+        """
+        Stats of a job, created on first use. Caller holds the lock.
+        """
+        stats = self.jobs.get(job)
+        if stats is None:
+            stats = self.jobs[job] = {'status': None, 'seconds': None,
+                                      'counters': dict(), 'stages': dict()}
+        return stats
+
+    @contextmanager
+    def job(self, name):
+        """
+        Account work of the with block to job name and record its runtime and status
+        """
+        previous = getattr(self.local, 'job', None)
+        self.local.job = name
+        started = time.time()
+        status = 'failed'
+        try:
+            yield
+            status = 'done'
+        finally:
+            self.local.job = previous
+            with self.lock:
+                stats = self.stats(name)
+                stats['status'] = status
+                stats['seconds'] = (stats['seconds'] or 0) + time.time() - started
+
+    def count(self, counter, value=1):
+        """
+        Add value to a counter of the current job
+        :return: None
+        """
+        job = self.current()
+        with self.lock:
+            counters = self.stats(job)['counters']
+            counters[counter] = counters.get(counter, 0) + value
+
+    @contextmanager
+    def stage(self, stage):
+        """
+        Add the time spent in the with block to a stage of the current job
+        """
+        job = self.current()
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            with self.lock:
+                stages = self.stats(job)['stages']
+                calls, seconds = stages.get(stage, (0, 0.0))
+                stages[stage] = (calls + 1, seconds + elapsed)
+
+    def summary(self, request_metrics=None):
+        """
+        Machine readable summary of the run
+        :param request_metrics: RequestMetrics of the WebHDFS client, for RPC counts
+        :return: dict with run duration, totals, stats per job and WebHDFS calls per operation
+        """
+        jobs = OrderedDict()
+        totals = {'counters': dict(), 'stages': dict()}
+        with self.lock:
+            for name, stats in self.jobs.items():
+                stages = dict((stage, {'calls': calls, 'seconds': round(seconds, 3)})
+                              for stage, (calls, seconds) in stats['stages'].items())
+                jobs[name] = {'status': stats['status'], 'counters': dict(stats['counters']),
+                              'stages': stages}
+                if stats['seconds'] is not None:
+                    jobs[name]['seconds'] = round(stats['seconds'], 3)
+                for counter, value in stats['counters'].items():
+                    totals['counters'][counter] = totals['counters'].get(counter, 0) + value
+                for stage, (calls, seconds) in stats['stages'].items():
+                    total = totals['stages'].setdefault(stage, {'calls': 0, 'seconds': 0.0})
+                    total['calls'] += calls
+                    total['seconds'] = round(total['seconds'] + seconds, 3)
+        rpcs = dict()
+        if request_metrics is not None:
+            for operation, stats in request_metrics.snapshot().items():
+                rpcs[operation] = {'calls': stats['count'], 'errors': stats['errors'],
+                                   'seconds': round(stats['seconds'], 3)}
+        totals['rpcs'] = sum(stats['calls'] for stats in rpcs.values())
+        return {'started': int(self.started), 'seconds': round(time.time() - self.started, 3),
+                'totals': totals, 'jobs': jobs, 'rpcs': rpcs}
+
+    def textfile(self, summary):
+        """
+        Render a summary in the Prometheus text format read by the node exporter textfile
+        collector
+        :param summary: dict returned by summary()
+        :return: text
+        """
+        families = OrderedDict()
+
+        def sample(name, kind, labels, value):
+            """
+            Add a sample to its metric family
+            """
+            family = families.setdefault('%s_%s' % (TELEMETRY_PREFIX, name), (kind, list()))
+            family[1].append((labels, value))
+
+        sample('last_run_timestamp_seconds', 'gauge', (), summary['started'])
+        sample('run_seconds', 'gauge', (), summary['seconds'])
+        for name, stats in summary['jobs'].items():
+            job = (('job', name),)
+            if 'seconds' in stats:
+                sample('job_seconds', 'gauge', job, stats['seconds'])
+                sample('job_failed', 'gauge', job, int(stats['status'] == 'failed'))
+            for counter, value in sorted(stats['counters'].items()):
+                sample('job_%s' % counter, 'gauge', job, value)
+            for stage, stage_stats in sorted(stats['stages'].items()):
+                labels = job + (('stage', stage),)
+                sample('job_stage_calls', 'gauge', labels, stage_stats['calls'])
+                sample('job_stage_seconds', 'gauge', labels, stage_stats['seconds'])
+        for operation, stats in sorted(summary['rpcs'].items()):
+            labels = (('op', operation),)
+            sample('webhdfs_requests', 'gauge', labels, stats['calls'])
+            sample('webhdfs_errors', 'gauge', labels, stats['errors'])
+            sample('webhdfs_request_seconds', 'gauge', labels, stats['seconds'])
+
+        lines = list()
+        for name, (kind, samples) in families.items():
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in samples:
+                label_text = ','.join('%s="%s"' % (label, escape_label(label_value))
+                                      for label, label_value in labels)
+                lines.append('%s%s %s' % (name, '{%s}' % label_text if labels else '', value))
+        return '\n'.join(lines) + '\n'
+
+    def report(self, request_metrics=None, summary_path=None, textfile_path=None):
+        """
+        Log the summary of the run, and write it as JSON and for the textfile collector
+        :param request_metrics: RequestMetrics of the WebHDFS client
+        :param summary_path: JSON file the summary is written to, not written when None
+        :param textfile_path: .prom file for the node exporter textfile collector, not
+         written when None
+        :return: summary
+        """
+        summary = self.summary(request_metrics)
+        logging.info("Run summary %s", json.dumps(summary['totals'], sort_keys=True))
+        try:
+            if summary_path:
+                write_atomic(summary_path, json.dumps(summary, indent=2))
+            if textfile_path:
+                write_atomic(textfile_path, self.textfile(summary))
+        except (IOError, OSError) as exception:
+            logging.warn("Failed to write run summary error(%s)", str(exception))
+        return summary
+
+
+TELEMETRY = RunTelemetry()
 
 
 def check_threshold():
@@ -114,7 +487,8 @@ def extract_age(retention_age, hdfs, name):
     :param name: name of file
     :return: Last modified
     """
-    last_modified = hdfs.get_file_status(name).modificationTime
+    with TELEMETRY.stage('stat'):
+        last_modified = hdfs.get_file_status(name).modificationTime
     return last_modified
 
 
@@ -125,7 +499,8 @@ def extract_size(hdfs, name):
     :param name:
     :return:
     """
-    file_size = hdfs.get_file_status(name)['length']
+    with TELEMETRY.stage('stat'):
+        file_size = hdfs.get_file_status(name)['length']
     return file_size
 
 
@@ -139,38 +514,459 @@ def error(exception):
 
 
 def clean_empty_dirs(hdfs, root, dirs):
-    for dir_entry in dirs:
-        abspath = path.join(root, dir_entry)
-        if hdfs.get_content_summary(abspath).fileCount < 1:
-            # The directory will not be removed if not empty
-            logging.debug("Delete directory:->{%s} as its empty", dir_entry)
-            hdfs.delete(abspath)
+    with TELEMETRY.stage('empty_dirs'):
+        for dir_entry in dirs:
+            abspath = path.join(root, dir_entry)
+            if hdfs.get_content_summary(abspath).fileCount < 1:
+                # The directory will not be removed if not empty
+                logging.debug("Delete directory:->{%s} as its empty", dir_entry)
+                hdfs.delete(abspath)
+                TELEMETRY.count('directories_removed')
 
 
-def cleanup_on_age(hdfs, cmd, clean_path, age):
+def walk_tree(hdfs, walker, top, topdown, descend=None, onerror=error):
     """
-    Clean up files when it ages as determined by threshold
+    Walk HDFS tree, listing directories concurrently
+    :param hdfs: hdfs instance
+    :param walker: ParallelWalker, a single threaded one is used when None
+    :param top: directory to walk
+    :param topdown: yield parents before children
+    :param descend: called with each directory entry, the directory is skipped when it
+     returns False
+    :param onerror: called with the exception when a directory can't be listed
+    :return: generator of (root, dir entries, file entries)
+    """
+    # in plan mode listings are kept until processed, which for a bottom up walk is when
+    # the walk resumes
+    forget = getattr(hdfs, 'forget', None) if not topdown else None
+    own_walker = walker is None
+    if own_walker:
+        walker = ParallelWalker(hdfs, max_workers=1)
+    try:
+        listings = iter(walker.walk(top, topdown=topdown, onerror=onerror, descend=descend))
+        while True:
+            # time spent waiting on directory listings
+            with TELEMETRY.stage('walk'):
+                listing = next(listings, None)
+            if listing is None:
+                break
+            TELEMETRY.count('directories_listed')
+            TELEMETRY.count('files_scanned', len(listing[2]))
+            yield listing
+            if forget is not None:
+                forget(listing[0])
+    finally:
+        if own_walker:
+            walker.shutdown()
+
+
+def walk_bottom_up(hdfs, walker, top, onerror=error):
+    """
+    Walk HDFS tree bottom up, listing directories concurrently
+    :param onerror: called with the exception when a directory can't be listed
+    :return: generator of (root, dir names, file entries)
+    """
+    for root, dirs, files in walk_tree(hdfs, walker, top, topdown=False, onerror=onerror):
+        yield root, [path.basename(entry.path) for entry in dirs], files
+
+
+class CheckpointStore(object):
+    """
+    Progress of a cleanup run kept in a local JSON state file, so that a killed run is
+    resumed by the next one. Per job it holds whether the job completed and, per directory
+    being cleaned, the last directory completed in bottom up walk order.
+    Once a run completes only the checkpoints of jobs that failed are kept, and the file is
+    removed when every job succeeded.
+    """
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.state = dict()
+        if os.path.exists(state_path):
+            try:
+                with open(state_path) as state_file:
+                    self.state = json.load(state_file)
+                logging.info("Resuming interrupted run from %s", state_path)
+            except ValueError as exception:
+                logging.warn("Ignoring checkpoints, failed to read %s error(%s)", state_path,
+                             str(exception))
+
+    def is_done(self, key):
+        """
+        Check whether job completed in an earlier attempt of the run
+        """
+        with self.lock:
+            return self.state.get(key, {}).get('done', False)
+
+    def last_dir(self, key, top):
+        """
+        Last directory completed below top, None if none was
+        """
+        with self.lock:
+            return self.state.get(key, {}).get('dirs', {}).get(top)
+
+    def update(self, key, top, dir_path):
+        """
+        Record directory completed below top and persist checkpoints
+        :return: None
+        """
+        with self.lock:
+            self.state.setdefault(key, {'done': False, 'dirs': {}})['dirs'][top] = dir_path
+            self.save()
+
+    def finish(self, key):
+        """
+        Record job completed and persist checkpoints
+        :return: None
+        """
+        with self.lock:
+            self.state[key] = {'done': True, 'dirs': {}}
+            self.save()
+
+    def save(self):
+        """
+        Write state file, caller holds the lock
+        """
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(self.state, state_file)
+        os.rename(temp_path, self.state_path)
+
+    def clear(self):
+        """
+        Remove state file once a run completed
+        :return: None
+        """
+        self.retain(())
+
+    def retain(self, keys):
+        """
+        Keep checkpoints of the given jobs only, the state file is removed when none is left
+        :param keys: keys of the jobs to keep
+        :return: None
+        """
+        with self.lock:
+            self.state = dict((key, state) for key, state in self.state.items() if key in keys)
+            if self.state:
+                self.save()
+            elif os.path.exists(self.state_path):
+                os.remove(self.state_path)
+
+
+class JobProgress(object):
+    """
+    Checkpoints of a single job. Directories completed by the job are committed at most
+    every interval seconds, after flushing pending work of the command so that nothing
+    recorded as completed is still waiting to be archived.
+    """
+
+    def __init__(self, store, key, cmd, interval=CHECKPOINT_INTERVAL):
+        self.store = store
+        self.key = key
+        self.cmd = cmd
+        self.interval = interval
+        self.committed = time.time()
+
+    def is_done(self):
+        """
+        Check whether job completed in an earlier attempt of the run
+        """
+        return self.store.is_done(self.key)
+
+    def resumed(self, top):
+        """
+        Check whether an earlier attempt of the run completed directories below top
+        """
+        return self.store.last_dir(self.key, top) is not None
+
+    def completed(self, top, dir_path):
+        """
+        Check whether directory was completed in an earlier attempt of the run
+        :param top: directory being cleaned
+        :param dir_path: directory of the walk
+        """
+        last_dir = self.store.last_dir(self.key, top)
+        return last_dir is not None and walk_order(dir_path) <= walk_order(last_dir)
+
+    def done(self, top, dir_path):
+        """
+        Mark directory completed, checkpoints are committed once interval elapsed
+        :return: files that failed to archive when pending work was flushed
+        """
+        if time.time() - self.committed < self.interval:
+            return []
+        failed = self.cmd.flush() if hasattr(self.cmd, 'flush') else []
+        self.store.update(self.key, top, dir_path)
+        self.committed = time.time()
+        return failed
+
+    def finish(self):
+        """
+        Mark job completed
+        :return: None
+        """
+        self.store.finish(self.key)
+
+
+def is_delete_cmd(cmd):
+    """
+    Check whether cmd deletes files, as opposed to archiving them
+    """
+    return isinstance(cmd, partial) and cmd.func is delete
+
+
+def partition_range(partition_path):
+    """
+    Time range covered by a partition, derived from the year=/month=/day=/hour= directory
+    names of its path. Keys are taken in that order and parsing stops at the first one
+    missing, partitions are in UTC.
+    :param partition_path: partition path relative to the dataset path
+    :return: tuple of start and end in milliseconds since epoch, None without a valid year
+    """
+    keys = dict(re.findall(r'(\w+)=(\w*)', partition_path))
+    values = list()
+    for key in PARTITION_KEYS:
+        if not keys.get(key, '').isdigit():
+            break
+        values.append(int(keys[key]))
+    if not values:
+        return None
+    year, month, day, hour = values + [1, 1, 1, 0][len(values):]
+    try:
+        start = datetime.datetime(year, month, day, hour)
+        if len(values) == 1:
+            end = datetime.datetime(year + 1, 1, 1)
+        elif len(values) == 2:
+            end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+        elif len(values) == 3:
+            end = start + datetime.timedelta(days=1)
+        else:
+            end = start + datetime.timedelta(hours=1)
+    except (ValueError, OverflowError):
+        return None
+    return (calendar.timegm(start.timetuple()) * 1000, calendar.timegm(end.timetuple()) * 1000)
+
+
+class WatermarkStore(object):
+    """
+    Per dataset watermarks kept in a local JSON state file.
+    The watermark of a dataset is the age threshold of its last successful partition age
+    cleanup, partitions ending before it need not be visited again. Every full_scan_period
+    seconds a dataset is walked in full, to pick up late data and failed operations.
+    """
+
+    def __init__(self, state_path, full_scan_period=WATERMARK_FULL_SCAN_PERIOD):
+        self.state_path = state_path
+        self.full_scan_period = full_scan_period
+        self.lock = threading.Lock()
+        self.state = dict()
+        try:
+            with open(state_path) as state_file:
+                self.state = json.load(state_file)
+        except (IOError, ValueError) as exception:
+            logging.warn("Starting without watermarks, failed to read %s error(%s)",
+                         state_path, str(exception))
+
+    def since(self, name):
+        """
+        Watermark of a dataset
+        :param name: dataset name
+        :return: threshold in milliseconds, None when the dataset must be walked in full
+        """
+        with self.lock:
+            mark = self.state.get(name)
+        if mark is None or time.time() - mark['full_scan'] >= self.full_scan_period:
+            return None
+        return mark['threshold']
+
+    def advance(self, name, threshold, full_scan):
+        """
+        Record a successful cleanup and persist all watermarks
+        :param name: dataset name
+        :param threshold: age threshold of the cleanup in milliseconds
+        :param full_scan: whether the dataset was walked in full
+        :return: None
+        """
+        with self.lock:
+            mark = self.state.get(name) or dict()
+            mark['threshold'] = threshold
+            if full_scan or 'full_scan' not in mark:
+                mark['full_scan'] = time.time()
+            self.state[name] = mark
+            temp_path = self.state_path + '.tmp'
+            with open(temp_path, 'w') as state_file:
+                json.dump(self.state, state_file)
+            os.rename(temp_path, self.state_path)
+
+
+def cleanup_on_partition_age(hdfs, cmd, clean_path, age, walker=None, watermarks=None,
+                             name=None, progress=None):
+    """
+    Clean up files when it ages as determined by threshold, using the partition time in
+    directory names. Partitions starting after the threshold are not listed at all and
+    partitions ending before it are expired as a whole, without looking at modification
+    times. Only files outside of a parseable partition are checked against their
+    modification time. With watermarks, partitions that ended before the threshold of the
+    previous run are not visited either. The watermark only advances when no directory
+    listing or file operation failed, and the run did not resume an earlier attempt whose
+    failures are unknown.
     :param hdfs: hdfs instance
     :param cmd: cmd to run when threshold is reached
     :param clean_path: repo path
     :param age: Threshold value in this case age
-    :return: None
+    :param walker: ParallelWalker used to list directories
+    :param watermarks: WatermarkStore, every run walks the whole dataset when None
+    :param name: dataset name the watermark is kept under
+    :param progress: JobProgress to resume from and checkpoint to
+    :return: number of failures
+    """
+    since = None if watermarks is None else watermarks.since(name)
+    resumed = progress is not None and any(progress.resumed(top) for top in (
+        clean_path if isinstance(clean_path, list) else [clean_path]))
+    failures = cleanup_on_age(hdfs, cmd, clean_path, age, walker=walker, partitioned=True,
+                              since=since, progress=progress)
+    # batched archives are copied when flushed, their failures count too
+    if hasattr(cmd, 'flush'):
+        failures += len(cmd.flush())
+    if watermarks is not None and (failures or resumed):
+        logging.warn("Watermark of %s kept, %d failures resumed(%s)", name, failures, resumed)
+    elif watermarks is not None:
+        watermarks.advance(name, age * 1000, full_scan=since is None)
+    return failures
+
+
+def cleanup_on_age(hdfs, cmd, clean_path, age, walker=None, partitioned=False, since=None,
+                   progress=None):
+    """
+    Clean up files when it ages as determined by threshold.
+    Files are considered expired from the modification times of the directory listings.
+    With the delete command a subtree whose files all expired, and whose directories were
+    not modified since the threshold either, is removed with a single recursive delete.
+    Files are only removed one by one in directories that mix expired and retained data.
+    :param hdfs: hdfs instance
+    :param cmd: cmd to run when threshold is reached
+    :param clean_path: repo path
+    :param age: Threshold value in this case age
+    :param walker: ParallelWalker used to list directories
+    :param partitioned: derive age from partition directory names where possible
+    :param since: partitions ending at or before this time in milliseconds were processed
+     by an earlier run and are skipped
+    :param progress: JobProgress to resume from and checkpoint to
+    :return: number of directories that could not be listed and files that failed to archive
     """
     dir_list = clean_path
     if not isinstance(clean_path, list):
         dir_list = list()
         dir_list.append(clean_path)
 
+    threshold = age * 1000
+    bulk_delete = is_delete_cmd(cmd)
+    failures = list()
+
+    def onerror(exception):
+        """
+        Log and count directories that can't be listed
+        """
+        error(exception)
+        failures.append(exception)
+
     for dir_to_clean in dir_list:
-        for root, dirs, files in hdfs.walk(dir_to_clean, topdown=False, onerror=error):
-            logging.info("Root:{%s}->Dirs:{%s}->Files:{%s}", root, dirs, files)
-            for filename in files:
-                abspath = path.join(root, filename)
-                if extract_age(age, hdfs, abspath):
-                    cmd(abspath)
-            clean_empty_dirs(hdfs, root, dirs)
+        # expired holds subtrees waiting for their parent to decide on a recursive delete,
+        # deferred those of them that were walked, remaining the number of entries left in
+        # a cleaned directory, expired_bytes the listed size of expired subtrees, mtimes the
+        # modification time of directories until they are walked
+        expired = set()
+        deferred = set()
+        remaining = dict()
+        expired_bytes = dict()
+        spans = dict()
+        skipped = set()
+        mtimes = dict()
+
+        def descend(entry):
+            """
+            Skip partitions within retention or already processed, and with delete whole
+            expired partitions
+            """
+            # pylint: disable=cell-var-from-loop
+            if partitioned:
+                span = partition_range(path.relpath(entry.path, dir_to_clean))
+                spans[entry.path] = span
+                if span is not None and span[0] > threshold:
+                    logging.debug("Skip partition:->{%s} within retention", entry.path)
+                    skipped.add(entry.path)
+                    return False
+                if span is not None and since is not None and span[1] <= since:
+                    logging.debug("Skip partition:->{%s} processed by earlier run", entry.path)
+                    skipped.add(entry.path)
+                    return False
+                if span is not None and span[1] <= threshold and bulk_delete:
+                    expired.add(entry.path)
+                    return False
+            if bulk_delete:
+                # directory modification times come with the listing of the parent directory,
+                # which is walked before the directory is yielded
+                mtimes[entry.path] = entry.modificationTime
+            return True
+
+        for root, dirs, files in walk_tree(hdfs, walker, dir_to_clean, topdown=False,
+                                           descend=descend, onerror=onerror):
+            mtime = mtimes.pop(root, None)
+            if progress is not None and progress.completed(dir_to_clean, root):
+                continue
+            logging.info("Root:{%s}->Dirs:{%s}->Files:{%s}", root,
+                         [path.basename(entry.path) for entry in dirs],
+                         [path.basename(entry.path) for entry in files])
+            span = spans.pop(root, None)
+            if span is not None and span[1] <= threshold:
+                aged = files
+            else:
+                aged = [entry for entry in files if entry.modificationTime <= threshold]
+            if bulk_delete:
+                subtrees = [entry for entry in dirs if entry.path in expired]
+                expired.difference_update(entry.path for entry in subtrees)
+                deferred.difference_update(entry.path for entry in subtrees)
+                if root != dir_to_clean and mtime <= threshold and \
+                        len(aged) == len(files) and len(subtrees) == len(dirs):
+                    expired.add(root)
+                    deferred.add(root)
+                    expired_bytes[root] = sum(entry.length for entry in files) + \
+                        sum(expired_bytes.pop(entry.path, 0) for entry in subtrees)
+                    continue
+                for entry in subtrees:
+                    logging.debug("Delete expired directory:->{%s}", entry.path)
+                    with TELEMETRY.stage('delete'):
+                        hdfs.delete(entry.path, recursive=True)
+                    TELEMETRY.count('subtrees_deleted')
+                    TELEMETRY.count('bytes_freed', expired_bytes.pop(entry.path, 0))
+                for entry in aged:
+                    failures.extend(cmd(entry.path) or ())
+                    TELEMETRY.count('bytes_freed', entry.length)
+                kept = [entry for entry in dirs if entry not in subtrees]
+                remaining[root] = len(files) - len(aged) + len(kept)
+                with TELEMETRY.stage('empty_dirs'):
+                    for entry in kept:
+                        if remaining.pop(entry.path, None) == 0:
+                            # The directory will not be removed if not empty
+                            logging.debug("Delete directory:->{%s} as its empty", entry.path)
+                            hdfs.delete(entry.path)
+                            TELEMETRY.count('directories_removed')
+                            remaining[root] -= 1
+            else:
+                for entry in aged:
+                    failures.extend(cmd(entry.path) or ())
+                    TELEMETRY.count('bytes_freed', entry.length)
+                clean_empty_dirs(hdfs, root, [path.basename(entry.path) for entry in dirs
+                                              if entry.path not in skipped])
+            # a resumed run skips completed directories, so none is recorded while a walked
+            # subtree still waits for its parent to be deleted. Expired partitions that were
+            # not walked are found again when their parent is listed.
+            if progress is not None and not deferred:
+                failures.extend(progress.done(dir_to_clean, root))
+    return len(failures)
 
-def cleanup_on_size(hdfs, cmd, clean_path, size_threshold):
+def cleanup_on_size(hdfs, cmd, clean_path, size_threshold, walker=None, progress=None):
     """
     Clean up hdfs data directories when threshold is reached
 
@@ -178,83 +974,270 @@ def cleanup_on_size(hdfs, cmd, clean_path, size_threshold):
     :param cmd: cmd to run when threshold is reached. It is usually archive or delete command
     :param clean_path: Path to clean
     :param size_threshold: Threshold value for file repo
-    :return: None
+    :param walker: ParallelWalker used to list directories
+    :param progress: JobProgress to resume from and checkpoint to
+    :return: number of directories that could not be cleaned or listed and files that
+     failed to archive
     """
     logging.info("Clean following dirs on basis of size [{%s}]", clean_path)
     dir_list = clean_path
     if not isinstance(clean_path, list):
         dir_list = list()
         dir_list.append(clean_path)
+    failures = list()
+
+    def onerror(exception):
+        """
+        Log and count directories that can't be listed
+        """
+        error(exception)
+        failures.append(exception)
 
     for clean_dir in dir_list:
         try:
-            space_consumed = hdfs.get_content_summary(clean_dir).length
+            with TELEMETRY.stage('stat'):
+                space_consumed = hdfs.get_content_summary(clean_dir).length
             logging.info("Space consumed by directory{%s} on filesystem:{%d} policy threshold:{%d}",
                          clean_dir, space_consumed, size_threshold)
             if space_consumed > size_threshold:
-                for root, dirs, files in hdfs.walk(clean_dir, topdown=False,
-                                                   onerror=error):
-                    logging.info("Root:{%s}->Dirs:{%s}->Files:{%s}", root, dirs, files)
-                    for item in files:
-                        
+                for root, dirs, files in walk_bottom_up(hdfs, walker, clean_dir, onerror):
+                    if progress is not None and progress.completed(clean_dir, root):
+                        continue
+                    logging.info("Root:{%s}->Dirs:{%s}->Files:{%s}", root, dirs,
+                                 [path.basename(entry.path) for entry in files])
+                    for entry in files:
+
                         if space_consumed <= size_threshold:
                             break
 
-                        # Read the file-size from HDFS, remove file and update the space_consumed
-                        abspath = path.join(root, item)
-                        file_size = extract_size(hdfs, abspath)
-                        cmd(abspath)
-                        space_consumed -= file_size
+                        # file size comes with the listing, remove file and update the
+                        # space_consumed
+                        failures.extend(cmd(entry.path) or ())
+                        space_consumed -= entry.length
+                        TELEMETRY.count('bytes_freed', entry.length)
 
                     clean_empty_dirs(hdfs, root, dirs)
+                    if progress is not None:
+                        failures.extend(progress.done(clean_dir, root))
         except HdfsFileNotFoundException as hdfs_file_not_found_exception:
-            logging.warn("{%s}", hdfs_file_not_found_str(exception))
+            logging.warn("{%s}", str(hdfs_file_not_found_exception))
+            failures.append(hdfs_file_not_found_exception)
         except Exception as exception:
             logging.warn("Exception in clean directories possibly dir doesnt exist{%s}",
                          str(exception))
+            failures.append(exception)
+    return len(failures)
+
+def evict_oldest_first(hdfs, cmd, clean_dir, space_consumed, size_threshold, walker,
+                       failures=None):
+    """
+    Evict files of a directory strictly oldest first until space consumed is within threshold.
+    Modification time and length of every file come with the directory listings, so the
+    number of WebHDFS listing calls is bounded by the number of directories.
+    Directories left empty are removed once pending archives of the command are flushed.
+    :param failures: list that directories which can't be listed and files that failed to
+     archive are added to
+    :return: space consumed after eviction
+    """
+    failures = failures if failures is not None else list()
+
+    def onerror(exception):
+        """
+        Log and count directories that can't be listed
+        """
+        error(exception)
+        failures.append(exception)
+
+    # walked paths are joined onto clean_dir, normalize it so that they match their parents
+    clean_dir = clean_dir.rstrip('/') or '/'
+    candidates = list()
+    children = dict()
+    for root, dirs, files in walk_tree(hdfs, walker, clean_dir, topdown=True, onerror=onerror):
+        children[root] = len(dirs) + len(files)
+        candidates.extend((entry.modificationTime, entry.length, entry.path) for entry in files)
+    heapq.heapify(candidates)
+    logging.info("Evicting from %d files of directory{%s} oldest first", len(candidates),
+                 clean_dir)
+
+    emptied = set()
+    while candidates and space_consumed > size_threshold:
+        _, length, file_path = heapq.heappop(candidates)
+        failures.extend(cmd(file_path) or ())
+        space_consumed -= length
+        TELEMETRY.count('bytes_freed', length)
+        emptied.add(path.dirname(file_path))
+        children[path.dirname(file_path)] -= 1
+
+    # archives copy files in batches, a directory is only empty once they were flushed
+    if hasattr(cmd, 'flush'):
+        failures.extend(cmd.flush())
+
+    # remove directories left empty, deepest first, without asking HDFS for content summaries
+    for dir_path in sorted(emptied, key=lambda dir_path: -dir_path.count('/')):
+        while dir_path != clean_dir and children.get(dir_path) == 0:
+            logging.debug("Delete directory:->{%s} as its empty", dir_path)
+            try:
+                # The directory will not be removed if not empty, nor counted when the
+                # archive already removed it
+                with TELEMETRY.stage('empty_dirs'):
+                    removed = hdfs.delete(dir_path)
+            except HdfsException as exception:
+                logging.warn("Failed to delete directory{%s} error(%s)", dir_path, str(exception))
+                break
+            if removed:
+                TELEMETRY.count('directories_removed')
+            children[dir_path] = None
+            dir_path = path.dirname(dir_path)
+            children[dir_path] -= 1
+    if hasattr(hdfs, 'forget'):
+        for dir_path in children:
+            hdfs.forget(dir_path)
+    return space_consumed
+
+
+def cleanup_on_size_oldest_first(hdfs, cmd, clean_path, size_threshold, walker=None,
+                                 progress=None):
+    # pylint: disable=unused-argument
+    """
+    Clean up hdfs data directories when threshold is reached, evicting oldest files first
+
+    :param hdfs: hdfs instance for file walk
+    :param cmd: cmd to run when threshold is reached. It is usually archive or delete command
+    :param clean_path: Path to clean
+    :param size_threshold: Threshold value for file repo
+    :param walker: ParallelWalker used to list directories
+    :param progress: eviction order depends on the whole tree, only completion of the job
+     is checkpointed
+    :return: number of directories that could not be cleaned or listed and files that
+     failed to archive
+    """
+    logging.info("Clean following dirs oldest first on basis of size [{%s}]", clean_path)
+    dir_list = clean_path
+    if not isinstance(clean_path, list):
+        dir_list = list()
+        dir_list.append(clean_path)
+    failures = list()
+
+    for clean_dir in dir_list:
+        try:
+            with TELEMETRY.stage('stat'):
+                space_consumed = hdfs.get_content_summary(clean_dir).length
+            logging.info("Space consumed by directory{%s} on filesystem:{%d} policy threshold:{%d}",
+                         clean_dir, space_consumed, size_threshold)
+            if space_consumed > size_threshold:
+                evict_oldest_first(hdfs, cmd, clean_dir, space_consumed, size_threshold, walker,
+                                   failures)
+        except Exception as exception:
+            logging.warn("Exception in clean directories possibly dir doesnt exist{%s}",
+                         str(exception))
+            failures.append(exception)
+    return len(failures)
+
+
+class ResourceManagerApps(object):
+    """
+    States of YARN applications, fetched from the ResourceManager REST API with a single
+    apps query the first time they are needed and cached for the rest of the run.
+    An application submitted after the query is missing from the cache, so only ask for
+    applications whose directories were listed before the first call.
+    Only applications that are still active are listed, any other application is finished,
+    failed, killed or no longer known to the ResourceManager.
+    """
+
+    def __init__(self, rm_url, session=requests):
+        """
+        :param rm_url: ResourceManager host:port
+        :param session: requests module or session used for the query
+        """
+        self.rm_url = rm_url if rm_url.startswith('http') else 'http://%s' % rm_url
+        self.session = session
+        self.states = None
+
+    def fetch(self):
+        """
+        Query active applications
+        :return: dict of application id to state
+        """
+        response = self.session.get('%s/ws/v1/cluster/apps' % self.rm_url,
+                                    params={'states': ','.join(YARN_ACTIVE_STATES)},
+                                    timeout=60)
+        response.raise_for_status()
+        apps = (response.json().get('apps') or {}).get('app') or []
+        return dict((app['id'], app['state']) for app in apps)
+
+    def is_active(self, app_id):
+        """
+        Check whether application is still active
+        :param app_id: application id
+        :return: True if application is active
+        """
+        if self.states is None:
+            self.states = self.fetch()
+        return self.states.get(app_id) in YARN_ACTIVE_STATES
+
 
-def cleanup_spark(spark_path):
+class LocalApps(object):
+    """
+    Application states from a dict, used for testing purpose
     """
-    Clean up spark log and app files
+
+    def __init__(self, states=None):
+        self.states = states or {}
+
+    def is_active(self, app_id):
+        """
+        Check whether application is still active
+        :param app_id: application id
+        :return: True if application is active
+        """
+        return self.states.get(app_id) in YARN_ACTIVE_STATES
+
+
+def cleanup_spark(hdfs, apps, spark_path):
+    """
+    Clean up spark log and app files. Every directory is listed before application states
+    are looked up, so that the states cover every application found.
+    :param hdfs: hdfs instance
+    :param apps: application states, ResourceManagerApps or LocalApps
     :param spark_path: filesystem path that contains spark related files
     :return:
     """
     logging.info('Cleaning spark streaming cruft')
-    reg = re.compile('/(application_[0-9]*_[0-9]*)(.inprogress)*$')
+    reg = re.compile('^(application_[0-9]*_[0-9]*)(.inprogress)*$')
+    candidates = list()
     for dir_to_consider in spark_path:
         logging.info('cleaning up %s', dir_to_consider)
         try:
-            sub_dirs = subprocess.check_output(['hadoop', 'fs', '-ls', dir_to_consider],
-                                               stderr=FNULL)
-        except subprocess.CalledProcessError:
+            with TELEMETRY.stage('walk'):
+                sub_dirs = hdfs.list_status(dir_to_consider)
+            TELEMETRY.count('directories_listed')
+        except HdfsException:
             logging.warn('failed to ls %s', dir_to_consider)
             continue
 
-        for dir_path_line in sub_dirs.splitlines():
-            search_match = reg.search(dir_path_line)
+        for sub_dir in sub_dirs:
+            search_match = reg.search(sub_dir.pathSuffix)
             if search_match:
-                app_id = search_match.group(1)
-                try:
-                    app_status = subprocess.check_output(['yarn', 'application', '-status', app_id],
-                                                         stderr=FNULL)
-                except subprocess.CalledProcessError:
-                    logging.warn(
-                        'app probably not known to resource manager for some reason (like yarn was '
-                        'restarted)')
-                    app_status = 'State : FINISHED'
-                dir_path_line_parts = dir_path_line.split(' ')
-                dir_path_line_parts = filter(None, dir_path_line_parts)
-                dir_path = "%s" % ''.join(dir_path_line_parts[7:])
-                if 'State : FINISHED' in app_status or 'State : FAILED' in app_status or \
-                                'State : KILLED' in app_status:
-                    logging.warn('delete: %s', dir_path)
-                    try:
-                        subprocess.check_output(
-                            ['hadoop', 'fs', '-rm', '-r', '-f', '-skipTrash', dir_path])
-                    except subprocess.CalledProcessError:
-                        logging.warn('failed to delete: %s', dir_path)
-                else:
-                    logging.warn('keep: %s', dir_path)
+                candidates.append((search_match.group(1),
+                                   path.join(dir_to_consider, sub_dir.pathSuffix)))
+
+    for app_id, dir_path in candidates:
+        try:
+            active = apps.is_active(app_id)
+        except Exception as ex:
+            # without application states nothing can be safely deleted
+            logging.warn('failed to retrieve application states %s', str(ex))
+            return
+        if not active:
+            logging.warn('delete: %s', dir_path)
+            try:
+                with TELEMETRY.stage('delete'):
+                    hdfs.delete(dir_path, recursive=True)
+                TELEMETRY.count('subtrees_deleted')
+            except HdfsException:
+                logging.warn('failed to delete: %s', dir_path)
+        else:
+            logging.warn('keep: %s', dir_path)
 
 
 def read_datasets_from_hbase(table_name, hbase_host):
@@ -272,8 +1255,11 @@ def read_datasets_from_hbase(table_name, hbase_host):
         connection.open()
         table = connection.table(table_name, )
         logging.info('connecting to hbase to read data sets')
-        for key, data in table.scan():
+        for key, data in table.scan(columns=HBASE_COLUMNS, batch_size=HBASE_SCAN_BATCH_SIZE):
             logging.debug("Looking for next data in HBase")
+            if 'cf:path' not in data:
+                # not a dataset, e.g. the version row of the data service
+                continue
             dataset = dict(name=key, path=data['cf:path'], policy=data['cf:policy'],
                            retention=data['cf:retention'], mode=data['cf:mode'])
             if dataset['policy'] == "size":
@@ -298,21 +1284,388 @@ class JOB(object):
     cron
     """
 
-    def __init__(self, name, hdfs, strategy, cmd, repo_path, threshold):
+    def __init__(self, name, hdfs, strategy, cmd, repo_path, threshold, walker=None):
         self.name = name
         self.hdfs = hdfs
         self.strategy = strategy
         self.cmd = cmd
         self.path = repo_path
         self.threshold = threshold
+        self.walker = walker
+        self.progress = None
+
+    def key(self):
+        """
+        Identifies job across attempts of a run
+        :return: job key
+        """
+        return '%s:%s' % (self.name, ','.join(self.paths()))
+
+    def paths(self):
+        """
+        HDFS paths touched by job
+        :return: list of paths
+        """
+        return self.path if isinstance(self.path, list) else [self.path]
 
     def run(self):
         """
-        Run specific job
-        :return:
+        Run specific job, it is only recorded as completed when nothing failed
+        :return: number of failures
         """
+        if self.progress is not None and self.progress.is_done():
+            logging.info("Job %s completed by an earlier attempt, skipping", self.name)
+            return 0
+        failures = 0
         if hasattr(self.strategy, '__call__'):
-            self.strategy(self.hdfs, self.cmd, self.path, self.threshold)
+            failures = self.strategy(self.hdfs, self.cmd, self.path, self.threshold,
+                                     walker=self.walker, progress=self.progress) or 0
+        # batched commands hold on to pending work until flushed
+        if hasattr(self.cmd, 'flush'):
+            failures += len(self.cmd.flush())
+        if self.progress is not None and not failures:
+            self.progress.finish()
+        return failures
+
+
+def paths_overlap(first, second):
+    """
+    Check whether one HDFS path is the same as or below the other
+    """
+    first = first.rstrip('/') + '/'
+    second = second.rstrip('/') + '/'
+    return first.startswith(second) or second.startswith(first)
+
+
+class JobScheduler(object):
+    """
+    Runs JOBs on a bounded pool of threads. A job waits until no running job touches an
+    overlapping HDFS path, and per job runtimes are logged once all jobs are done.
+    A job fails when it raises or reports failures.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS):
+        self.max_workers = max_workers
+        self.condition = threading.Condition()
+        self.running = list()
+        self.runtimes = list()
+        self.failed = list()
+
+    def conflicts(self, paths):
+        """
+        Check whether paths overlap with paths of a running job
+        """
+        return any(paths_overlap(job_path, running_path)
+                   for running_paths in self.running for running_path in running_paths
+                   for job_path in paths)
+
+    def run_job(self, job):
+        """
+        Run a single job once its paths are free
+        :return: None
+        """
+        paths = job.paths()
+        with self.condition:
+            while self.conflicts(paths):
+                self.condition.wait()
+            self.running.append(paths)
+        started = time.time()
+        status = 'done'
+        try:
+            logging.info(job.name)
+            with TELEMETRY.job(job.key()):
+                failures = job.run()
+                if failures:
+                    TELEMETRY.count('failures', failures)
+            if failures:
+                status = 'failed'
+                logging.error("Job %s failed with %d failures", job.name, failures)
+        except Exception:
+            status = 'failed'
+            logging.error("Job %s failed %s", job.name, traceback.format_exc())
+        finally:
+            with self.condition:
+                self.running.remove(paths)
+                self.runtimes.append((job.name, time.time() - started, status))
+                if status == 'failed':
+                    self.failed.append(job.key())
+                self.condition.notify_all()
+
+    def run(self, jobs):
+        """
+        Run all jobs and wait for completion
+        :return: keys of the jobs that failed
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for future in [executor.submit(self.run_job, job) for job in jobs]:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+        self.log_summary()
+        return self.failed
+
+    def log_summary(self):
+        """
+        Log runtime of every job, slowest first
+        :return: None
+        """
+        logging.info("Job summary: %d jobs", len(self.runtimes))
+        for name, runtime, status in sorted(self.runtimes, key=lambda item: -item[1]):
+            logging.info("Job:%s status:%s runtime:%.1fs", name, status, runtime)
+
+
+class CleanupPlan(object):
+    """
+    Records the actions of a cleanup run as JSON lines (job, action, path, bytes, reason)
+    instead of running them, and keeps totals per job.
+    Lengths of files come from the directory listings made through PlanningHdfs. They are
+    kept per directory until the walk processed it, so that memory does not grow with the
+    number of files walked.
+    """
+
+    def __init__(self, plan_path):
+        self.plan_path = plan_path
+        self.plan_file = open(plan_path, 'w')
+        self.lock = threading.Lock()
+        self.lengths = dict()
+        self.totals = OrderedDict()
+
+    def remember(self, dir_path, statuses):
+        """
+        Keep lengths of listed files
+        :return: None
+        """
+        with self.lock:
+            self.lengths[dir_path.rstrip('/') or '/'] = dict(
+                (status.pathSuffix, status.length) for status in statuses
+                if status.type != 'DIRECTORY')
+
+    def forget(self, dir_path):
+        """
+        Drop lengths of the files of a processed directory
+        :return: None
+        """
+        with self.lock:
+            self.lengths.pop(dir_path.rstrip('/') or '/', None)
+
+    def length(self, file_path):
+        """
+        Length of a listed file
+        :return: length in bytes, None if path wasn't listed as a file
+        """
+        with self.lock:
+            return self.lengths.get(path.dirname(file_path), {}).pop(path.basename(file_path),
+                                                                     None)
+
+    def record(self, job_name, action, file_path, length, reason):
+        """
+        Append an action to the plan
+        :return: None
+        """
+        with self.lock:
+            self.plan_file.write(json.dumps({'job': job_name, 'action': action,
+                                             'path': file_path, 'bytes': length,
+                                             'reason': reason}) + '\n')
+            total = self.totals.setdefault(job_name, [0, 0])
+            total[0] += 1
+            total[1] += length or 0
+
+    def close(self):
+        """
+        Close plan file, log and save totals per job
+        :return: None
+        """
+        self.plan_file.close()
+        totals = OrderedDict()
+        for job_name, (actions, length) in self.totals.items():
+            logging.info("Plan job:%s actions:%d bytes:%d", job_name, actions, length)
+            totals[job_name] = {'actions': actions, 'bytes': length}
+        with open(self.plan_path + '.totals.json', 'w') as totals_file:
+            json.dump(totals, totals_file, indent=2)
+
+
+class PlanningHdfs(object):
+    """
+    HDFS client of a job in plan mode. Reads go through to HDFS, deletes are recorded in
+    the plan instead.
+    """
+
+    def __init__(self, hdfs, plan, job_name=None, reason=None):
+        self.hdfs = hdfs
+        self.plan = plan
+        self.job_name = job_name
+        self.reason = reason
+
+    def __getattr__(self, name):
+        return getattr(self.hdfs, name)
+
+    def list_status(self, dir_path, **kwargs):
+        """
+        List directory and keep file lengths for the plan
+        """
+        statuses = self.hdfs.list_status(dir_path, **kwargs)
+        self.plan.remember(dir_path, statuses)
+        return statuses
+
+    def delete(self, file_path, recursive=False):
+        """
+        Record deletion of a file, an empty directory or a whole subtree
+        """
+        if recursive:
+            self.plan.record(self.job_name, 'delete_tree', file_path,
+                             self.hdfs.get_content_summary(file_path).length, 'expired subtree')
+            return True
+        length = self.plan.length(file_path)
+        if length is None:
+            self.plan.record(self.job_name, 'delete_dir', file_path, 0, 'empty directory')
+        else:
+            self.plan.record(self.job_name, 'delete', file_path, length, self.reason)
+        return True
+
+    def forget(self, dir_path):
+        """
+        Drop lengths of the files of a processed directory
+        """
+        self.plan.forget(dir_path)
+
+    def plan_archive(self, file_path):
+        """
+        Archive command of a job in plan mode
+        """
+        self.plan.record(self.job_name, 'archive', file_path, self.plan.length(file_path),
+                         self.reason)
+
+
+def apply_action(hdfs, action):
+    """
+    Apply a delete action of a plan, a path that no longer exists counts as applied
+    :return: True on success
+    """
+    try:
+        with TELEMETRY.stage('empty_dirs' if action['action'] == 'delete_dir' else 'delete'):
+            if not hdfs.delete(action['path'], recursive=action['action'] == 'delete_tree'):
+                return True
+    except HdfsFileNotFoundException:
+        return True
+    except HdfsException as exception:
+        logging.warn("Failed to %s {%s} error(%s)", action['action'], action['path'],
+                     str(exception))
+        return False
+    TELEMETRY.count(PLAN_ACTION_COUNTERS[action['action']])
+    TELEMETRY.count('bytes_freed', action.get('bytes') or 0)
+    return True
+
+
+def apply_plan_batch(hdfs, batch, archiver, executor, replayed=0):
+    """
+    Apply a batch of plan actions. Deletes of files and subtrees run in parallel, files to
+    archive are copied in bulk and empty directories are removed last, deepest first.
+    :param replayed: number of leading actions an earlier run may have applied, those whose
+     file is gone are not archived again
+    :return: set of positions in batch of the failed actions
+    """
+    failed = set()
+    deletes = [index for index, action in enumerate(batch)
+               if action['action'] in ('delete', 'delete_tree')]
+    applied = executor.map(partial(apply_action, hdfs), [batch[index] for index in deletes])
+    failed.update(index for index, done in zip(deletes, applied) if not done)
+    archives = [index for index, action in enumerate(batch) if action['action'] == 'archive'
+                and (index >= replayed or hdfs.exists(action['path']))]
+    unarchived = set()
+    for index in archives:
+        unarchived.update(archiver(batch[index]['path']))
+    if archives:
+        unarchived.update(archiver.flush())
+    for index in archives:
+        if batch[index]['path'] in unarchived:
+            failed.add(index)
+        else:
+            TELEMETRY.count('bytes_freed', batch[index].get('bytes') or 0)
+    dirs = [index for index, action in enumerate(batch) if action['action'] == 'delete_dir']
+    for index in sorted(dirs, key=lambda index: -batch[index]['path'].count('/')):
+        if not apply_action(hdfs, batch[index]):
+            failed.add(index)
+    return failed
+
+
+def plan_batches(plan_file, offset, batch_size):
+    """
+    Read plan actions in batches, skipping the lines applied by an earlier run
+    :return: generator of (line number of the first action, list of actions)
+    """
+    batch = list()
+    for line_no, line in enumerate(plan_file, 1):
+        if line_no <= offset:
+            continue
+        batch.append(json.loads(line))
+        if len(batch) >= batch_size:
+            yield line_no - len(batch) + 1, batch
+            batch = list()
+    if batch:
+        yield line_no - len(batch) + 1, batch
+
+
+def execute_plan(hdfs, plan_path, archiver, max_workers, batch_size=PLAN_BATCH_SIZE):
+    """
+    Replay a plan written in plan mode. After every batch the number of plan lines applied
+    is committed to <plan_path>.offset, a restarted run resumes from there. The offset never
+    moves past a failed action, a restarted run retries it and applies the actions after it
+    again. The offset file also holds the last line any run applied, up to that line files
+    already gone count as archived.
+    :param hdfs: hdfs instance
+    :param plan_path: plan file
+    :param archiver: ArchiveBatch used for archive actions
+    :param max_workers: number of parallel deletes
+    :param batch_size: number of plan lines per batch
+    :return: number of failed actions
+    """
+    offset_path = plan_path + '.offset'
+    offset = applied = 0
+    if os.path.exists(offset_path):
+        with open(offset_path) as offset_file:
+            values = [int(value) for value in offset_file.read().split()] or [0]
+        offset, applied = values[0], values[-1]
+        logging.info("Resuming plan %s from line %d", plan_path, offset)
+
+    def commit(line_no, last_line):
+        """
+        Persist number of plan lines applied, and the last line applied
+        """
+        with open(offset_path + '.tmp', 'w') as offset_file:
+            offset_file.write('%d %d' % (line_no, last_line))
+        os.rename(offset_path + '.tmp', offset_path)
+
+    failures = 0
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        with open(plan_path) as plan_file:
+            for first_line, batch in plan_batches(plan_file, offset, batch_size):
+                failed = apply_plan_batch(hdfs, batch, archiver, executor,
+                                          replayed=max(0, applied - first_line + 1))
+                applied = max(applied, first_line + len(batch) - 1)
+                if not failures:
+                    offset = first_line + (min(failed) if failed else len(batch)) - 1
+                commit(offset, applied)
+                failures += len(failed)
+    finally:
+        executor.shutdown(wait=True)
+    logging.info("Plan %s applied with %d failed actions", plan_path, failures)
+    return failures
+
+
+def parse_args(args=None):
+    """
+    Parse command line
+    :return: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Clean up and archive HDFS data')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--plan', metavar='PLAN_FILE',
+                      help='write the actions of a run to PLAN_FILE without running them')
+    mode.add_argument('--execute', metavar='PLAN_FILE',
+                      help='run the actions of a plan written with --plan')
+    return parser.parse_args(args)
 
 
 def main():
@@ -324,7 +1677,7 @@ def main():
     # need to be removed, once spark refactoring happens
 
 
-
+    args = parse_args()
     jobs = list()
     with file('properties.json') as property_file:
         properties = json.load(property_file)
@@ -335,8 +1688,13 @@ def main():
     fileConfig('logconf.ini')
     logging.info("Discovered following endpoints from cluster manager{%s}", endpoints)
 
-    # setup endpoints
-    hdfs = HdfsClient(endpoints["HDFS"].geturl(), user_name='hdfs')
+    # setup endpoints, WebHDFS requests and commands are capped across concurrent jobs
+    max_operations = properties.get('max_concurrent_operations', MAX_CONCURRENT_OPERATIONS)
+    operation_slots = threading.BoundedSemaphore(max_operations)
+    webhdfs = PooledHdfsClient(endpoints["HDFS"].geturl(), user_name='hdfs',
+                               pool_size=max_operations)
+    hdfs = Throttle(webhdfs, operation_slots)
+    shell = Throttle(subprocess, operation_slots)
     hbase = endpoints["HBASE"].geturl()
 
     # Create s3 or swift bucket for archive purposes
@@ -367,39 +1725,131 @@ def main():
         logging.error("Failed to create %s container %s", container_type, properties['container_name'])
         logging.error(traceback.format_exc(ex))
 
+    archive_batch_size = properties.get('archive_batch_size', ARCHIVE_BATCH_SIZE)
+    if args.execute:
+        archiver = ArchiveBatch(properties['swift_repo'], hdfs,
+                                list_dir=properties.get('archive_list_dir', ARCHIVE_LIST_DIR),
+                                batch_size=archive_batch_size or ARCHIVE_BATCH_SIZE, shell=shell)
+        execute_plan(hdfs, args.execute, archiver, max_operations,
+                     properties.get('plan_batch_size', PLAN_BATCH_SIZE))
+        webhdfs.metrics.log_summary()
+        TELEMETRY.report(webhdfs.metrics, properties.get('telemetry_summary_file'),
+                         properties.get('telemetry_textfile'))
+        return
+
+    # in plan mode jobs record their actions instead of running them
+    plan = CleanupPlan(args.plan) if args.plan else None
+
+    def job_client(job_name, reason):
+        """
+        HDFS client of a job
+        """
+        if plan is None:
+            return hdfs
+        return PlanningHdfs(hdfs, plan, job_name, reason)
+
+    # directories are listed concurrently, with a cap on in flight WebHDFS requests
+    walker = ParallelWalker(job_client(None, None),
+                            max_workers=properties.get('hdfs_walk_workers', HDFS_WALK_WORKERS),
+                            max_in_flight=properties.get('hdfs_walk_max_requests',
+                                                         HDFS_WALK_MAX_REQUESTS))
+
     # create partial functions
-    delete_cmd = partial(delete, hdfs)
-    archive_cmd = partial(archive, properties['swift_repo'], hdfs)
+    archive_cmd = partial(archive, properties['swift_repo'], hdfs, shell=shell)
+
+    # a killed run is resumed from its checkpoints, there is nothing to resume in plan mode
+    checkpoints = None
+    if properties.get('checkpoint_file') and plan is None:
+        checkpoints = CheckpointStore(properties['checkpoint_file'])
 
     # clean spark directors
     spark_streaming_dirs_to_clean = properties['spark_streaming_dirs_to_clean']
-    cleanup_spark(spark_streaming_dirs_to_clean)
+    rm_url = properties.get('yarn_resource_manager')
+    if not rm_url and 'YARN' in endpoints:
+        rm_url = endpoints['YARN'].geturl()
+    if checkpoints is not None and checkpoints.is_done('spark'):
+        logging.info('Spark cleanup completed by an earlier attempt, skipping')
+    elif rm_url:
+        with TELEMETRY.job('spark'):
+            cleanup_spark(job_client('spark', 'finished application'),
+                          ResourceManagerApps(rm_url), spark_streaming_dirs_to_clean)
+        if checkpoints is not None:
+            checkpoints.finish('spark')
+    else:
+        logging.warn('ResourceManager endpoint not found, skipping spark cleanup')
+
+    # size policy evicts in walk order unless oldest first eviction is configured
+    size_strategy = cleanup_on_size
+    if properties.get('size_eviction_order') == 'oldest':
+        size_strategy = cleanup_on_size_oldest_first
+
+    # dataset age policy reads partition time from directory names when enabled
+    age_strategy = cleanup_on_age
+    watermarks = None
+    if properties.get('age_partition_pruning'):
+        age_strategy = cleanup_on_partition_age
+        # a plan must not advance watermarks, nothing is cleaned up yet
+        if properties.get('watermark_state_file') and plan is None:
+            watermarks = WatermarkStore(properties['watermark_state_file'],
+                                        properties.get('watermark_full_scan_seconds',
+                                                       WATERMARK_FULL_SCAN_PERIOD))
 
     # general directories to clean
     general_dirs_to_clean = properties['general_dirs_to_clean']
-    job_common_dirs = JOB('clean_general_dir', hdfs, cleanup_on_size, delete_cmd,
-                          general_dirs_to_clean, NEG_SIZE)
+    client = job_client('clean_general_dir', 'size')
+    job_common_dirs = JOB('clean_general_dir', client, size_strategy, partial(delete, client),
+                          general_dirs_to_clean, NEG_SIZE, walker)
     jobs.append(job_common_dirs)
 
     old_dirs_to_clean = properties['old_dirs_to_clean']
     for entry in old_dirs_to_clean:
         print entry['name']
         age = int(time.time() - entry['age_seconds'])
-        job_old_dirs = JOB('clean_old_dir', hdfs, cleanup_on_age, delete_cmd, entry['name'], age)
+        client = job_client('clean_old_dir', 'age')
+        job_old_dirs = JOB('clean_old_dir', client, cleanup_on_age, partial(delete, client),
+                           entry['name'], age, walker)
         jobs.append(job_old_dirs)
 
     # # Read all datasets
     data_sets = read_datasets_from_hbase(properties['datasets_table'], hbase)
     for item in data_sets:
         logging.debug("dataset item being scheduled {%s}", item)
-        cmd = delete_cmd if 'mode' in item and item["mode"] == "delete" else archive_cmd
-        strategy = cleanup_on_age if item['policy'] == "age" else cleanup_on_size
-        job = JOB(item['name'], hdfs, strategy, cmd, item['path'], item['retention'])
+        client = job_client(item['name'], item['policy'])
+        if 'mode' in item and item["mode"] == "delete":
+            cmd = partial(delete, client)
+        elif plan is not None:
+            cmd = client.plan_archive
+        elif archive_batch_size > 0:
+            cmd = ArchiveBatch(properties['swift_repo'], hdfs,
+                               list_dir=properties.get('archive_list_dir', ARCHIVE_LIST_DIR),
+                               batch_size=archive_batch_size, shell=shell)
+        else:
+            cmd = archive_cmd
+        strategy = age_strategy if item['policy'] == "age" else size_strategy
+        if strategy is cleanup_on_partition_age and watermarks is not None:
+            strategy = partial(strategy, watermarks=watermarks, name=item['name'])
+        job = JOB(item['name'], client, strategy, cmd, item['path'], item['retention'], walker)
         jobs.append(job)
 
-    for job in jobs:
-        logging.info(job.name)
-        job.run()
+    if checkpoints is not None:
+        for job in jobs:
+            job.progress = JobProgress(checkpoints, job.key(), job.cmd,
+                                       properties.get('checkpoint_interval_seconds',
+                                                      CHECKPOINT_INTERVAL))
+
+    scheduler = JobScheduler(properties.get('max_concurrent_jobs', MAX_CONCURRENT_JOBS))
+    failed = scheduler.run(jobs)
+    # failed jobs resume from their checkpoints, the others start over in the next run
+    if checkpoints is not None:
+        checkpoints.retain(failed)
+
+    walker.log_timings()
+    walker.shutdown()
+    webhdfs.metrics.log_summary()
+    if plan is not None:
+        plan.close()
+    TELEMETRY.report(webhdfs.metrics, properties.get('telemetry_summary_file'),
+                     properties.get('telemetry_textfile'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,218 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Walk HDFS directories with a single LISTSTATUS call per directory, sequentially
+   or on a bounded thread pool
+
+   data-service and hdfs-cleaner are packaged and deployed separately, each from its own
+   src/main/resources, so both hold an identical copy of this module. Change both copies
+   together, tests/test_hdfswalk.py of data-service checks that they match.
+"""
+
+import logging
+import posixpath
+import threading
+import time
+from collections import namedtuple
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+DIRECTORY = 'DIRECTORY'
+FILE = 'FILE'
+# listings a bottom up walk requests ahead of the directory it yields next
+LOOKAHEAD = 64
+
+HdfsEntry = namedtuple('HdfsEntry', ['path', 'type', 'length', 'modificationTime'])
+
+
+def list_entries(client, dir_path):
+    """
+    List a HDFS directory with one LISTSTATUS call
+    :param client: HdfsClient
+    :param dir_path: directory to list
+    :return: list of HdfsEntry for children of dir_path
+    """
+    return [HdfsEntry(posixpath.join(dir_path, status.pathSuffix), status.type,
+                      status.length, status.modificationTime)
+            for status in client.list_status(dir_path)]
+
+
+def walk_order(dir_path):
+    """
+    Sort key of a directory in bottom up walk order, a directory follows its subdirectories
+    and sibling subtrees are in path order
+    """
+    return tuple((0, name) for name in dir_path.rstrip('/').split('/')) + ((1,),)
+
+
+def dirwalk(client, dir_path):
+    """
+    Function to walk hdfs DIRECTORY, top down.
+    Type, length and modification time of every child come with the listing of its parent,
+    so the walk issues one request per directory.
+    :param client: HdfsClient
+    :param dir_path: directory to walk
+    :return: generator of HdfsEntry for every file and directory below dir_path
+    """
+    for entry in list_entries(client, dir_path):
+        yield entry
+        if entry.type == DIRECTORY:
+            for sub_entry in dirwalk(client, entry.path):  # recurse into subdir
+                yield sub_entry
+
+
+class ParallelWalker(object):
+    """
+    Walks HDFS trees listing sibling directories concurrently.
+    Listings run on a thread pool and the number of WebHDFS requests in flight is capped by
+    a semaphore, which can be shared between walkers to protect the NameNode.
+    Per depth the walker accumulates the number of directories listed and the time spent
+    listing them, see level_timings.
+    """
+
+    def __init__(self, client, max_workers=8, max_in_flight=None, slots=None,
+                 lookahead=LOOKAHEAD):
+        """
+        :param client: HdfsClient
+        :param max_workers: number of listing threads
+        :param max_in_flight: cap on concurrent listings, defaults to max_workers
+        :param slots: semaphore to share the cap with other walkers, overrides max_in_flight
+        :param lookahead: listings requested ahead by a bottom up walk
+        """
+        self.client = client
+        self.lookahead = lookahead
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = slots or threading.BoundedSemaphore(max_in_flight or max_workers)
+        self.level_timings = dict()
+        self.timing_lock = threading.Lock()
+
+    def shutdown(self):
+        """
+        Release listing threads
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+
+    def list_dir(self, dir_path, depth):
+        """
+        List a directory within the in flight cap and record its latency
+        :return: tuple of directory entries and file entries
+        """
+        with self.slots:
+            started = time.time()
+            entries = list_entries(self.client, dir_path)
+            elapsed = time.time() - started
+        with self.timing_lock:
+            timing = self.level_timings.setdefault(depth, [0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+        return ([entry for entry in entries if entry.type == DIRECTORY],
+                [entry for entry in entries if entry.type != DIRECTORY])
+
+    def walk(self, top, topdown=True, onerror=None, descend=None):
+        """
+        Walk the tree below top. Like os.walk but yields HdfsEntry lists.
+        Top down results are streamed as listings complete, a parent is always yielded before
+        its children. Bottom up results are yielded in post order, a directory right after
+        its subdirectories and sibling subtrees in path order, see walk_order.
+        :param top: directory to walk
+        :param topdown: yield parents before children
+        :param onerror: called with the exception when a directory can't be listed
+        :param descend: called with each directory entry, the directory is not listed when
+         it returns False
+        :return: generator of (dir_path, dir entries, file entries)
+        """
+        if topdown:
+            return self.stream(top, onerror, descend)
+        return self.bottom_up(top, onerror, descend)
+
+    def stream(self, top, onerror, descend=None):
+        """
+        Yield listings in completion order, submitting children as soon as parent is listed
+        """
+        pending = {self.executor.submit(self.list_dir, top, 0): (top, 0)}
+        try:
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_path, depth = pending.pop(future)
+                    try:
+                        dirs, files = future.result()
+                    except Exception as exception:
+                        if onerror is not None:
+                            onerror(exception)
+                        continue
+                    for entry in dirs:
+                        if descend is not None and not descend(entry):
+                            continue
+                        pending[self.executor.submit(self.list_dir, entry.path, depth + 1)] = \
+                            (entry.path, depth + 1)
+                    yield dir_path, dirs, files
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def bottom_up(self, top, onerror, descend=None):
+        """
+        Yield directories in post order. Listings are consumed in pre order and requested
+        for up to lookahead of the directories next in that order, so only listings of the
+        directories being walked and of the lookahead are held, whatever the size of the tree.
+        """
+        # directories to walk in pre order, the next one last, and listings requested
+        queued = [(top, 0)]
+        requested = dict()
+        # directories whose subtree is being walked, with the number of subdirectories left
+        ancestors = list()
+        try:
+            while queued:
+                for dir_path, depth in reversed(queued):
+                    if len(requested) >= self.lookahead:
+                        break
+                    if dir_path not in requested:
+                        requested[dir_path] = self.executor.submit(self.list_dir, dir_path,
+                                                                   depth)
+                dir_path, depth = queued.pop()
+                try:
+                    dirs, files = requested.pop(dir_path).result()
+                except Exception as exception:
+                    if onerror is not None:
+                        onerror(exception)
+                    # a directory that can't be listed has no subtree and isn't yielded
+                    ancestors.append([dir_path, None, None, 0])
+                else:
+                    children = sorted((entry.path for entry in dirs
+                                       if descend is None or descend(entry)), reverse=True)
+                    queued.extend((child, depth + 1) for child in children)
+                    ancestors.append([dir_path, dirs, files, len(children)])
+                while ancestors and ancestors[-1][3] == 0:
+                    dir_path, dirs, files, _ = ancestors.pop()
+                    if ancestors:
+                        ancestors[-1][3] -= 1
+                    if dirs is not None:
+                        yield dir_path, dirs, files
+        finally:
+            for future in requested.values():
+                future.cancel()
+
+    def log_timings(self):
+        """
+        Log directories listed and listing time per depth
+        :return: None
+        """
+        with self.timing_lock:
+            for depth in sorted(self.level_timings):
+                directories, seconds = self.level_timings[depth]
+                logging.info("HDFS walk depth:%d directories:%d listing time:%.3fs",
+                             depth, directories, seconds)
@@ -0,0 +1,184 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: In memory HDFS and command fakes for cleanup tests
+"""
+import imp
+import os
+import posixpath
+import subprocess
+
+from pyhdfs import ContentSummary
+from pyhdfs import FileStatus
+from pyhdfs import HdfsException
+from pyhdfs import HdfsFileNotFoundException
+
+
+def load_cleaner():
+    """
+    Load hdfs-cleaner.py, its file name is not a valid module name
+    """
+    return imp.load_source('hdfs_cleaner', os.path.join(os.path.dirname(__file__), os.pardir,
+                                                         'hdfs-cleaner.py'))
+
+
+class Killed(BaseException):
+    """
+    Raised by FakeHdfs to interrupt a run, like a signal it is not caught by the jobs
+    """
+    pass
+
+
+class FakeHdfs(object):
+    """
+    In memory HDFS tree, directories are dicts and files are sizes.
+    Modification times default to 0, set them with touch.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.mtimes = dict()
+        self.listed = list()
+        self.stats = list()
+        self.deleted = list()
+        self.kill_on = set()
+        self.unlistable = set()
+        self.undeletable = set()
+        self.created = dict()
+
+    def node(self, path):
+        node = self.tree
+        for part in [p for p in path.split('/') if p]:
+            if not isinstance(node, dict) or part not in node:
+                raise HdfsFileNotFoundException('File %s does not exist.' % path,
+                                                exception='FileNotFoundException',
+                                                status_code=404,
+                                                javaClassName='java.io.FileNotFoundException')
+            node = node[part]
+        return node
+
+    def exists(self, path):
+        try:
+            self.node(path)
+            return True
+        except HdfsFileNotFoundException:
+            return False
+
+    def files(self, path='/'):
+        """
+        Paths of all files below path
+        """
+        node = self.node(path)
+        if not isinstance(node, dict):
+            return [path]
+        return sorted(file_path for name in node
+                      for file_path in self.files(posixpath.join(path, name)))
+
+    def touch(self, path, mtime):
+        self.mtimes[path.rstrip('/')] = mtime
+
+    def list_status(self, path, **kwargs):
+        # pylint: disable=unused-argument
+        self.listed.append(path)
+        if path in self.unlistable:
+            raise HdfsException('Failed to list %s' % path)
+        statuses = list()
+        for name, value in sorted(self.node(path).items()):
+            child = posixpath.join(path.rstrip('/'), name)
+            file_type = 'DIRECTORY' if isinstance(value, dict) else 'FILE'
+            statuses.append(FileStatus(pathSuffix=name, type=file_type,
+                                       modificationTime=self.mtimes.get(child, 0),
+                                       length=0 if file_type == 'DIRECTORY' else value))
+        return statuses
+
+    def listdir(self, path, **kwargs):
+        # pylint: disable=unused-argument
+        return sorted(self.node(path))
+
+    def get_file_status(self, path, **kwargs):
+        # pylint: disable=unused-argument
+        self.stats.append(path)
+        node = self.node(path)
+        return FileStatus(pathSuffix=posixpath.basename(path),
+                          type='DIRECTORY' if isinstance(node, dict) else 'FILE',
+                          modificationTime=self.mtimes.get(path.rstrip('/'), 0),
+                          length=0 if isinstance(node, dict) else node)
+
+    def get_content_summary(self, path, **kwargs):
+        # pylint: disable=unused-argument
+        files = self.files(path)
+        return ContentSummary(length=sum(self.node(file_path) for file_path in files),
+                              fileCount=len(files))
+
+    def delete(self, path, recursive=False, **kwargs):
+        # pylint: disable=unused-argument
+        path = path.rstrip('/')
+        if path in self.kill_on:
+            raise Killed(path)
+        if path in self.undeletable:
+            raise HdfsException('Failed to delete %s' % path)
+        if not self.exists(path):
+            return False
+        node = self.node(path)
+        if isinstance(node, dict) and node and not recursive:
+            raise HdfsException('%s is non empty' % path)
+        del self.node(posixpath.dirname(path))[posixpath.basename(path)]
+        self.deleted.append(path)
+        return True
+
+    def create(self, path, data, **kwargs):
+        # pylint: disable=unused-argument
+        node = self.tree
+        for part in [p for p in posixpath.dirname(path).split('/') if p]:
+            node = node.setdefault(part, dict())
+        node[posixpath.basename(path)] = len(data)
+        self.created[path] = data
+
+
+class FakeShell(object):
+    """
+    subprocess stand-in for archives, DistCp fails for the target directories in fail_on.
+    Given the FakeHdfs, DistCp also fails when a source of its file list is missing.
+    """
+    def __init__(self, fail_on=(), hdfs=None):
+        self.fail_on = set(fail_on)
+        self.hdfs = hdfs
+        self.copied = list()
+        self.commands = list()
+
+    def call(self, args, **kwargs):
+        # pylint: disable=unused-argument
+        self.commands.append(args)
+        return 0
+
+    def check_output(self, args, **kwargs):
+        # pylint: disable=unused-argument
+        self.commands.append(args)
+        if args[-1] in self.fail_on:
+            raise subprocess.CalledProcessError(1, args, 'copy failed')
+        if self.hdfs is not None and args[:3] == ['hadoop', 'distcp', '-f']:
+            for source in self.hdfs.created[args[3]].split('\n'):
+                if not self.hdfs.exists(source):
+                    raise subprocess.CalledProcessError(1, args, '%s not found' % source)
+        self.copied.append(args[-1])
+        return ''
+
+
+class RecordingCmd(object):
+    """
+    Cleanup command that only records the files it is called with
+    """
+    def __init__(self):
+        self.paths = list()
+
+    def __call__(self, file_path):
+        self.paths.append(file_path)
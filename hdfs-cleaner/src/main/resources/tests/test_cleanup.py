@@ -0,0 +1,453 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests for the age and size cleanup policies
+"""
+import calendar
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from functools import partial
+from unittest import TestCase
+
+from .fakes import FakeHdfs
+from .fakes import FakeShell
+from .fakes import Killed
+from .fakes import RecordingCmd
+from .fakes import load_cleaner
+
+CLEANER = load_cleaner()
+# files modified at or before AGE seconds since epoch are expired
+AGE = 100
+FRESH = 200 * 1000
+
+
+class CheckpointTestCase(TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.state_dir, 'checkpoints.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def progress(self, cmd):
+        store = CLEANER.CheckpointStore(self.state_path)
+        return CLEANER.JobProgress(store, 'age', cmd, interval=0)
+
+
+class TestCleanupOnAgeResume(CheckpointTestCase):
+    def test_resume_keeps_deferred_subtrees(self):
+        hdfs = FakeHdfs({'d': {'a': {'f1': 10}, 'b': {'f2': 10}}})
+        hdfs.touch('/d/b/f2', FRESH)
+        cmd = partial(CLEANER.delete, hdfs)
+        # killed before the expired subtree, deferred to its parent, is deleted
+        hdfs.kill_on.add('/d/a')
+        self.assertRaises(Killed, CLEANER.cleanup_on_age, hdfs, cmd, '/d', AGE,
+                          progress=self.progress(cmd))
+        hdfs.kill_on.clear()
+        CLEANER.cleanup_on_age(hdfs, cmd, '/d', AGE, progress=self.progress(cmd))
+        self.assertEqual(hdfs.files(), ['/d/b/f2'])
+        self.assertEqual(hdfs.deleted, ['/d/a'])
+
+    def test_resume_skips_completed(self):
+        hdfs = FakeHdfs({'d': {'a': {'f1': 10, 'f2': 10}, 'b': {'f3': 10, 'f4': 10}}})
+        hdfs.touch('/d/a/f2', FRESH)
+        hdfs.touch('/d/b/f4', FRESH)
+        cmd = partial(CLEANER.delete, hdfs)
+        hdfs.kill_on.add('/d/b/f3')
+        self.assertRaises(Killed, CLEANER.cleanup_on_age, hdfs, cmd, '/d', AGE,
+                          progress=self.progress(cmd))
+        hdfs.kill_on.clear()
+        del hdfs.listed[:]
+        CLEANER.cleanup_on_age(hdfs, cmd, '/d', AGE, progress=self.progress(cmd))
+        self.assertEqual(hdfs.files(), ['/d/a/f2', '/d/b/f4'])
+        self.assertEqual(hdfs.deleted, ['/d/a/f1', '/d/b/f3'])
+
+
+class TestPartitionAgeWatermark(CheckpointTestCase):
+    def setUp(self):
+        super(TestPartitionAgeWatermark, self).setUp()
+        self.watermark_path = os.path.join(self.state_dir, 'watermarks.json')
+        self.age = calendar.timegm(datetime.datetime(2017, 6, 1).timetuple())
+
+    def get_hdfs(self):
+        return FakeHdfs({'ds': {'year=2016': {'month=01': {'f1': 10}},
+                                'year=2017': {'month=01': {'f2': 10}, 'month=12': {'f3': 10}}}})
+
+    def cleanup(self, hdfs, cmd):
+        watermarks = CLEANER.WatermarkStore(self.watermark_path)
+        failures = CLEANER.cleanup_on_partition_age(hdfs, cmd, '/ds', self.age,
+                                                    watermarks=watermarks, name='ds')
+        return failures, CLEANER.WatermarkStore(self.watermark_path).since('ds')
+
+    def test_advance(self):
+        hdfs = self.get_hdfs()
+        self.assertEqual(self.cleanup(hdfs, partial(CLEANER.delete, hdfs)), (0, self.age * 1000))
+        self.assertEqual(hdfs.files(), ['/ds/year=2017/month=12/f3'])
+
+    def test_kept_on_listing_failure(self):
+        hdfs = self.get_hdfs()
+        hdfs.unlistable.add('/ds/year=2017')
+        self.assertEqual(self.cleanup(hdfs, partial(CLEANER.delete, hdfs)), (1, None))
+        self.assertEqual(hdfs.files(), ['/ds/year=2017/month=01/f2', '/ds/year=2017/month=12/f3'])
+
+    def test_kept_on_archive_failure(self):
+        hdfs = self.get_hdfs()
+        shell = FakeShell(fail_on=['/archive/2017/2017-01'])
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, shell=shell)
+        self.assertEqual(self.cleanup(hdfs, cmd), (1, None))
+        self.assertEqual(shell.copied, ['/archive/2016/2016-01'])
+        self.assertEqual(hdfs.files(), ['/ds/year=2017/month=01/f2', '/ds/year=2017/month=12/f3'])
+
+
+class TestCleanupOnAge(TestCase):
+    def get_hdfs(self):
+        hdfs = FakeHdfs({'d': {'old': {'a': {'f1': 10}, 'f2': 10},
+                               'mixed': {'f3': 10, 'f4': 10},
+                               'fresh': {'f5': 10}}})
+        hdfs.touch('/d/mixed/f4', FRESH)
+        hdfs.touch('/d/fresh', FRESH)
+        hdfs.touch('/d/fresh/f5', FRESH)
+        return hdfs
+
+    def test_mixed_subtrees(self):
+        hdfs = self.get_hdfs()
+        CLEANER.cleanup_on_age(hdfs, partial(CLEANER.delete, hdfs), '/d', AGE)
+        self.assertEqual(hdfs.files(), ['/d/fresh/f5', '/d/mixed/f4'])
+        # the expired subtree is removed with one recursive delete
+        self.assertEqual(hdfs.deleted, ['/d/mixed/f3', '/d/old'])
+
+    def test_trailing_slash(self):
+        hdfs = self.get_hdfs()
+        CLEANER.cleanup_on_age(hdfs, partial(CLEANER.delete, hdfs), '/d/', AGE)
+        self.assertEqual(hdfs.files(), ['/d/fresh/f5', '/d/mixed/f4'])
+        self.assertEqual(hdfs.deleted, ['/d/mixed/f3', '/d/old'])
+
+    def test_recorded_cmd(self):
+        hdfs = self.get_hdfs()
+        cmd = RecordingCmd()
+        CLEANER.cleanup_on_age(hdfs, cmd, '/d', AGE)
+        # other commands are called file by file
+        self.assertEqual(sorted(cmd.paths), ['/d/mixed/f3', '/d/old/a/f1', '/d/old/f2'])
+        self.assertEqual(hdfs.deleted, [])
+
+    def test_archive(self):
+        hdfs = self.get_hdfs()
+        shell = FakeShell()
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, shell=shell)
+        CLEANER.cleanup_on_age(hdfs, cmd, '/d', AGE)
+        cmd.flush()
+        self.assertEqual(shell.copied, ['/archive'])
+        self.assertEqual(hdfs.files(), ['/d/fresh/f5', '/d/mixed/f4'])
+        # directories emptied by the archive are removed
+        self.assertFalse(hdfs.exists('/d/old/a'))
+        # one DistCp job copies the files in walk order
+        self.assertEqual(hdfs.created.values(), ['/d/mixed/f3\n/d/old/a/f1\n/d/old/f2'])
+
+    def test_partitioned(self):
+        hdfs = FakeHdfs({'ds': {'year=2016': {'month=01': {'f1': 10}},
+                                'year=2017': {'month=05': {'f2': 10}, 'month=12': {'f3': 10},
+                                              'f4': 10}}})
+        age = calendar.timegm(datetime.datetime(2017, 6, 1).timetuple())
+        # partition time wins over modification times
+        hdfs.touch('/ds/year=2017/month=05/f2', (age + 1) * 1000)
+        hdfs.touch('/ds/year=2017/f4', (age + 1) * 1000)
+        CLEANER.cleanup_on_age(hdfs, partial(CLEANER.delete, hdfs), '/ds', age,
+                               partitioned=True)
+        self.assertEqual(hdfs.files(), ['/ds/year=2017/f4', '/ds/year=2017/month=12/f3'])
+        self.assertEqual(hdfs.deleted, ['/ds/year=2017/month=05', '/ds/year=2016'])
+        # expired and future partitions are not listed
+        self.assertEqual(sorted(hdfs.listed), ['/ds', '/ds/year=2017'])
+
+
+class TestCleanupOnSize(CheckpointTestCase):
+    def get_hdfs(self):
+        return FakeHdfs({'d': {'a': {'f1': 10, 'f2': 10}, 'b': {'f3': 10, 'f4': 10}}})
+
+    def test_evicts_until_threshold(self):
+        hdfs = self.get_hdfs()
+        CLEANER.cleanup_on_size(hdfs, partial(CLEANER.delete, hdfs), '/d', 25)
+        self.assertEqual(hdfs.files(), ['/d/b/f3', '/d/b/f4'])
+        self.assertEqual(hdfs.deleted, ['/d/a/f1', '/d/a/f2', '/d/a'])
+        # file sizes come with the listings
+        self.assertEqual(hdfs.stats, [])
+
+    def test_trailing_slash(self):
+        hdfs = self.get_hdfs()
+        CLEANER.cleanup_on_size(hdfs, partial(CLEANER.delete, hdfs), '/d/', 15)
+        self.assertEqual(hdfs.files(), ['/d/b/f4'])
+
+    def test_within_threshold(self):
+        hdfs = self.get_hdfs()
+        CLEANER.cleanup_on_size(hdfs, partial(CLEANER.delete, hdfs), '/d', 40)
+        self.assertEqual(hdfs.deleted, [])
+        self.assertEqual(hdfs.listed, [])
+
+    def test_archive(self):
+        hdfs = FakeHdfs({'d': {'source=x': {'year=2017': {'f1': 10, 'f2': 10}}}})
+        shell = FakeShell()
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, shell=shell)
+        CLEANER.cleanup_on_size(hdfs, cmd, '/d', 5)
+        cmd.flush()
+        self.assertEqual(shell.copied, ['/archive/x/x-2017'])
+        self.assertEqual(hdfs.files(), [])
+
+    def test_resume(self):
+        hdfs = self.get_hdfs()
+        cmd = partial(CLEANER.delete, hdfs)
+        hdfs.kill_on.add('/d/b/f3')
+        self.assertRaises(Killed, CLEANER.cleanup_on_size, hdfs, cmd, '/d', 5,
+                          progress=self.progress(cmd))
+        hdfs.kill_on.clear()
+        CLEANER.cleanup_on_size(hdfs, cmd, '/d', 5, progress=self.progress(cmd))
+        self.assertEqual(hdfs.files(), [])
+        self.assertEqual(hdfs.deleted, ['/d/a/f1', '/d/a/f2', '/d/b/f3', '/d/b/f4', '/d/a',
+                                        '/d/b'])
+
+
+    def test_failures(self):
+        hdfs = FakeHdfs({'d': {'source=x': {'year=2017': {'f1': 10, 'f2': 10}},
+                               'other': {'f3': 10}}})
+        hdfs.unlistable.add('/d/other')
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, shell=FakeShell(['/archive/x/x-2017']))
+        # files that failed to archive when a checkpoint flushed them count too
+        self.assertEqual(CLEANER.cleanup_on_size(hdfs, cmd, '/d', 5, progress=self.progress(cmd)),
+                         3)
+        self.assertEqual(hdfs.files(), ['/d/other/f3', '/d/source=x/year=2017/f1',
+                                        '/d/source=x/year=2017/f2'])
+
+    def test_missing_directory(self):
+        hdfs = self.get_hdfs()
+        cmd = partial(CLEANER.delete, hdfs)
+        self.assertEqual(CLEANER.cleanup_on_size(hdfs, cmd, ['/missing', '/d'], 25), 1)
+        self.assertEqual(hdfs.files(), ['/d/b/f3', '/d/b/f4'])
+
+    def test_oldest_first_failures(self):
+        hdfs = FakeHdfs({'ds': {'year=2016': {'f1': 10}, 'year=2017': {'f2': 10},
+                                'other': {'f3': 10}}})
+        hdfs.unlistable.add('/ds/other')
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, shell=FakeShell(['/archive/2017/2017']))
+        self.assertEqual(CLEANER.cleanup_on_size_oldest_first(hdfs, cmd, '/ds', 0), 2)
+        self.assertEqual(hdfs.files(), ['/ds/other/f3', '/ds/year=2017/f2'])
+
+
+class TestCheckpointStore(CheckpointTestCase):
+    def test_retain(self):
+        store = CLEANER.CheckpointStore(self.state_path)
+        store.update('failed', '/d', '/d/a')
+        store.finish('done')
+        store.retain(['failed', 'unknown'])
+        with open(self.state_path) as state_file:
+            self.assertEqual(json.load(state_file),
+                             {'failed': {'done': False, 'dirs': {'/d': '/d/a'}}})
+        self.assertEqual(CLEANER.CheckpointStore(self.state_path).last_dir('failed', '/d'),
+                         '/d/a')
+        store.retain([])
+        self.assertFalse(os.path.exists(self.state_path))
+
+
+class TestEvictOldestFirst(TestCase):
+    def get_hdfs(self):
+        hdfs = FakeHdfs({'ds': {'year=2016': {'month=12': {'f1': 10, 'f2': 10}},
+                                'year=2017': {'month=01': {'f3': 10}, 'month=02': {'f4': 10}}}})
+        for mtime, file_path in enumerate(['/ds/year=2017/month=01/f3',
+                                           '/ds/year=2016/month=12/f2',
+                                           '/ds/year=2016/month=12/f1',
+                                           '/ds/year=2017/month=02/f4']):
+            hdfs.touch(file_path, mtime)
+        return hdfs
+
+    def test_oldest_first(self):
+        hdfs = self.get_hdfs()
+        space = CLEANER.evict_oldest_first(hdfs, partial(CLEANER.delete, hdfs), '/ds', 40, 15,
+                                           None)
+        self.assertEqual(space, 10)
+        self.assertEqual(hdfs.files(), ['/ds/year=2017/month=02/f4'])
+        self.assertEqual(hdfs.deleted[:3], ['/ds/year=2017/month=01/f3',
+                                            '/ds/year=2016/month=12/f2',
+                                            '/ds/year=2016/month=12/f1'])
+        # emptied directories are removed deepest first, the cleaned directory is kept
+        self.assertEqual(sorted(hdfs.deleted[3:5]), ['/ds/year=2016/month=12',
+                                                     '/ds/year=2017/month=01'])
+        self.assertEqual(hdfs.deleted[5:], ['/ds/year=2016'])
+        self.assertEqual(hdfs.stats, [])
+
+    def test_trailing_slash(self):
+        hdfs = self.get_hdfs()
+        CLEANER.evict_oldest_first(hdfs, partial(CLEANER.delete, hdfs), '/ds/', 40, 0, None)
+        self.assertEqual(hdfs.files(), [])
+        self.assertEqual(hdfs.listdir('/ds'), [])
+
+    def test_archive(self):
+        hdfs = self.get_hdfs()
+        shell = FakeShell(fail_on=['/archive/2017/2017-02'])
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, shell=shell)
+        CLEANER.evict_oldest_first(hdfs, cmd, '/ds', 40, 0, None)
+        self.assertEqual(shell.copied, ['/archive/2017/2017-01', '/archive/2016/2016-12'])
+        # directories are removed once archived, the one that failed to archive is kept
+        self.assertEqual(hdfs.files(), ['/ds/year=2017/month=02/f4'])
+        self.assertEqual(hdfs.listdir('/ds'), ['year=2017'])
+        self.assertEqual(hdfs.listdir('/ds/year=2017'), ['month=02'])
+
+
+class TestPlan(CheckpointTestCase):
+    def setUp(self):
+        super(TestPlan, self).setUp()
+        self.plan_path = os.path.join(self.state_dir, 'plan.jsonl')
+
+    def get_hdfs(self):
+        hdfs = FakeHdfs({'d': {'old': {'a': {'f1': 10}, 'f2': 20},
+                               'mixed': {'f3': 30, 'f4': 10}}})
+        hdfs.touch('/d/mixed/f4', FRESH)
+        return hdfs
+
+    def read_plan(self):
+        with open(self.plan_path) as plan_file:
+            return [json.loads(line) for line in plan_file]
+
+    def write_plan(self, actions):
+        with open(self.plan_path, 'w') as plan_file:
+            for action in actions:
+                plan_file.write(json.dumps(action) + '\n')
+
+    def test_plan_records_actions(self):
+        hdfs = self.get_hdfs()
+        plan = CLEANER.CleanupPlan(self.plan_path)
+        client = CLEANER.PlanningHdfs(hdfs, plan, 'ds', 'age')
+        CLEANER.cleanup_on_age(client, partial(CLEANER.delete, client), '/d', AGE)
+        client = CLEANER.PlanningHdfs(hdfs, plan, 'logs', 'size')
+        CLEANER.cleanup_on_size(client, client.plan_archive, '/d/mixed/', 15)
+        # lengths are only kept until a directory was processed
+        self.assertEqual(plan.lengths, {})
+        plan.close()
+        # nothing is deleted in plan mode
+        self.assertEqual(hdfs.deleted, [])
+        self.assertEqual(self.read_plan(), [
+            {'job': 'ds', 'action': 'delete', 'path': '/d/mixed/f3', 'bytes': 30,
+             'reason': 'age'},
+            {'job': 'ds', 'action': 'delete_tree', 'path': '/d/old', 'bytes': 30,
+             'reason': 'expired subtree'},
+            {'job': 'logs', 'action': 'archive', 'path': '/d/mixed/f3', 'bytes': 30,
+             'reason': 'size'}])
+        with open(self.plan_path + '.totals.json') as totals_file:
+            self.assertEqual(json.load(totals_file), {'ds': {'actions': 2, 'bytes': 60},
+                                                      'logs': {'actions': 1, 'bytes': 30}})
+
+    def test_empty_directory(self):
+        hdfs = FakeHdfs({'d': {'a': {'f1': 10}}})
+        plan = CLEANER.CleanupPlan(self.plan_path)
+        client = CLEANER.PlanningHdfs(hdfs, plan, 'logs', 'size')
+        CLEANER.evict_oldest_first(client, partial(CLEANER.delete, client), '/d', 10, 0, None)
+        self.assertEqual(plan.lengths, {})
+        plan.close()
+        self.assertEqual([(action['action'], action['path'], action['bytes'])
+                          for action in self.read_plan()],
+                         [('delete', '/d/a/f1', 10), ('delete_dir', '/d/a', 0)])
+
+    def test_execute(self):
+        hdfs = self.get_hdfs()
+        plan = CLEANER.CleanupPlan(self.plan_path)
+        client = CLEANER.PlanningHdfs(hdfs, plan, 'ds', 'age')
+        CLEANER.cleanup_on_age(client, partial(CLEANER.delete, client), '/d', AGE)
+        plan.close()
+        archiver = CLEANER.ArchiveBatch('/archive', hdfs, shell=FakeShell())
+        self.assertEqual(CLEANER.execute_plan(hdfs, self.plan_path, archiver, 2, batch_size=1), 0)
+        self.assertEqual(hdfs.files(), ['/d/mixed/f4'])
+        with open(self.plan_path + '.offset') as offset_file:
+            self.assertEqual(offset_file.read(), '2 2')
+        # a completed plan is not applied again
+        del hdfs.deleted[:]
+        self.assertEqual(CLEANER.execute_plan(hdfs, self.plan_path, archiver, 2), 0)
+        self.assertEqual(hdfs.deleted, [])
+
+    def test_replay_after_failure(self):
+        hdfs = FakeHdfs({'d': {'x=1': {'f1': 10}, 'x=2': {'f2': 10}, 'x=3': {'f3': 10}}})
+        self.write_plan([{'action': 'archive', 'path': '/d/x=1/f1', 'bytes': 10},
+                         {'action': 'archive', 'path': '/d/x=2/f2', 'bytes': 10},
+                         {'action': 'delete', 'path': '/d/x=3/f3', 'bytes': 10}])
+        shell = FakeShell(fail_on=['/archive/2/2'], hdfs=hdfs)
+        archiver = CLEANER.ArchiveBatch('/archive', hdfs, shell=shell)
+        self.assertEqual(CLEANER.execute_plan(hdfs, self.plan_path, archiver, 2), 1)
+        self.assertEqual(hdfs.files(), ['/d/x=2/f2'])
+        with open(self.plan_path + '.offset') as offset_file:
+            self.assertEqual(offset_file.read(), '1 3')
+        # actions applied by the failed run are not retried, their files are gone
+        shell.fail_on.clear()
+        del shell.copied[:]
+        self.assertEqual(CLEANER.execute_plan(hdfs, self.plan_path, archiver, 2), 0)
+        self.assertEqual(shell.copied, ['/archive/2/2'])
+        self.assertEqual(hdfs.files(), [])
+        with open(self.plan_path + '.offset') as offset_file:
+            self.assertEqual(offset_file.read(), '3 3')
+
+
+class TestArchiveBatch(TestCase):
+    def get_hdfs(self):
+        return FakeHdfs({'d': {'source=x': {'year=2017': {
+            'month=01': {'f1': 10, 'f2': 10}, 'month=02': {'f3': 10}}}}})
+
+    def archive(self, hdfs, shell, **kwargs):
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, list_dir='/lists', shell=shell, **kwargs)
+        failed = list()
+        for file_path in hdfs.files('/d'):
+            failed.extend(cmd(file_path))
+        return failed + cmd.flush()
+
+    def test_one_copy_per_partition(self):
+        hdfs = self.get_hdfs()
+        shell = FakeShell(hdfs=hdfs)
+        self.assertEqual(self.archive(hdfs, shell), [])
+        targets = ['/archive/x/x-2017-01', '/archive/x/x-2017-02']
+        self.assertEqual(shell.commands[0], ['hdfs', 'dfs', '-mkdir', '-p'] + targets)
+        copies = shell.commands[1:]
+        self.assertEqual([command[:3] + command[4:] for command in copies],
+                         [['hadoop', 'distcp', '-f', target] for target in targets])
+        self.assertEqual([hdfs.created[command[3]] for command in copies],
+                         ['/d/source=x/year=2017/month=01/f1\n/d/source=x/year=2017/month=01/f2',
+                          '/d/source=x/year=2017/month=02/f3'])
+        # file lists, sources and emptied directories are removed
+        self.assertEqual(hdfs.listdir('/lists'), [])
+        self.assertEqual(hdfs.listdir('/d/source=x/year=2017'), [])
+
+    def test_batch_size(self):
+        hdfs = self.get_hdfs()
+        shell = FakeShell(hdfs=hdfs)
+        cmd = CLEANER.ArchiveBatch('/archive', hdfs, list_dir='/lists', shell=shell,
+                                   batch_size=2)
+        cmd('/d/source=x/year=2017/month=01/f1')
+        cmd('/d/source=x/year=2017/month=02/f3')
+        self.assertEqual(shell.copied, [])
+        # a full group is copied right away
+        self.assertEqual(cmd('/d/source=x/year=2017/month=01/f2'), [])
+        self.assertEqual(shell.copied, ['/archive/x/x-2017-01'])
+        self.assertEqual(cmd.flush(), [])
+        self.assertEqual(hdfs.files('/d'), [])
+
+    def test_copy_failure(self):
+        hdfs = self.get_hdfs()
+        shell = FakeShell(fail_on=['/archive/x/x-2017-01'], hdfs=hdfs)
+        self.assertEqual(self.archive(hdfs, shell), ['/d/source=x/year=2017/month=01/f1',
+                                                     '/d/source=x/year=2017/month=01/f2'])
+        self.assertEqual(hdfs.files('/d'), ['/d/source=x/year=2017/month=01/f1',
+                                            '/d/source=x/year=2017/month=01/f2'])
+        self.assertEqual(hdfs.listdir('/lists'), [])
+
+    def test_source_delete_failure(self):
+        hdfs = self.get_hdfs()
+        hdfs.undeletable.add('/d/source=x/year=2017/month=01/f1')
+        shell = FakeShell(hdfs=hdfs)
+        self.assertEqual(self.archive(hdfs, shell), ['/d/source=x/year=2017/month=01/f1'])
+        # the other sources of the group are still deleted
+        self.assertEqual(hdfs.files('/d'), ['/d/source=x/year=2017/month=01/f1'])
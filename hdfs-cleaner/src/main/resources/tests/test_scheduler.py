@@ -0,0 +1,169 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests of concurrent job scheduling and of the shared operation cap
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .fakes import FakeHdfs, load_cleaner
+
+CLEANER = load_cleaner()
+
+# how long a blocked job waits for the others before giving up
+WAIT = 0.5
+
+
+class Gate(object):
+    """
+    Tracks how many callers are inside at once. A caller stays until wanted callers are
+    inside together or WAIT expires.
+    """
+    def __init__(self, wanted):
+        self.wanted = wanted
+        self.condition = threading.Condition()
+        self.inside = 0
+        self.peak = 0
+        self.entered = list()
+
+    def enter(self, name):
+        with self.condition:
+            self.inside += 1
+            self.peak = max(self.peak, self.inside)
+            self.entered.append(name)
+            self.condition.notify_all()
+            deadline = time.time() + WAIT
+            while self.peak < self.wanted and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+            self.inside -= 1
+
+    def strategy(self, hdfs, cmd, clean_path, threshold, walker=None, progress=None):
+        # pylint: disable=unused-argument
+        self.enter(clean_path)
+
+
+def failing_strategy(hdfs, cmd, clean_path, threshold, walker=None, progress=None):
+    # pylint: disable=unused-argument
+    raise ValueError('broken %s' % clean_path)
+
+
+class GatedHdfs(FakeHdfs):
+    """
+    FakeHdfs whose listings block in a Gate
+    """
+    def __init__(self, tree, gate):
+        FakeHdfs.__init__(self, tree)
+        self.gate = gate
+
+    def list_status(self, path, **kwargs):
+        self.gate.enter(path)
+        return FakeHdfs.list_status(self, path, **kwargs)
+
+
+def partial_failure(hdfs, cmd, clean_path, threshold, walker=None, progress=None):
+    # pylint: disable=unused-argument
+    return 2
+
+
+def job(name, strategy, paths):
+    return CLEANER.JOB(name, FakeHdfs({}), strategy, None, paths, 0)
+
+
+class TestPathsOverlap(TestCase):
+    def test_overlap(self):
+        self.assertTrue(CLEANER.paths_overlap('/data', '/data'))
+        self.assertTrue(CLEANER.paths_overlap('/data/', '/data'))
+        self.assertTrue(CLEANER.paths_overlap('/data', '/data/a/b'))
+        self.assertTrue(CLEANER.paths_overlap('/data/a/b', '/data'))
+        self.assertTrue(CLEANER.paths_overlap('/', '/data'))
+
+    def test_disjoint(self):
+        self.assertFalse(CLEANER.paths_overlap('/data', '/database'))
+        self.assertFalse(CLEANER.paths_overlap('/data/a', '/data/b'))
+
+
+class TestJobScheduler(TestCase):
+    def test_overlapping_jobs_run_one_after_another(self):
+        gate = Gate(2)
+        scheduler = CLEANER.JobScheduler(max_workers=2)
+        scheduler.run([job('outer', gate.strategy, '/d'),
+                       job('inner', gate.strategy, ['/e', '/d/x'])])
+        self.assertEqual(gate.peak, 1)
+        self.assertEqual(sorted(gate.entered), [['/e', '/d/x'], '/d'])
+
+    def test_disjoint_jobs_run_in_parallel(self):
+        gate = Gate(2)
+        scheduler = CLEANER.JobScheduler(max_workers=2)
+        scheduler.run([job('first', gate.strategy, '/d/x'),
+                       job('second', gate.strategy, '/d/y')])
+        self.assertEqual(gate.peak, 2)
+        self.assertEqual(sorted(status for _, _, status in scheduler.runtimes), ['done', 'done'])
+
+    def test_failed_job(self):
+        gate = Gate(1)
+        scheduler = CLEANER.JobScheduler(max_workers=2)
+        scheduler.run([job('broken', failing_strategy, '/d'),
+                       job('after', gate.strategy, '/d/x')])
+        self.assertEqual(gate.entered, ['/d/x'])
+        self.assertEqual(sorted((name, status) for name, _, status in scheduler.runtimes),
+                         [('after', 'done'), ('broken', 'failed')])
+        self.assertEqual(scheduler.running, [])
+
+
+    def test_reported_failures(self):
+        state_dir = tempfile.mkdtemp()
+        try:
+            store = CLEANER.CheckpointStore(os.path.join(state_dir, 'checkpoints.json'))
+            jobs = [job('partial', partial_failure, '/d'), job('clean', Gate(1).strategy, '/e')]
+            for each in jobs:
+                each.progress = CLEANER.JobProgress(store, each.key(), None, interval=0)
+            scheduler = CLEANER.JobScheduler(max_workers=2)
+            self.assertEqual(scheduler.run(jobs), ['partial:/d'])
+            self.assertEqual(sorted((name, status) for name, _, status in scheduler.runtimes),
+                             [('clean', 'done'), ('partial', 'failed')])
+            # a job with failures is not recorded as completed
+            self.assertFalse(store.is_done('partial:/d'))
+            self.assertTrue(store.is_done('clean:/e'))
+        finally:
+            shutil.rmtree(state_dir)
+
+
+class TestThrottle(TestCase):
+    def test_slots_cap_concurrent_calls(self):
+        gate = Gate(3)
+        hdfs = GatedHdfs({'a': {}, 'b': {}, 'c': {}, 'd': {}}, gate)
+        throttled = CLEANER.Throttle(hdfs, threading.BoundedSemaphore(2))
+        executor = ThreadPoolExecutor(max_workers=4)
+        try:
+            futures = [executor.submit(throttled.list_status, '/%s' % name)
+                       for name in 'abcd']
+            for future in futures:
+                self.assertEqual(future.result(), [])
+        finally:
+            executor.shutdown(wait=True)
+        self.assertEqual(gate.peak, 2)
+        self.assertEqual(sorted(throttled.listed), ['/a', '/b', '/c', '/d'])
+
+    def test_exception_releases_slot(self):
+        hdfs = FakeHdfs({})
+        hdfs.unlistable.add('/a')
+        slots = threading.BoundedSemaphore(1)
+        throttled = CLEANER.Throttle(hdfs, slots)
+        self.assertRaises(CLEANER.HdfsException, throttled.list_status, '/a')
+        self.assertTrue(slots.acquire(False))
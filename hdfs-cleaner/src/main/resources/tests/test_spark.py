@@ -0,0 +1,148 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests of the spark application cleanup and of the YARN endpoint discovery
+"""
+from unittest import TestCase
+
+import requests
+
+import endpoint
+from .fakes import FakeHdfs, load_cleaner
+
+CLEANER = load_cleaner()
+
+
+def spark_tree():
+    return {
+        'spark': {
+            'logs': {'application_1_0001': {'log': 1},
+                     'application_1_0002.inprogress': {'log': 1},
+                     'other': {'log': 1}},
+            'checkpoints': {'application_1_0003': {'state': 1}}}}
+
+
+class FakeResponse(object):
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('%d error' % self.status_code)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession(object):
+    """
+    requests stand-in that answers every query with the same response
+    and records which directories were listed when it was queried
+    """
+    def __init__(self, response, hdfs=None):
+        self.response = response
+        self.hdfs = hdfs
+        self.queries = list()
+
+    def get(self, url, **kwargs):
+        listed = list(self.hdfs.listed) if self.hdfs is not None else None
+        self.queries.append((url, kwargs, listed))
+        return self.response
+
+
+class TestCleanupSpark(TestCase):
+    def test_local_apps(self):
+        hdfs = FakeHdfs(spark_tree())
+        apps = CLEANER.LocalApps({'application_1_0002': 'RUNNING',
+                                  'application_1_0003': 'FINISHED'})
+        CLEANER.cleanup_spark(hdfs, apps, ['/spark/logs', '/spark/checkpoints'])
+        self.assertEqual(sorted(hdfs.deleted), ['/spark/checkpoints/application_1_0003',
+                                                '/spark/logs/application_1_0001'])
+        self.assertEqual(sorted(hdfs.node('/spark/logs')),
+                         ['application_1_0002.inprogress', 'other'])
+
+    def test_unlistable_directory(self):
+        hdfs = FakeHdfs(spark_tree())
+        hdfs.unlistable.add('/spark/logs')
+        CLEANER.cleanup_spark(hdfs, CLEANER.LocalApps(), ['/spark/logs', '/spark/checkpoints'])
+        self.assertEqual(hdfs.deleted, ['/spark/checkpoints/application_1_0003'])
+
+    def test_resource_manager(self):
+        hdfs = FakeHdfs(spark_tree())
+        session = FakeSession(FakeResponse({'apps': {'app': [
+            {'id': 'application_1_0001', 'state': 'ACCEPTED'},
+            {'id': 'application_1_0002', 'state': 'RUNNING'}]}}), hdfs)
+        apps = CLEANER.ResourceManagerApps('rm:8088', session)
+        CLEANER.cleanup_spark(hdfs, apps, ['/spark/logs', '/spark/checkpoints'])
+        self.assertEqual(hdfs.deleted, ['/spark/checkpoints/application_1_0003'])
+        self.assertEqual(len(session.queries), 1)
+        url, kwargs, listed = session.queries[0]
+        self.assertEqual(url, 'http://rm:8088/ws/v1/cluster/apps')
+        self.assertEqual(kwargs['params'],
+                         {'states': 'NEW,NEW_SAVING,SUBMITTED,ACCEPTED,RUNNING'})
+        # applications are queried once every spark directory has been listed
+        self.assertEqual(listed, ['/spark/logs', '/spark/checkpoints'])
+
+    def test_no_active_apps(self):
+        hdfs = FakeHdfs(spark_tree())
+        session = FakeSession(FakeResponse({'apps': None}))
+        apps = CLEANER.ResourceManagerApps('http://rm:8088', session)
+        CLEANER.cleanup_spark(hdfs, apps, ['/spark/logs'])
+        self.assertEqual(sorted(hdfs.deleted), ['/spark/logs/application_1_0001',
+                                                '/spark/logs/application_1_0002.inprogress'])
+
+    def test_resource_manager_failure(self):
+        hdfs = FakeHdfs(spark_tree())
+        apps = CLEANER.ResourceManagerApps('rm:8088', FakeSession(FakeResponse({}, 503)))
+        CLEANER.cleanup_spark(hdfs, apps, ['/spark/logs', '/spark/checkpoints'])
+        self.assertEqual(hdfs.deleted, [])
+
+
+class FakeHortonworks(endpoint.Hortonworks):
+    """
+    Hortonworks discovery against canned Ambari responses keyed by service
+    """
+    def __init__(self, components):
+        endpoint.Hortonworks.__init__(self)
+        self.components = components
+
+    def _ambari_request(self, ambari, uri):
+        if uri == '/clusters':
+            return {'items': [{'Clusters': {'cluster_name': 'c1'}}]}
+        return self.components[uri.split('/')[4]]
+
+
+def component(host):
+    return {'host_components': [{'HostRoles': {'host_name': host}}]}
+
+
+class TestDiscovery(TestCase):
+    def test_hortonworks_yarn(self):
+        endpoints = FakeHortonworks({'HDFS': component('nn'), 'HBASE': component('hm'),
+                                     'YARN': component('rm')}).discover(
+                                         {'cm_host': 'ambari', 'cm_user': 'u', 'cm_pass': 'p'})
+        self.assertEqual(endpoints['HDFS'].geturl(), 'nn:14000')
+        self.assertEqual(endpoints['HBASE'].geturl(), 'hm')
+        self.assertEqual(endpoints['YARN'].geturl(), 'rm:8088')
+
+    def test_hortonworks_without_yarn(self):
+        endpoints = FakeHortonworks({'HDFS': component('nn'), 'HBASE': component('hm'),
+                                     'YARN': {'status': 404}}).discover(
+                                         {'cm_host': 'ambari', 'cm_user': 'u', 'cm_pass': 'p'})
+        self.assertEqual(sorted(endpoints), ['HBASE', 'HDFS'])
+
+    def test_local(self):
+        endpoints = endpoint.Platform.factory('Local').discover({})
+        self.assertEqual(endpoints['YARN'].gettype(), 'YARN')
+        self.assertEqual(endpoints['YARN'].geturl(), '192.168.33.10:8088')
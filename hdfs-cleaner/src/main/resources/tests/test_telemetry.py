@@ -0,0 +1,131 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: Tests of the run summary and of the Prometheus textfile
+"""
+import json
+import os
+import shutil
+import tempfile
+from functools import partial
+from unittest import TestCase
+
+from .fakes import FakeHdfs, load_cleaner
+
+CLEANER = load_cleaner()
+AGE = 100
+FRESH = 200 * 1000
+
+
+class FakeMetrics(object):
+    """
+    RequestMetrics stand-in with fixed WebHDFS call counts
+    """
+    def snapshot(self):
+        return {'LISTSTATUS': {'count': 3, 'errors': 1, 'seconds': 0.5}}
+
+
+class TestRunTelemetry(TestCase):
+    def setUp(self):
+        self.telemetry = CLEANER.RunTelemetry()
+        self.previous, CLEANER.TELEMETRY = CLEANER.TELEMETRY, self.telemetry
+        self.summary_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        CLEANER.TELEMETRY = self.previous
+        shutil.rmtree(self.summary_dir)
+
+    def run_job(self, name='ds'):
+        hdfs = FakeHdfs({'d': {'old': {'a': {'f1': 10}, 'f2': 10},
+                               'mixed': {'f3': 10, 'f4': 10}}})
+        hdfs.touch('/d/mixed/f4', FRESH)
+        with self.telemetry.job(name):
+            CLEANER.cleanup_on_age(hdfs, partial(CLEANER.delete, hdfs), '/d', AGE)
+
+    def test_summary(self):
+        self.run_job()
+        summary = self.telemetry.summary(FakeMetrics())
+        job = summary['jobs']['ds']
+        self.assertEqual(job['status'], 'done')
+        self.assertTrue(job['seconds'] >= 0)
+        self.assertEqual(job['counters'], {'directories_listed': 4, 'files_scanned': 4,
+                                           'files_deleted': 1, 'subtrees_deleted': 1,
+                                           'bytes_freed': 30})
+        self.assertEqual(sorted(job['stages']), ['delete', 'empty_dirs', 'walk'])
+        self.assertEqual(job['stages']['delete']['calls'], 2)
+        # one wait per listing and one for the end of the walk
+        self.assertEqual(job['stages']['walk']['calls'], 5)
+        self.assertEqual(summary['totals']['counters'], job['counters'])
+        self.assertEqual(summary['totals']['rpcs'], 3)
+        self.assertEqual(summary['rpcs'], {'LISTSTATUS': {'calls': 3, 'errors': 1,
+                                                          'seconds': 0.5}})
+
+    def test_failed_job(self):
+        def broken():
+            with self.telemetry.job('broken'):
+                self.telemetry.count('files_deleted')
+                raise ValueError('broken')
+        self.assertRaises(ValueError, broken)
+        self.telemetry.count('directories_listed')
+        jobs = self.telemetry.summary()['jobs']
+        self.assertEqual(jobs['broken']['status'], 'failed')
+        self.assertEqual(jobs['broken']['counters'], {'files_deleted': 1})
+        # work outside of a job is accounted to the run
+        self.assertEqual(jobs['run']['counters'], {'directories_listed': 1})
+        self.assertFalse('seconds' in jobs['run'])
+
+    def test_textfile(self):
+        self.run_job()
+        lines = self.telemetry.textfile(self.telemetry.summary(FakeMetrics())).splitlines()
+        self.assertTrue('# TYPE hdfs_cleaner_job_files_deleted gauge' in lines)
+        self.assertTrue('hdfs_cleaner_job_files_deleted{job="ds"} 1' in lines)
+        self.assertTrue('hdfs_cleaner_job_bytes_freed{job="ds"} 30' in lines)
+        self.assertTrue('hdfs_cleaner_job_failed{job="ds"} 0' in lines)
+        self.assertTrue('hdfs_cleaner_job_stage_calls{job="ds",stage="walk"} 5' in lines)
+        self.assertTrue('hdfs_cleaner_webhdfs_requests{op="LISTSTATUS"} 3' in lines)
+        self.assertTrue('hdfs_cleaner_webhdfs_errors{op="LISTSTATUS"} 1' in lines)
+        # every family is declared once, followed by its samples
+        families = list()
+        for line in lines:
+            if line.startswith('# TYPE '):
+                families.append(line.split()[2])
+            else:
+                self.assertEqual(line.split('{')[0].split()[0], families[-1])
+        self.assertEqual(len(families), len(set(families)))
+
+    def test_label_escaping(self):
+        self.assertEqual(CLEANER.escape_label('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+        self.run_job('ds:"x"\\y\n')
+        text = self.telemetry.textfile(self.telemetry.summary())
+        self.assertTrue('hdfs_cleaner_job_files_deleted{job="ds:\\"x\\"\\\\y\\n"} 1\n' in text)
+        self.assertEqual(len(text.splitlines()), text.count('\n'))
+
+    def test_report(self):
+        self.run_job()
+        summary_path = os.path.join(self.summary_dir, 'summary.json')
+        textfile_path = os.path.join(self.summary_dir, 'hdfs_cleaner.prom')
+        summary = self.telemetry.report(FakeMetrics(), summary_path, textfile_path)
+        with open(summary_path) as summary_file:
+            self.assertEqual(json.load(summary_file)['jobs']['ds']['counters'],
+                             summary['jobs']['ds']['counters'])
+        with open(textfile_path) as textfile:
+            self.assertEqual(textfile.read(), self.telemetry.textfile(summary))
+        self.assertEqual(sorted(os.listdir(self.summary_dir)),
+                         ['hdfs_cleaner.prom', 'summary.json'])
+
+    def test_report_write_failure(self):
+        self.run_job()
+        summary_path = os.path.join(self.summary_dir, 'missing', 'summary.json')
+        summary = self.telemetry.report(None, summary_path)
+        self.assertEqual(summary['rpcs'], {})
+        self.assertFalse(os.path.exists(summary_path))
@@ -0,0 +1,155 @@
+"""
+   Copyright (c) 2016 Cisco and/or its affiliates.
+   This software is licensed to you under the terms of the Apache License, Version 2.0
+   (the "License").
+   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+   The code, technical concepts, and all information contained herein, are the property of
+   Cisco Technology, Inc.and/or its affiliated entities, under various laws including copyright,
+   international treaties, patent, and/or contract.
+   Any use of the material herein must be in accordance with the terms of the License.
+   All rights not expressly granted by the License are reserved.
+   Unless required by applicable law or agreed to separately in writing, software distributed
+   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+   ANY KIND, either express or implied.
+   Purpose: WebHDFS client with pooled keep-alive connections and request metrics
+
+   data-service and hdfs-cleaner are packaged and deployed separately, each from its own
+   src/main/resources, so both hold an identical copy of this module. Change both copies
+   together, tests/test_webhdfs.py of data-service checks that they match.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from pyhdfs import HdfsClient
+
+POOL_SIZE = 16
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'DELETE')
+RETRY_STATUSES = (500, 502, 503, 504)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def idempotent_retry(max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Retry policy for idempotent requests failing on read or with a server error.
+    Connection errors are not retried on the same host, the client fails over to the next
+    NameNode instead.
+    """
+    kwargs = dict(total=max_retries, connect=0, read=max_retries, status=max_retries,
+                  backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                  raise_on_status=False)
+    try:
+        return Retry(allowed_methods=frozenset(IDEMPOTENT_METHODS), **kwargs)
+    except TypeError:
+        # urllib3 before 1.26
+        return Retry(method_whitelist=frozenset(IDEMPOTENT_METHODS), **kwargs)
+
+
+def pooled_session(pool_size=POOL_SIZE, max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Session keeping up to pool_size connections per host alive
+    :param pool_size: connections kept per host, should cover concurrent requests
+    :param max_retries: retries of idempotent requests
+    :param backoff_factor: backoff between retries in seconds, doubled on every retry
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=idempotent_retry(max_retries, backoff_factor))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RequestMetrics(object):
+    """
+    Call counts, errors and latency histogram per WebHDFS operation
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.operations = dict()
+
+    def observe(self, operation, seconds, failed=False):
+        """
+        Record a request
+        :param operation: WebHDFS operation, e.g. LISTSTATUS
+        :param seconds: request latency
+        :param failed: whether request raised
+        :return: None
+        """
+        with self.lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = {
+                    'count': 0, 'errors': 0, 'seconds': 0.0,
+                    'buckets': [0] * (len(self.buckets) + 1)}
+            stats['count'] += 1
+            stats['errors'] += 1 if failed else 0
+            stats['seconds'] += seconds
+            stats['buckets'][bisect_left(self.buckets, seconds)] += 1
+
+    def snapshot(self):
+        """
+        Copy of the metrics, bucket counts are cumulative with the upper bound of each bucket
+        :return: dict of operation to count, errors, seconds and list of (bound, count)
+        """
+        with self.lock:
+            snapshot = dict()
+            for operation, stats in self.operations.items():
+                cumulative = list()
+                total = 0
+                for bound, count in zip(self.buckets + (float('inf'),), stats['buckets']):
+                    total += count
+                    cumulative.append((bound, total))
+                snapshot[operation] = {'count': stats['count'], 'errors': stats['errors'],
+                                       'seconds': stats['seconds'], 'buckets': cumulative}
+            return snapshot
+
+    def log_summary(self):
+        """
+        Log calls, errors and mean latency per operation
+        :return: None
+        """
+        for operation, stats in sorted(self.snapshot().items()):
+            logging.info("WebHDFS op:%s calls:%d errors:%d mean latency:%.3fs", operation,
+                         stats['count'], stats['errors'], stats['seconds'] / stats['count'])
+
+
+class PooledHdfsClient(HdfsClient):
+    """
+    HdfsClient sharing one pooled keep-alive session across threads.
+    NameNode failover across the comma separated hosts is done by HdfsClient, idempotent
+    requests are additionally retried with backoff. Every request is recorded in metrics.
+    """
+
+    def __init__(self, hosts, user_name=None, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 metrics=None, **kwargs):
+        """
+        :param hosts: comma separated NameNode or HttpFS host:port list
+        :param user_name: user requests are made as
+        :param pool_size: connections kept per host
+        :param max_retries: retries of idempotent requests
+        :param metrics: RequestMetrics to record into, a new one when None
+        """
+        self.metrics = metrics or RequestMetrics()
+        kwargs.setdefault('requests_session', pooled_session(pool_size, max_retries))
+        super(PooledHdfsClient, self).__init__(hosts=hosts, user_name=user_name, **kwargs)
+
+    def _request(self, method, path, op, *args, **kwargs):
+        started = time.time()
+        failed = True
+        try:
+            response = super(PooledHdfsClient, self)._request(method, path, op, *args, **kwargs)
+            failed = False
+            return response
+        finally:
+            self.metrics.observe(op, time.time() - started, failed)